@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from django.contrib import admin
 
-from .models import Movie, Rating, Tag
+from .models import ImportCheckpoint, Job, Movie, Rating, Tag, TagTerm
 
 
 @admin.register(Movie)
@@ -26,4 +26,39 @@ class RatingAdmin(admin.ModelAdmin):
 class TagAdmin(admin.ModelAdmin):
     list_display = ("id", "movielens_user_id", "movie", "text", "timestamp")
     list_filter = ("timestamp",)
-    raw_id_fields = ("movie",)
+    list_select_related = ("movie", "term")
+    raw_id_fields = ("movie", "term")
+
+
+@admin.register(TagTerm)
+class TagTermAdmin(admin.ModelAdmin):
+    list_display = ("id", "text")
+    search_fields = ("text",)
+
+
+@admin.register(ImportCheckpoint)
+class ImportCheckpointAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "kind",
+        "source",
+        "start_offset",
+        "end_offset",
+        "entries_created",
+        "completed_at",
+    )
+    list_filter = ("kind",)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "command",
+        "status",
+        "worker",
+        "rows_processed",
+        "created_at",
+        "finished_at",
+    )
+    list_filter = ("status", "command")
@@ -0,0 +1,95 @@
+from functools import wraps
+
+from django.http import HttpResponse, HttpResponseNotAllowed
+from rest_framework.exceptions import APIException, NotFound
+from rest_framework.filters import OrderingFilter
+from rest_framework.request import Request
+
+from .models import Movie
+from .pagination import KeysetPagination
+from .renderers import FastJSONRenderer
+from .serializers import MovieRankingSerializer, MovieSerializer, SimilarMovieSerializer
+from .views import (
+    TOP_RATED_ORDERING,
+    MovieViewSet,
+    attach_scores,
+    filter_movies,
+    get_limit,
+    get_ranking_queryset,
+    get_similarity_model,
+)
+
+
+# Async versions of the hot read endpoints. They return the same payloads as
+# their MovieViewSet counterparts, but query through the async ORM so that,
+# under ASGI, a request waiting on the database does not hold a worker. They
+# skip the response cache, every request reads the database.
+
+
+def render(data, status=200):
+    return HttpResponse(
+        FastJSONRenderer().render(data), status=status, content_type="application/json"
+    )
+
+
+def async_api_view(view):
+    """Wrap an async read-only view with DRF's request and error handling."""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return HttpResponseNotAllowed(["GET", "HEAD"])
+        try:
+            return await view(Request(request), *args, **kwargs)
+        except APIException as exc:
+            detail = exc.detail
+            if not isinstance(detail, (list, dict)):
+                detail = {"detail": detail}
+            return render(detail, status=exc.status_code)
+
+    return wrapper
+
+
+async def paginate(request, queryset, serializer_class):
+    paginator = KeysetPagination()
+    page = await paginator.apaginate_queryset(queryset, request)
+    data = serializer_class(page, many=True).data
+    return render(paginator.get_paginated_data(data))
+
+
+@async_api_view
+async def movie_list(request):
+    queryset = filter_movies(MovieViewSet.queryset.all(), request.query_params)
+    # The ?ordering whitelist of MovieViewSet, so both give the same pages.
+    queryset = OrderingFilter().filter_queryset(request, queryset, MovieViewSet())
+    return await paginate(request, queryset, MovieSerializer)
+
+
+@async_api_view
+async def movie_detail(request, movielens_id):
+    try:
+        movie = await MovieViewSet.queryset.aget(pk=movielens_id)
+    except Movie.DoesNotExist:
+        raise NotFound()
+    return render(MovieSerializer(movie).data)
+
+
+@async_api_view
+async def top_rated(request):
+    queryset = get_ranking_queryset(
+        request.query_params, TOP_RATED_ORDERING, default_min_votes=50
+    )
+    return await paginate(request, queryset, MovieRankingSerializer)
+
+
+@async_api_view
+async def similar_movies(request, movielens_id):
+    if not await Movie.objects.filter(pk=movielens_id).aexists():
+        raise NotFound()
+    model = get_similarity_model()
+    scored = model.similar(movielens_id, limit=get_limit(request))
+    movies = await Movie.objects.defer("search_vector").ain_bulk(
+        [movie_id for movie_id, _ in scored]
+    )
+    movies = attach_scores(movies, scored, "similarity")
+    return render(SimilarMovieSerializer(movies, many=True).data)
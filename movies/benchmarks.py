@@ -0,0 +1,274 @@
+import os
+import random
+import subprocess
+import tempfile
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Max
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from .cache import get_cache
+from .middleware import RequestStats
+from .models import GenreChoices, Movie, Rating, Tag
+from .synthetic import SyntheticDataset
+
+
+# Endpoint scenarios. {movie}, {user}, {genre}, {other_genre}, {tag} and
+# {word} are filled in per request from a sample of the database drawn with
+# the seed.
+ENDPOINTS = {
+    "movie_list": "/api/movies/",
+    "movie_list_100": "/api/movies/?limit=100&count=false",
+    "movie_detail": "/api/movies/{movie}/",
+    "filter_genre": "/api/movies/?genre={genre}",
+    "filter_genres_any": "/api/movies/?genre={genre},{other_genre}&match=any",
+    "facets": "/api/movies/facets/",
+    "filter_tag": "/api/movies/?tag={tag}",
+    "search": "/api/movies/?search={word}",
+    "top_rated": "/api/movies/top/?genre={genre}",
+    "most_rated": "/api/movies/most-rated/",
+    "also_rated": "/api/movies/{movie}/also-rated/",
+    "tag_list": "/api/tags/",
+    "user_ratings": "/api/users/{user}/ratings/",
+    "user_tags": "/api/users/{user}/tags/",
+}
+# Streaming the whole catalog takes a while, it runs fewer times.
+EXPORT_ENDPOINTS = {
+    "catalog_export": "/api/movies/export/",
+}
+COMMANDS = ("import_ratings", "import_tags", "export_movies", "export_ratings")
+SCENARIOS = (*ENDPOINTS, *EXPORT_ENDPOINTS, *COMMANDS)
+# Metrics compared between two runs, lower is better for all of them.
+COMPARED_METRICS = ("p50_ms", "p99_ms", "queries_per_request", "seconds")
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Benchmark:
+    """Run the scenarios against the current database in this process.
+
+    Endpoints are requested through the Django test client, with the
+    response cache cleared before every request unless ``warm_cache`` is
+    set, so that the numbers measure the database path. Imports run in a
+    transaction that is rolled back, the database is left as it was.
+    """
+
+    def __init__(
+        self,
+        requests=100,
+        export_requests=3,
+        import_rows=100000,
+        seed=0,
+        warm_cache=False,
+    ):
+        self.requests = requests
+        self.export_requests = export_requests
+        self.import_rows = import_rows
+        self.seed = seed
+        self.warm_cache = warm_cache
+
+    def run(self, scenarios=SCENARIOS):
+        self.counts = {
+            "movies": Movie.objects.count(),
+            "ratings": Rating.objects.count(),
+            "tags": Tag.objects.count(),
+        }
+        self.sample_parameters()
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for name in scenarios:
+                if name in ENDPOINTS:
+                    results[name] = self.run_endpoint(ENDPOINTS[name], self.requests)
+                elif name in EXPORT_ENDPOINTS:
+                    results[name] = self.run_endpoint(
+                        EXPORT_ENDPOINTS[name], self.export_requests
+                    )
+                else:
+                    results[name] = getattr(self, f"run_{name}")()
+        return {
+            "commit": get_commit(),
+            "created_at": timezone.now().isoformat(),
+            "database": self.counts,
+            "options": {
+                "requests": self.requests,
+                "seed": self.seed,
+                "warm_cache": self.warm_cache,
+            },
+            "scenarios": results,
+        }
+
+    def sample_parameters(self):
+        rng = random.Random(self.seed)
+        genres = [g for g in GenreChoices.values if g != "(no genres listed)"]
+        movie_ids = list(Movie.objects.values_list("movielens_id", flat=True))
+        movies = rng.sample(movie_ids, min(len(movie_ids), self.requests))
+        titles = Movie.objects.filter(pk__in=movies).values_list("title", flat=True)
+        max_rating = Rating.objects.aggregate(Max("id"))["id__max"] or 0
+        max_tag = Tag.objects.aggregate(Max("id"))["id__max"] or 0
+        self.parameters = {
+            "movie": movies or [0],
+            "genre": genres,
+            "other_genre": genres,
+            "user": list(
+                Rating.objects.filter(
+                    pk__in=[
+                        rng.randint(1, max(max_rating, 1)) for _ in range(self.requests)
+                    ]
+                ).values_list("movielens_user_id", flat=True)
+            )
+            or [0],
+            "tag": list(
+                Tag.objects.filter(
+                    pk__in=[
+                        rng.randint(1, max(max_tag, 1)) for _ in range(self.requests)
+                    ]
+                ).values_list("term__text", flat=True)
+            )
+            or ["tag"],
+            "word": [
+                word
+                for title in titles
+                for word in title.split()
+                if word.isalpha() and len(word) > 3
+            ]
+            or ["movie"],
+        }
+
+    def get_url(self, rng, template):
+        values = {
+            name: quote(str(rng.choice(choices)))
+            for name, choices in self.parameters.items()
+        }
+        return template.format(**values)
+
+    def run_endpoint(self, template, requests):
+        # Each scenario draws its URLs from its own stream, which does not
+        # depend on the other scenarios run.
+        rng = random.Random(f"{self.seed}:{template}")
+        client = Client()
+        latencies, queries, errors = [], [], 0
+        for _ in range(requests):
+            url = self.get_url(rng, template)
+            if not self.warm_cache:
+                get_cache().clear()
+            stats = RequestStats()
+            start = time.perf_counter()
+            with connection.execute_wrapper(stats):
+                response = client.get(url)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+            latencies.append((time.perf_counter() - start) * 1000)
+            queries.append(len(stats.queries))
+            if response.status_code >= 400:
+                errors += 1
+        total = sum(latencies) / 1000
+        return {
+            "kind": "endpoint",
+            "url": template,
+            "requests": requests,
+            "errors": errors,
+            "p50_ms": percentile(latencies, 0.5),
+            "p90_ms": percentile(latencies, 0.9),
+            "p99_ms": percentile(latencies, 0.99),
+            "max_ms": max(latencies, default=None),
+            "queries_per_request": sum(queries) / len(queries) if queries else None,
+            "throughput": requests / total if total else None,
+        }
+
+    def run_command(self, rows, *args, rollback=False):
+        start = time.perf_counter()
+        with open(os.devnull, "w") as devnull, transaction.atomic():
+            call_command(*args, stdout=devnull)
+            transaction.set_rollback(rollback)
+        seconds = time.perf_counter() - start
+        return {
+            "kind": "command",
+            "command": args[0],
+            "rows": rows,
+            "seconds": seconds,
+            "rows_per_second": rows / seconds if seconds else None,
+        }
+
+    def synthetic_csv(self, directory):
+        # New users above the existing ones, so every row is an insert.
+        max_user = Rating.objects.aggregate(Max("movielens_user_id"))
+        movies = max(self.counts["movies"], 2)
+        dataset = SyntheticDataset(
+            movies=movies,
+            ratings=self.import_rows,
+            tags=self.import_rows // 10,
+            users=max(self.import_rows // 100, -(-self.import_rows // (movies // 2))),
+            seed=self.seed,
+            user_offset=max_user["movielens_user_id__max"] or 0,
+        )
+        dataset.write_csv(directory)
+        return dataset
+
+    def run_import_ratings(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dataset = self.synthetic_csv(directory)
+            path = os.path.join(directory, "ratings.csv")
+            return self.run_command(
+                dataset.ratings, "import_ratings", path, rollback=True
+            )
+
+    def run_import_tags(self):
+        with tempfile.TemporaryDirectory() as directory:
+            dataset = self.synthetic_csv(directory)
+            path = os.path.join(directory, "tags.csv")
+            return self.run_command(dataset.tags, "import_tags", path, rollback=True)
+
+    def run_export_movies(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "movies.csv")
+            args = ["--include", "genres", "--include", "tags"]
+            return self.run_command(
+                self.counts["movies"], "export_movies", "-o", path, *args
+            )
+
+    def run_export_ratings(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ratings.csv")
+            return self.run_command(
+                self.counts["ratings"],
+                "export_movies",
+                "--dataset",
+                "ratings",
+                "-o",
+                path,
+            )
+
+
+def compare(report, baseline):
+    """Yield ``(scenario, metric, before, after)`` for the shared scenarios."""
+    for name, result in report["scenarios"].items():
+        previous = baseline["scenarios"].get(name)
+        if previous is None:
+            continue
+        for metric in COMPARED_METRICS:
+            if result.get(metric) is not None and previous.get(metric) is not None:
+                yield name, metric, previous[metric], result[metric]
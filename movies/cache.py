@@ -0,0 +1,142 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+
+# Every cached response key embeds version stamps, so invalidating means
+# bumping a stamp: stale entries are never read again and age out through
+# the backend's TTL and LRU eviction. Bulk loads bump the epoch, which is part
+# of every key, a single movie write bumps that movie and the list stamp.
+#
+# These stamps only cover cached responses. Writes that add, rename or delete
+# movies also reload the in-process catalog with catalog.invalidate(), which
+# single-movie writes get from the Movie signals, see movies/signals.py.
+EPOCH_KEY = "movies:epoch"
+# The in-process movie catalog, see movies/catalog.py.
+CATALOG_VERSION_KEY = "movies:catalog-version"
+LIST_VERSION_KEY = "movies:list-version"
+MOVIE_VERSION_KEY = "movies:movie-version:{}"
+STATS_KEY = "movies:stats:{}"
+STATS = ("hits", "misses", "not_modified")
+
+
+def get_cache():
+    return caches[settings.MOVIES_CACHE_ALIAS]
+
+
+def new_version():
+    # Time based rather than a counter, so a stamp evicted from the cache
+    # never comes back with a value that old entries were keyed on.
+    return time.time_ns()
+
+
+def get_versions(*keys):
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    missing = {key: new_version() for key in keys if key not in versions}
+    if missing:
+        for key, version in missing.items():
+            cache.add(key, version, timeout=None)
+        versions.update(cache.get_many(list(missing)))
+    return [versions.get(key, missing.get(key)) for key in keys]
+
+
+def bump(*keys):
+    version = new_version()
+    get_cache().set_many({key: version for key in keys}, timeout=None)
+
+
+def invalidate_movies(*movie_ids):
+    keys = [LIST_VERSION_KEY, *(MOVIE_VERSION_KEY.format(pk) for pk in movie_ids)]
+    # Bump now so the rest of this request reads fresh data, and again on
+    # commit in case a concurrent reader cached the pre-commit state.
+    bump(*keys)
+    transaction.on_commit(lambda: bump(*keys))
+
+
+def invalidate_all_movies():
+    """Invalidate every cached movie response, after a bulk write."""
+    bump(EPOCH_KEY)
+
+
+def list_cache_key(request):
+    epoch, list_version = get_versions(EPOCH_KEY, LIST_VERSION_KEY)
+    return response_cache_key(request, f"list:{epoch}:{list_version}")
+
+
+def movie_cache_key(request, movie_id):
+    epoch, movie_version = get_versions(EPOCH_KEY, MOVIE_VERSION_KEY.format(movie_id))
+    return response_cache_key(request, f"movie:{movie_id}:{epoch}:{movie_version}")
+
+
+def export_cache_key(request):
+    epoch, list_version = get_versions(EPOCH_KEY, LIST_VERSION_KEY)
+    return response_cache_key(request, f"export:{epoch}:{list_version}")
+
+
+def response_cache_key(request, prefix):
+    # Links in the payload are absolute and the body depends on the
+    # negotiated renderer, so both are part of the key.
+    variant = "|".join(
+        [request.get_host(), request.get_full_path(), request.accepted_renderer.format]
+    )
+    digest = hashlib.md5(variant.encode("utf-8")).hexdigest()
+    return f"movies:response:{prefix}:{digest}"
+
+
+def record(stat):
+    cache = get_cache()
+    key = STATS_KEY.format(stat)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def get_stats():
+    cache = get_cache()
+    values = cache.get_many([STATS_KEY.format(stat) for stat in STATS])
+    return {stat: values.get(STATS_KEY.format(stat), 0) for stat in STATS}
+
+
+def get_etag(key):
+    return f'"{hashlib.md5(key.encode("utf-8")).hexdigest()}"'
+
+
+def is_not_modified(request, etag):
+    if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+        record("not_modified")
+        return True
+    return False
+
+
+def cached_response(request, key, get_response):
+    """Serve ``get_response()`` through the response cache.
+
+    The ETag is derived from the key alone, so a matching If-None-Match is
+    answered with a 304 before the cache or the database is touched.
+    """
+    etag = get_etag(key)
+    if is_not_modified(request, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    cache = get_cache()
+    data = cache.get(key)
+    if data is not None:
+        record("hits")
+        response = Response(data)
+    else:
+        record("misses")
+        response = get_response()
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, timeout=settings.MOVIES_CACHE_TIMEOUT)
+    if response.status_code == status.HTTP_200_OK:
+        response["ETag"] = etag
+    return response
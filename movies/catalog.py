@@ -0,0 +1,113 @@
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import transaction
+from psycopg2 import errorcodes
+
+from . import cache
+from .models import Movie
+
+
+# Each process holds the movie IDs and titles, so checking that a movie
+# exists costs a read of the catalog version from the cache instead of a
+# query. Writes to the catalog bump the version, which the processes that
+# share the cache backend see on their next read. With a per-process backend
+# such as LocMemCache the other processes only reload once their copy is
+# CATALOG_MAX_AGE seconds old, and a movie deleted meanwhile is caught by its
+# foreign keys, see is_missing_movie().
+_catalog = None
+
+
+class Catalog:
+    """An immutable snapshot of the movie IDs and titles.
+
+    The IDs are kept in a sorted array with the titles in the same order,
+    and in a frozenset for the membership tests that the import loaders run
+    on every row.
+    """
+
+    def __init__(self, version, rows):
+        rows = sorted(rows)
+        self.version = version
+        self.loaded_at = time.monotonic()
+        self.movie_ids = array("q", [movie_id for movie_id, _ in rows])
+        self.titles = [title for _, title in rows]
+        self.ids = frozenset(self.movie_ids)
+
+    def __contains__(self, movie_id):
+        return movie_id in self.ids
+
+    def __len__(self):
+        return len(self.movie_ids)
+
+    def get_title(self, movie_id):
+        index = bisect_left(self.movie_ids, movie_id)
+        if index < len(self.movie_ids) and self.movie_ids[index] == movie_id:
+            return self.titles[index]
+        return None
+
+
+def load(version):
+    global _catalog
+    _catalog = Catalog(
+        version, Movie.objects.order_by().values_list("movielens_id", "title")
+    )
+    return _catalog
+
+
+def get_catalog():
+    """Return the catalog, reloaded if its version moved or it is too old."""
+    (version,) = cache.get_versions(cache.CATALOG_VERSION_KEY)
+    catalog = _catalog
+    if (
+        catalog is None
+        or catalog.version != version
+        or time.monotonic() - catalog.loaded_at > settings.CATALOG_MAX_AGE
+    ):
+        catalog = load(version)
+    return catalog
+
+
+def movie_exists(movie_id):
+    return bool(existing_movie_ids([movie_id]))
+
+
+def existing_movie_ids(movie_ids):
+    """Return the given movie IDs that exist.
+
+    IDs missing from the catalog are looked up in the database, and the
+    catalog is reloaded if any of them turns up, so that a movie created
+    without a version bump is not refused.
+    """
+    catalog = get_catalog()
+    movie_ids = set(movie_ids)
+    existing = movie_ids & catalog.ids
+    missing = movie_ids - existing
+    if missing:
+        found = set(Movie.objects.filter(pk__in=missing).values_list("pk", flat=True))
+        if found:
+            load(catalog.version)
+            existing |= found
+    return existing
+
+
+def invalidate():
+    """Reload the catalog, after movies were added, renamed or deleted.
+
+    Cached responses are invalidated separately, through movies/cache.py.
+    """
+    # Like invalidate_movies(), bump again on commit in case a concurrent
+    # reader loaded the pre-commit state under the new version.
+    cache.bump(cache.CATALOG_VERSION_KEY)
+    transaction.on_commit(lambda: cache.bump(cache.CATALOG_VERSION_KEY))
+
+
+def is_missing_movie(exc):
+    """Whether an IntegrityError is a foreign key to a movie that is gone.
+
+    A movie deleted in another process can still be in the catalog until it
+    reloads. Writes that trusted it fail on their foreign key instead.
+    """
+    return getattr(exc.__cause__, "pgcode", None) == errorcodes.FOREIGN_KEY_VIOLATION
@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.db import connection, transaction
+
+
+# Serializes the folds, the pair counting below relies on a single folder.
+FOLD_LOCK_ID = 784512001
+
+# Counts a new rating (user, movie) against every other movie the user has
+# rated. A pair where both ratings are still in the log is counted once, by
+# the later event, so ratings folded in the same batch or in later batches
+# are never counted twice. Both directions of each pair are upserted.
+#
+# The batch is read in the same statement, and so from the same snapshot, as
+# the ratings. A rating and its event commit together: an event committed
+# with a lower ID than one in the batch is either visible, and then in the
+# batch too, or its rating is not visible either and it counts the pair
+# itself when it is folded.
+FOLD_SQL = """
+    WITH batch AS (
+        SELECT id, movielens_user_id, movie_id
+        FROM movies_ratingevent
+        ORDER BY id
+        LIMIT %(batch_size)s
+    ), pairs AS (
+        SELECT batch.movie_id, rating.movie_id AS other_id
+        FROM batch
+        JOIN movies_rating AS rating
+            ON rating.movielens_user_id = batch.movielens_user_id
+            AND rating.movie_id <> batch.movie_id
+        LEFT JOIN movies_ratingevent AS pending
+            ON pending.movielens_user_id = rating.movielens_user_id
+            AND pending.movie_id = rating.movie_id
+        WHERE pending.id IS NULL OR pending.id < batch.id
+    ), deltas AS (
+        SELECT movie_id, other_id, COUNT(*) AS count
+        FROM (
+            SELECT movie_id, other_id FROM pairs
+            UNION ALL
+            SELECT other_id, movie_id FROM pairs
+        ) AS both_directions
+        GROUP BY movie_id, other_id
+    ), upserted AS (
+        INSERT INTO movies_moviecooccurrence (movie_id, other_id, count)
+        SELECT movie_id, other_id, count FROM deltas
+        ORDER BY movie_id, other_id
+        ON CONFLICT (movie_id, other_id)
+        DO UPDATE SET count = movies_moviecooccurrence.count + EXCLUDED.count
+        RETURNING movie_id
+    )
+    SELECT
+        ARRAY(SELECT id FROM batch),
+        ARRAY(SELECT DISTINCT movie_id FROM upserted)
+"""
+
+PRUNE_SQL = """
+    DELETE FROM movies_moviecooccurrence
+    WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY movie_id ORDER BY count DESC, other_id
+            ) AS position
+            FROM movies_moviecooccurrence
+            WHERE movie_id = ANY(%(movie_ids)s)
+        ) AS ranked
+        WHERE position > %(keep)s
+    )
+"""
+
+REBUILD_SQL = """
+    INSERT INTO movies_moviecooccurrence (movie_id, other_id, count)
+    SELECT movie_id, other_id, count FROM (
+        SELECT a.movie_id, b.movie_id AS other_id, COUNT(*) AS count,
+            ROW_NUMBER() OVER (
+                PARTITION BY a.movie_id ORDER BY COUNT(*) DESC, b.movie_id
+            ) AS position
+        FROM movies_rating AS a
+        JOIN movies_rating AS b
+            ON b.movielens_user_id = a.movielens_user_id
+            AND b.movie_id <> a.movie_id
+        GROUP BY a.movie_id, b.movie_id
+    ) AS ranked
+    WHERE position <= %(keep)s
+"""
+
+
+def get_keep():
+    # Movies just outside the top K are kept as well, so that a pair climbing
+    # into the top K usually still has its full count.
+    return settings.COOCCURRENCE_TOP_K + settings.COOCCURRENCE_SLACK
+
+
+def fold_events(batch_size=10000):
+    """Fold the oldest ``batch_size`` rating events into the co-occurrences.
+
+    Only the rows of the movies the new ratings pair with are updated and
+    pruned. Returns the number of events folded and of movies touched.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [FOLD_LOCK_ID])
+        cursor.execute(FOLD_SQL, {"batch_size": batch_size})
+        event_ids, movie_ids = cursor.fetchone()
+        if not event_ids:
+            return 0, 0
+        if movie_ids:
+            cursor.execute(PRUNE_SQL, {"movie_ids": movie_ids, "keep": get_keep()})
+        # Delete by ID: an event with a lower ID committed after the batch was
+        # read has not been folded yet.
+        cursor.execute("DELETE FROM movies_ratingevent WHERE id = ANY(%s)", [event_ids])
+    return len(event_ids), len(movie_ids)
+
+
+def rebuild():
+    """Recompute the co-occurrences from the whole Rating table.
+
+    Rating writes wait for the rebuild, which clears the event log.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", [FOLD_LOCK_ID])
+        cursor.execute("LOCK TABLE movies_ratingevent IN SHARE ROW EXCLUSIVE MODE")
+        cursor.execute("DELETE FROM movies_ratingevent")
+        cursor.execute("DELETE FROM movies_moviecooccurrence")
+        cursor.execute(REBUILD_SQL, {"keep": get_keep()})
+        return cursor.rowcount
@@ -0,0 +1,198 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.db.models import Q, Value
+
+from .jobs import report_progress
+from .models import Movie, Rating, Tag
+
+
+DATASETS = ("movies", "ratings", "tags")
+MOVIE_EXTRAS = ("genres", "tags", "aggregates")
+FORMATS = ("csv", "ndjson", "parquet")
+CHUNK_SIZE = 5000
+
+# Column types, used for the Parquet schema.
+COLUMN_TYPES = {
+    "movieId": "int64",
+    "userId": "int64",
+    "title": "string",
+    "genres": "list",
+    "tags": "list",
+    "rating_count": "int64",
+    "average_rating": "float64",
+    "link": "string",
+    "rating": "float64",
+    "tag": "string",
+    "timestamp": "int64",
+}
+
+
+class Export:
+    """The columns of a dataset and a generator over its rows.
+
+    Rows are read through a server-side cursor ``chunk_size`` at a time, so
+    exporting a table never holds more than one chunk in memory.
+    """
+
+    def __init__(self, columns, queryset, convert, chunk_size=CHUNK_SIZE):
+        self.columns = columns
+        self.queryset = queryset
+        self.convert = convert
+        self.chunk_size = chunk_size
+        self.rows_written = 0
+
+    def __iter__(self):
+        for row in self.queryset.iterator(chunk_size=self.chunk_size):
+            self.rows_written += 1
+            if self.rows_written % self.chunk_size == 0:
+                report_progress(self.rows_written)
+            yield self.convert(row)
+        report_progress(self.rows_written)
+
+    def chunks(self):
+        rows = iter(self)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+
+def movie_export(include=(), chunk_size=CHUNK_SIZE):
+    """Movies with their link and, optionally, genres, tags and aggregates.
+
+    Tags are aggregated in the same grouped query, and the rating
+    aggregates come from the denormalized columns on Movie.
+    """
+    columns = ["movieId", "title"]
+    fields = ["movielens_id", "title"]
+    queryset = Movie.objects.order_by("movielens_id")
+    if "genres" in include:
+        columns.append("genres")
+        fields.append("genres")
+    if "tags" in include:
+        queryset = queryset.annotate(
+            tag_list=ArrayAgg(
+                "tag_counts__term__text",
+                filter=Q(tag_counts__isnull=False),
+                ordering="tag_counts__term__text",
+                default=Value([]),
+            )
+        )
+        columns.append("tags")
+        fields.append("tag_list")
+    if "aggregates" in include:
+        columns.extend(["rating_count", "average_rating"])
+        fields.extend(["rating_count", "rating_sum"])
+    columns.append("link")
+
+    def convert(row):
+        row = list(row)
+        if "aggregates" in include:
+            count, total = row[-2:]
+            row[-1] = round(total / count, 4) if count else None
+        row.append(f"https://movielens.org/movies/{row[0]}")
+        return row
+
+    return Export(columns, queryset.values_list(*fields), convert, chunk_size)
+
+
+def rating_export(chunk_size=CHUNK_SIZE):
+    """Ratings in the MovieLens CSV layout, which import_ratings reads back."""
+    queryset = Rating.objects.order_by().values_list(
+        "movielens_user_id", "movie_id", "rating", "timestamp"
+    )
+
+    def convert(row):
+        user, movie, rating, timestamp = row
+        return user, movie, rating, int(timestamp.timestamp())
+
+    return Export(
+        ["userId", "movieId", "rating", "timestamp"], queryset, convert, chunk_size
+    )
+
+
+def tag_export(chunk_size=CHUNK_SIZE):
+    """Tags in the MovieLens CSV layout, which import_tags reads back."""
+    queryset = Tag.objects.order_by().values_list(
+        "movielens_user_id", "movie_id", "term__text", "timestamp"
+    )
+
+    def convert(row):
+        user, movie, text, timestamp = row
+        return user, movie, text, int(timestamp.timestamp())
+
+    return Export(
+        ["userId", "movieId", "tag", "timestamp"], queryset, convert, chunk_size
+    )
+
+
+def get_export(dataset, include=(), chunk_size=CHUNK_SIZE):
+    if dataset == "movies":
+        return movie_export(include, chunk_size)
+    if dataset == "ratings":
+        return rating_export(chunk_size)
+    if dataset == "tags":
+        return tag_export(chunk_size)
+    raise ValueError(f"Unknown dataset {dataset!r}")
+
+
+def csv_value(value):
+    if isinstance(value, list):
+        return "|".join(value)
+    return value
+
+
+def csv_chunks(export):
+    """Yield the export as CSV text, one string per chunk of rows."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export.columns)
+    for chunk in export.chunks():
+        writer.writerows([csv_value(value) for value in row] for row in chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Only the header is left when the export is empty.
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(export):
+    """Yield the export as newline-delimited JSON, one string per chunk."""
+    columns = export.columns
+    for chunk in export.chunks():
+        yield "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in chunk)
+
+
+TEXT_CHUNKS = {"csv": csv_chunks, "ndjson": ndjson_chunks}
+
+
+def write_parquet(export, path, compression="snappy"):
+    """Write the export to a Parquet file, one row group per chunk.
+
+    Needs pyarrow, which is an optional dependency.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {
+        "int64": pa.int64(),
+        "float64": pa.float64(),
+        "string": pa.string(),
+        "list": pa.list_(pa.string()),
+    }
+    schema = pa.schema(
+        [(column, types[COLUMN_TYPES[column]]) for column in export.columns]
+    )
+    with pq.ParquetWriter(path, schema, compression=compression) as writer:
+        for chunk in export.chunks():
+            writer.write_table(
+                pa.Table.from_pylist(
+                    [dict(zip(export.columns, row)) for row in chunk], schema=schema
+                )
+            )
@@ -0,0 +1,186 @@
+import logging
+import os
+import socket
+import time
+import traceback
+from contextvars import ContextVar
+from io import StringIO
+
+from django.core.management import call_command, load_command_class
+from django.core.management.base import CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.utils import timezone
+
+from .models import Job, JobStatus
+
+
+logger = logging.getLogger(__name__)
+
+# Commands that can be queued through the API, run with the arguments they
+# take on the command line. fold_cooccurrence polls forever and runs as its
+# own process instead.
+COMMANDS = (
+    "import_movies",
+    "import_ratings",
+    "import_tags",
+    "export_movies",
+    "refresh_rating_aggregates",
+    "refresh_tag_counts",
+    "refresh_rankings",
+    "build_similarity_model",
+)
+# Progress is written at most once per interval, in seconds.
+PROGRESS_INTERVAL = 1.0
+# Keeps the advisory locks of the jobs apart from any other ones.
+LOCK_NAMESPACE = 0x6A6F62
+# The end of the output is kept, where the commands print their summary.
+MAX_OUTPUT = 10000
+
+_reporter = ContextVar("job_reporter", default=None)
+
+
+def report_progress(rows_processed, progress=None):
+    """Record the progress of the running job, if there is one.
+
+    Loaders and exports call this as they go. ``progress`` is the fraction
+    done, when the caller knows it. Outside of a job it does nothing.
+    """
+    reporter = _reporter.get()
+    if reporter is not None:
+        reporter.report(rows_processed, progress)
+
+
+def validate_arguments(command, arguments):
+    """Parse the arguments like ``manage.py`` would, raising CommandError."""
+    if command not in COMMANDS:
+        raise CommandError(f"Must be one of {', '.join(COMMANDS)}.")
+    parser = load_command_class("movies", command).create_parser("manage.py", command)
+    try:
+        parser.parse_args(arguments)
+    except SystemExit:
+        # --help and --version print and exit.
+        raise CommandError("Informational options cannot be queued.")
+
+
+def get_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobReporter:
+    """Write the progress of a job on a database connection of its own.
+
+    The commands commit their own transactions, which must not hold back
+    the progress the API polls. The connection also holds an advisory lock
+    on the job while it runs. The lock is released when the worker dies, so
+    other workers can tell that the job was abandoned.
+    """
+
+    def __init__(self, job):
+        self.job_id = job.pk
+        self.connection = connections.create_connection(DEFAULT_DB_ALIAS)
+        self.last_report = None
+        self.rows_processed = 0
+        self.progress = None
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_advisory_lock(%s, %s)", [LOCK_NAMESPACE, self.job_id]
+            )
+
+    def report(self, rows_processed, progress=None):
+        # The latest values are saved with the outcome of the job, whether
+        # or not they were written here.
+        self.rows_processed = rows_processed
+        self.progress = progress
+        now = time.monotonic()
+        if self.last_report is not None and now - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "UPDATE movies_job SET rows_processed = %s, progress = %s "
+                "WHERE id = %s",
+                [rows_processed, progress, self.job_id],
+            )
+
+    def close(self):
+        # Closing the session releases the advisory lock.
+        self.connection.close()
+
+
+def claim_job(worker):
+    """Mark the oldest queued job as running.
+
+    Return the job and the reporter holding its lock, or ``(None, None)``
+    when the queue is empty.
+
+    SKIP LOCKED passes over the jobs other workers are claiming, so any
+    number of workers can drain the queue without waiting on each other.
+    The advisory lock is taken before the claim commits, a running job
+    without its lock has been abandoned.
+    """
+    with transaction.atomic():
+        job = (
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=JobStatus.QUEUED)
+            .order_by("created_at", "id")
+            .first()
+        )
+        if job is None:
+            return None, None
+        reporter = JobReporter(job)
+        job.status = JobStatus.RUNNING
+        job.worker = worker
+        job.started_at = timezone.now()
+        job.save(update_fields=["status", "worker", "started_at"])
+    return job, reporter
+
+
+def run_job(job, reporter):
+    """Run a claimed job and record how it ended."""
+    output = StringIO()
+    token = _reporter.set(reporter)
+    try:
+        call_command(job.command, *job.arguments, stdout=output, stderr=output)
+    except Exception:
+        logger.exception(f"Job {job.pk} failed.")
+        job.status = JobStatus.FAILED
+        job.error = traceback.format_exc()
+    else:
+        job.status = JobStatus.SUCCEEDED
+    finally:
+        _reporter.reset(token)
+        reporter.close()
+    job.rows_processed = reporter.rows_processed
+    job.progress = reporter.progress
+    if job.status == JobStatus.SUCCEEDED and job.progress is not None:
+        job.progress = 1.0
+    job.output = output.getvalue()[-MAX_OUTPUT:]
+    job.finished_at = timezone.now()
+    job.save()
+    return job
+
+
+def fail_abandoned_jobs():
+    """Fail the running jobs whose worker stopped, return how many."""
+    failed = 0
+    running = Job.objects.filter(status=JobStatus.RUNNING).values_list("pk", flat=True)
+    for job_id in running:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT pg_try_advisory_lock(%s, %s)", [LOCK_NAMESPACE, job_id]
+            )
+            if not cursor.fetchone()[0]:
+                continue
+            try:
+                failed += Job.objects.filter(
+                    pk=job_id, status=JobStatus.RUNNING
+                ).update(
+                    status=JobStatus.FAILED,
+                    error="The worker stopped while the job was running.",
+                    finished_at=timezone.now(),
+                )
+            finally:
+                cursor.execute(
+                    "SELECT pg_advisory_unlock(%s, %s)", [LOCK_NAMESPACE, job_id]
+                )
+    return failed
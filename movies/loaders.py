@@ -0,0 +1,506 @@
+import argparse
+import csv
+import io
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+
+import django
+from django.apps import apps
+from django.db import connection, connections, transaction
+
+from .catalog import get_catalog
+from .jobs import report_progress
+from .models import ImportCheckpoint, TagTerm
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+SESSION_SETTING_NAME = re.compile(r"[a-z_]+(\.[a-z_]+)?")
+
+
+class CopyStream:
+    """File-like object that feeds ``COPY ... FROM STDIN`` from an iterator.
+
+    Rows are serialized lazily as psycopg2 asks for data, so only one read
+    buffer is held in memory however many rows go through the stream.
+    """
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.count = 0
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+
+    def read(self, size=-1):
+        for row in self.rows:
+            self._writer.writerow(row)
+            self.count += 1
+            if 0 <= size <= self._buffer.tell():
+                break
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+def read_header(csv_file_path):
+    with open(csv_file_path, "rb") as csvfile:
+        header = csvfile.readline()
+        return next(csv.reader([header.decode("utf-8")])), len(header)
+
+
+def read_lines(csvfile, start, end):
+    """Yield the decoded lines of a binary file between two byte offsets."""
+    csvfile.seek(start)
+    position = start
+    while position < end:
+        line = csvfile.readline()
+        if not line:
+            break
+        position += len(line)
+        yield line.decode("utf-8")
+
+
+def chunk_offsets(csv_file_path, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Split a CSV file into ``(start, end)`` byte ranges on line boundaries.
+
+    The header line is left out of the first range. Offsets only depend on
+    the file and the chunk size, so a resumed import sees the same chunks
+    whatever the number of workers.
+    """
+    size = os.path.getsize(csv_file_path)
+    _, start = read_header(csv_file_path)
+    offsets = []
+    with open(csv_file_path, "rb") as csvfile:
+        while start < size:
+            if start + chunk_size >= size:
+                end = size
+            else:
+                csvfile.seek(start + chunk_size)
+                csvfile.readline()
+                end = csvfile.tell()
+            offsets.append((start, end))
+            start = end
+    return offsets
+
+
+def session_setting(value):
+    """Parse a ``NAME=VALUE`` Postgres setting given on the command line."""
+    name, separator, setting = value.partition("=")
+    name = name.strip().lower()
+    if not separator or not SESSION_SETTING_NAME.fullmatch(name):
+        raise argparse.ArgumentTypeError(
+            f"Expected NAME=VALUE, such as synchronous_commit=off, got {value!r}."
+        )
+    return name, setting.strip()
+
+
+class CopyLoader:
+    """Stream CSV rows into a staging table with COPY and merge them.
+
+    Subclasses describe the staging table, how a CSV row maps to a staging
+    row and the statement that merges the staging table into the real one.
+    The merge statement must return the number of rows it created.
+    """
+
+    kind = None
+    staging_table = None
+    staging_columns = None
+    merge_sql = None
+    batch_size = 1000000
+
+    def __init__(self, movie_ids=None, batch_size=None, session_settings=None):
+        if movie_ids is None:
+            movie_ids = get_catalog().ids
+        self.movie_ids = movie_ids
+        if batch_size:
+            self.batch_size = batch_size
+        # Postgres settings for the loading session, e.g. synchronous_commit
+        # or work_mem, reset once the load is done.
+        self.session_settings = dict(session_settings or {})
+        self.rows_processed = 0
+        self.rows_skipped = 0
+        self.entries_created = 0
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows_processed / self.elapsed if self.elapsed else 0.0
+
+    def convert(self, row, columns):
+        """Return the staging tuple for a CSV row, or None to skip it."""
+        raise NotImplementedError
+
+    def read_rows(self, lines, header):
+        columns = {name: index for index, name in enumerate(header)}
+        for row in csv.reader(lines):
+            self.rows_processed += 1
+            staged = self.convert(row, columns)
+            if staged is None:
+                self.rows_skipped += 1
+                continue
+            yield staged
+
+    def load_file(self, csv_file_path):
+        _, start = read_header(csv_file_path)
+        return self.load_chunk(csv_file_path, start, os.path.getsize(csv_file_path))
+
+    def load_chunk(self, csv_file_path, start, end):
+        header, _ = read_header(csv_file_path)
+        with open(csv_file_path, "rb") as csvfile:
+            lines = read_lines(csvfile, start, end)
+            return self.load(self.read_rows(lines, header))
+
+    def load(self, rows):
+        start_time = time.monotonic()
+        rows = iter(rows)
+        with connection.cursor() as cursor:
+            for name, value in self.session_settings.items():
+                cursor.execute("SELECT set_config(%s, %s, false)", [name, value])
+            cursor.execute(
+                f"CREATE TEMP TABLE IF NOT EXISTS {self.staging_table} "
+                f"({', '.join(self.staging_columns)})"
+            )
+        try:
+            self.load_batches(rows, start_time)
+        finally:
+            # Persistent connections outlive the load, restore the defaults.
+            if self.session_settings:
+                with connection.cursor() as cursor:
+                    for name in self.session_settings:
+                        cursor.execute(f"RESET {name}")
+        self.elapsed = time.monotonic() - start_time
+        return self.entries_created
+
+    def load_batches(self, rows, start_time):
+        while True:
+            stream = CopyStream(islice(rows, self.batch_size))
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {self.staging_table} FROM STDIN WITH (FORMAT csv)",
+                    stream,
+                )
+                if not stream.count:
+                    break
+                self.entries_created += self.merge(cursor)
+                cursor.execute(f"TRUNCATE {self.staging_table}")
+            self.elapsed = time.monotonic() - start_time
+            logger.info(
+                f"Processed {self.rows_processed} rows "
+                f"({self.rows_per_second:.0f} rows/sec)."
+            )
+
+    def merge(self, cursor):
+        cursor.execute(self.get_merge_sql())
+        return cursor.fetchone()[0]
+
+    def get_merge_sql(self):
+        return self.merge_sql
+
+
+class RatingLoader(CopyLoader):
+    kind = "ratings"
+    staging_table = "movies_rating_staging"
+    staging_columns = [
+        "movielens_user_id integer",
+        "movie_id bigint",
+        "rating double precision",
+        "epoch bigint",
+    ]
+    merge_sql = """
+        WITH inserted AS (
+            INSERT INTO movies_rating (movielens_user_id, movie_id, rating, timestamp)
+            SELECT movielens_user_id, movie_id, rating, to_timestamp(epoch)
+            FROM movies_rating_staging
+            ON CONFLICT (movielens_user_id, movie_id) DO NOTHING
+            RETURNING movielens_user_id, movie_id, rating
+        ), logged AS (
+            INSERT INTO movies_ratingevent (movielens_user_id, movie_id, created_at)
+            SELECT movielens_user_id, movie_id, now() FROM inserted
+        )
+        SELECT COUNT(*) FROM inserted
+    """
+    # Insert the new ratings and fold them into the denormalized aggregates
+    # on Movie in the same statement. Both statements append the new ratings
+    # to the event log read by fold_cooccurrence.
+    merge_with_aggregates_sql = """
+        WITH inserted AS (
+            INSERT INTO movies_rating (movielens_user_id, movie_id, rating, timestamp)
+            SELECT movielens_user_id, movie_id, rating, to_timestamp(epoch)
+            FROM movies_rating_staging
+            ON CONFLICT (movielens_user_id, movie_id) DO NOTHING
+            RETURNING movielens_user_id, movie_id, rating
+        ), logged AS (
+            INSERT INTO movies_ratingevent (movielens_user_id, movie_id, created_at)
+            SELECT movielens_user_id, movie_id, now() FROM inserted
+        ), totals AS (
+            SELECT movie_id, COUNT(*) AS rating_count, SUM(rating) AS rating_sum
+            FROM inserted
+            GROUP BY movie_id
+        ), updated AS (
+            UPDATE movies_movie AS m
+            SET rating_count = m.rating_count + totals.rating_count,
+                rating_sum = m.rating_sum + totals.rating_sum
+            FROM totals
+            WHERE m.movielens_id = totals.movie_id
+            RETURNING totals.rating_count
+        )
+        SELECT COALESCE(SUM(rating_count), 0) FROM updated
+    """
+
+    def __init__(
+        self,
+        movie_ids=None,
+        batch_size=None,
+        session_settings=None,
+        update_aggregates=True,
+    ):
+        super().__init__(
+            movie_ids=movie_ids,
+            batch_size=batch_size,
+            session_settings=session_settings,
+        )
+        # Concurrent workers would lock Movie rows in arbitrary order, so
+        # parallel imports skip this and rebuild the aggregates at the end.
+        self.update_aggregates = update_aggregates
+
+    def get_merge_sql(self):
+        if self.update_aggregates:
+            return self.merge_with_aggregates_sql
+        return self.merge_sql
+
+    def convert(self, row, columns):
+        movie_id = int(row[columns["movieId"]])
+        if movie_id not in self.movie_ids:
+            return None
+        return (
+            row[columns["userId"]],
+            movie_id,
+            row[columns["rating"]],
+            row[columns["timestamp"]],
+        )
+
+
+class TagLoader(CopyLoader):
+    kind = "tags"
+    staging_table = "movies_tag_staging"
+    staging_columns = [
+        "movielens_user_id integer",
+        "movie_id bigint",
+        "text varchar(255)",
+        "epoch bigint",
+    ]
+    # Runs in its own statement before the merge, whose snapshot then sees
+    # the terms that concurrent workers inserted meanwhile.
+    terms_sql = """
+        INSERT INTO movies_tagterm (text)
+        SELECT DISTINCT text FROM movies_tag_staging
+        ORDER BY text
+        ON CONFLICT (text) DO NOTHING
+    """
+    merge_sql = """
+        WITH inserted AS (
+            INSERT INTO movies_tag (movielens_user_id, movie_id, term_id, timestamp)
+            SELECT staging.movielens_user_id, staging.movie_id, term.id,
+                to_timestamp(staging.epoch)
+            FROM movies_tag_staging AS staging
+            JOIN movies_tagterm AS term USING (text)
+            ON CONFLICT (movielens_user_id, movie_id, term_id) DO NOTHING
+            RETURNING 1
+        )
+        SELECT COUNT(*) FROM inserted
+    """
+    # Insert the new tags by term ID and add them to the per-movie counts
+    # in the same statement.
+    merge_with_counts_sql = """
+        WITH inserted AS (
+            INSERT INTO movies_tag (movielens_user_id, movie_id, term_id, timestamp)
+            SELECT staging.movielens_user_id, staging.movie_id, term.id,
+                to_timestamp(staging.epoch)
+            FROM movies_tag_staging AS staging
+            JOIN movies_tagterm AS term USING (text)
+            ON CONFLICT (movielens_user_id, movie_id, term_id) DO NOTHING
+            RETURNING movie_id, term_id
+        ), counted AS (
+            INSERT INTO movies_movietagcount (movie_id, term_id, count)
+            SELECT movie_id, term_id, COUNT(*)
+            FROM inserted
+            GROUP BY movie_id, term_id
+            ORDER BY movie_id, term_id
+            ON CONFLICT (movie_id, term_id)
+            DO UPDATE SET count = movies_movietagcount.count + EXCLUDED.count
+        )
+        SELECT COUNT(*) FROM inserted
+    """
+
+    def __init__(
+        self,
+        movie_ids=None,
+        batch_size=None,
+        session_settings=None,
+        update_counts=True,
+    ):
+        super().__init__(
+            movie_ids=movie_ids,
+            batch_size=batch_size,
+            session_settings=session_settings,
+        )
+        # Like the rating aggregates, parallel and bulk loads skip this and
+        # rebuild the counts at the end.
+        self.update_counts = update_counts
+
+    def merge(self, cursor):
+        cursor.execute(self.terms_sql)
+        return super().merge(cursor)
+
+    def get_merge_sql(self):
+        if self.update_counts:
+            return self.merge_with_counts_sql
+        return self.merge_sql
+
+    def convert(self, row, columns):
+        movie_id = int(row[columns["movieId"]])
+        if movie_id not in self.movie_ids:
+            return None
+        return (
+            row[columns["userId"]],
+            movie_id,
+            TagTerm.normalize(row[columns["tag"]]),
+            row[columns["timestamp"]],
+        )
+
+
+_worker_movie_ids = None
+
+
+def _init_worker(movie_ids):
+    global _worker_movie_ids
+    if not apps.ready:
+        django.setup()
+    _worker_movie_ids = movie_ids
+
+
+def _load_chunk(loader_class, loader_options, source, source_size, start, end):
+    loader = loader_class(movie_ids=_worker_movie_ids, **loader_options)
+    loader.load_chunk(source, start, end)
+    # Replaying a chunk is harmless since the merge ignores conflicts, so the
+    # checkpoint only needs to be written once the whole range is in.
+    ImportCheckpoint.objects.create(
+        kind=loader.kind,
+        source=source,
+        source_size=source_size,
+        start_offset=start,
+        end_offset=end,
+        rows_processed=loader.rows_processed,
+        entries_created=loader.entries_created,
+    )
+    return (
+        loader.rows_processed,
+        loader.rows_skipped,
+        loader.entries_created,
+        end - start,
+    )
+
+
+class ChunkedImport:
+    """Load a CSV file chunk by chunk, optionally in a process pool.
+
+    Every loaded chunk is recorded as an ImportCheckpoint, and a resumed
+    import skips the chunks already recorded for the same file.
+    """
+
+    def __init__(
+        self,
+        loader_class,
+        csv_file_path,
+        workers=1,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        resume=False,
+        **loader_options,
+    ):
+        self.loader_class = loader_class
+        self.source = os.path.abspath(csv_file_path)
+        self.source_size = os.path.getsize(self.source)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.resume = resume
+        self.loader_options = loader_options
+        self.chunks_total = 0
+        self.chunks_skipped = 0
+        self.rows_processed = 0
+        self.rows_skipped = 0
+        self.entries_created = 0
+        self.bytes_done = 0
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows_processed / self.elapsed if self.elapsed else 0.0
+
+    def pending_chunks(self):
+        chunks = chunk_offsets(self.source, self.chunk_size)
+        checkpoints = ImportCheckpoint.objects.filter(
+            kind=self.loader_class.kind, source=self.source
+        )
+        if self.resume:
+            done = set(
+                checkpoints.filter(source_size=self.source_size).values_list(
+                    "start_offset", "end_offset"
+                )
+            )
+        else:
+            checkpoints.delete()
+            done = set()
+        self.chunks_total = len(chunks)
+        pending = [chunk for chunk in chunks if chunk not in done]
+        self.chunks_skipped = self.chunks_total - len(pending)
+        # Chunks loaded by a previous run count as done in the progress.
+        self.bytes_done = self.source_size - sum(end - start for start, end in pending)
+        return pending
+
+    def run(self):
+        start_time = time.monotonic()
+        chunks = self.pending_chunks()
+        movie_ids = get_catalog().ids
+        args = (self.loader_class, self.loader_options, self.source, self.source_size)
+
+        if self.workers > 1:
+            # Children must open their own connections instead of sharing
+            # the parent's socket.
+            connections.close_all()
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(movie_ids,),
+            ) as executor:
+                futures = [executor.submit(_load_chunk, *args, *c) for c in chunks]
+                for future in as_completed(futures):
+                    self.add_result(future.result(), start_time)
+        else:
+            _init_worker(movie_ids)
+            for chunk in chunks:
+                self.add_result(_load_chunk(*args, *chunk), start_time)
+
+        self.elapsed = time.monotonic() - start_time
+        return self.entries_created
+
+    def add_result(self, result, start_time):
+        rows_processed, rows_skipped, entries_created, chunk_bytes = result
+        self.rows_processed += rows_processed
+        self.rows_skipped += rows_skipped
+        self.entries_created += entries_created
+        self.bytes_done += chunk_bytes
+        self.elapsed = time.monotonic() - start_time
+        report_progress(
+            self.rows_processed,
+            self.bytes_done / self.source_size if self.source_size else None,
+        )
+        logger.info(
+            f"Loaded {self.loader_class.kind} chunk: {self.rows_processed} rows "
+            f"({self.rows_per_second:.0f} rows/sec)."
+        )
@@ -0,0 +1,93 @@
+import json
+
+from django.core.management.base import BaseCommand
+from movies.benchmarks import SCENARIOS, Benchmark, compare
+
+
+class Command(BaseCommand):
+    help = "Run the benchmark scenarios and report latency, queries and throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--scenario",
+            choices=SCENARIOS,
+            action="append",
+            help="Scenario to run, repeatable (default: all of them)",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=100,
+            help="Requests per endpoint scenario",
+        )
+        parser.add_argument(
+            "--import-rows",
+            type=int,
+            default=100000,
+            help="Synthetic ratings loaded by the import scenarios",
+        )
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="Seed of the sampled URLs and of the imported rows",
+        )
+        parser.add_argument(
+            "--warm-cache",
+            action="store_true",
+            help="Keep the response cache between requests",
+        )
+        parser.add_argument(
+            "-o",
+            "--output",
+            help="Write the JSON report to this file instead of the output",
+        )
+        parser.add_argument(
+            "--compare",
+            metavar="REPORT",
+            help="JSON report of an earlier run to compare the results with",
+        )
+
+    def handle(self, *args, **options):
+        benchmark = Benchmark(
+            requests=options["requests"],
+            import_rows=options["import_rows"],
+            seed=options["seed"],
+            warm_cache=options["warm_cache"],
+        )
+        report = benchmark.run(options["scenario"] or SCENARIOS)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                json.dump(report, file, indent=2)
+            self.write_summary(report)
+        else:
+            self.stdout.write(json.dumps(report, indent=2))
+
+        if options["compare"]:
+            with open(options["compare"]) as file:
+                baseline = json.load(file)
+            self.stdout.write(f"Compared with {baseline.get('commit')}:")
+            for name, metric, before, after in compare(report, baseline):
+                change = (after - before) / before * 100 if before else 0.0
+                style = self.style.ERROR if change > 10 else self.style.SUCCESS
+                self.stdout.write(
+                    style(
+                        f"  {name} {metric}: {before:.2f} -> {after:.2f} "
+                        f"({change:+.0f}%)"
+                    )
+                )
+
+    def write_summary(self, report):
+        for name, result in report["scenarios"].items():
+            if result["kind"] == "endpoint":
+                self.stdout.write(
+                    f"{name}: p50 {result['p50_ms']:.1f} ms, "
+                    f"p99 {result['p99_ms']:.1f} ms, "
+                    f"{result['queries_per_request']:.1f} queries, "
+                    f"{result['errors']} errors"
+                )
+            else:
+                self.stdout.write(
+                    f"{name}: {result['rows']} rows in {result['seconds']:.2f}s "
+                    f"({result['rows_per_second']:.0f} rows/s)"
+                )
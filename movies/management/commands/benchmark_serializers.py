@@ -0,0 +1,104 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from movies.models import Movie, Tag
+from movies.renderers import FastJSONRenderer
+from movies.serializers import MovieSerializer, TagSerializer
+from movies.views import MovieViewSet, get_tag_texts, get_term_texts
+
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = "Compare the serializers with the fast read path of the list endpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            action="append",
+            help="Rows per page, repeatable (default: 10, 100 and 1000)",
+        )
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=20,
+            help="Number of runs, the fastest one is reported",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print the results as JSON",
+        )
+
+    def handle(self, *args, **options):
+        results = []
+        for page_size in options["page_size"] or [10, 100, 1000]:
+            results.extend(self.benchmark(page_size, options["repeat"]))
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write(
+                f"{result['serializer']} x {result['page_size']}: "
+                f"serializer {result['serializer_ms']:.2f} ms, "
+                f"fast path {result['fast_ms']:.2f} ms "
+                f"({result['speedup']:.1f}x, "
+                f"{result['fast_rows_per_second']:.0f} rows/s)"
+            )
+
+    def benchmark(self, page_size, repeat):
+        # Rows are read once, only the serialization and rendering is timed.
+        movies = list(MovieViewSet.queryset[:page_size])
+        movie_rows = list(
+            Movie.objects.order_by("movielens_id").values(
+                *MovieSerializer.values_fields
+            )[:page_size]
+        )
+        tags = get_tag_texts([row["movielens_id"] for row in movie_rows])
+        tag_queryset = Tag.objects.order_by("timestamp", "id")[:page_size]
+        tag_list = list(tag_queryset.select_related("term"))
+        tag_rows = list(tag_queryset.values(*TagSerializer.values_fields))
+        terms = get_term_texts(tag_rows)
+
+        cases = [
+            (
+                "MovieSerializer",
+                len(movies),
+                lambda: MovieSerializer(movies, many=True).data,
+                lambda: MovieSerializer.represent_values(movie_rows, tags),
+            ),
+            (
+                "TagSerializer",
+                len(tag_list),
+                lambda: TagSerializer(tag_list, many=True).data,
+                lambda: TagSerializer.represent_values(tag_rows, terms),
+            ),
+        ]
+        results = []
+        for name, rows, serialize, represent in cases:
+            serializer_time = best_of(
+                repeat, lambda: JSONRenderer().render(serialize())
+            )
+            fast_time = best_of(repeat, lambda: FastJSONRenderer().render(represent()))
+            results.append(
+                {
+                    "serializer": name,
+                    "page_size": page_size,
+                    "rows": rows,
+                    "serializer_ms": serializer_time * 1000,
+                    "fast_ms": fast_time * 1000,
+                    "speedup": serializer_time / fast_time if fast_time else 0.0,
+                    "fast_rows_per_second": rows / fast_time if fast_time else 0.0,
+                }
+            )
+        return results
@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from movies.recommendations import (
+    build_similarity_model,
+    fetch_ratings,
+    save_similarity_model,
+)
+
+
+class Command(BaseCommand):
+    help = "Build the item-item similarity model behind the recommendation endpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top-k",
+            type=int,
+            default=50,
+            help="Number of similar movies kept per movie",
+        )
+        parser.add_argument(
+            "--output",
+            type=str,
+            default=None,
+            help="Directory the model is written to (SIMILARITY_MODEL_DIR by default)",
+        )
+
+    def handle(self, *args, **options):
+        start_time = timezone.now()
+        output = options["output"] or settings.SIMILARITY_MODEL_DIR
+        users, movies, ratings = fetch_ratings()
+        self.stdout.write(f"Loaded {len(ratings)} ratings.")
+        movie_ids, neighbors, scores = build_similarity_model(
+            users, movies, ratings, top_k=options["top_k"]
+        )
+        save_similarity_model(output, movie_ids, neighbors, scores)
+        elapsed_time = timezone.now() - start_time
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Similarity model for {len(movie_ids)} movies written to {output} "
+                f"in {elapsed_time}."
+            )
+        )
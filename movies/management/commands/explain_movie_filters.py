@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from movies.models import Movie
+from movies.views import MovieViewSet
+from rest_framework.test import APIRequestFactory
+from rest_framework.request import Request
+
+
+class Command(BaseCommand):
+    help = "Print the query plans of the movie genre and tag filters"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--genre", type=str, default="Comedy")
+        parser.add_argument("--tag", type=str, default="dark")
+        parser.add_argument(
+            "--legacy",
+            action="store_true",
+            help=(
+                "Also explain the previous filters (genre array containment, tag "
+                "join without DISTINCT) without their indexes. The trigram index "
+                "is dropped inside a transaction that is rolled back, which "
+                "locks the table."
+            ),
+        )
+
+    def handle(self, *args, **options):
+        genre, tag = options["genre"], options["tag"]
+        if options["legacy"]:
+            legacy = Movie.objects.order_by("movielens_id")
+            self.explain(
+                "legacy genre filter",
+                legacy.filter(genres__contains=genre.split(",")),
+                legacy=True,
+            )
+            self.explain(
+                "legacy tag filter",
+                legacy.filter(tags__term__text__contains=tag.lower()),
+                legacy=True,
+            )
+        self.explain("genre filter", self.get_queryset(genre=genre))
+        self.explain("tag filter", self.get_queryset(tag=tag))
+
+    def get_queryset(self, **params):
+        view = MovieViewSet()
+        view.request = Request(APIRequestFactory().get("/api/movies/", params))
+        view.format_kwarg = None
+        return view.get_queryset().prefetch_related(None)
+
+    def explain(self, label, queryset, legacy=False):
+        sql, params = queryset[:10].query.sql_with_params()
+        with transaction.atomic(), connection.cursor() as cursor:
+            if legacy:
+                cursor.execute("DROP INDEX movies_tagterm_text_trgm")
+            cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS) {sql}", params)
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+            transaction.set_rollback(True)
+        self.stdout.write(self.style.SUCCESS(f"== {label}"))
+        self.stdout.write(plan)
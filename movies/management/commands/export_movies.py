@@ -1,32 +1,110 @@
-from django.core.management.base import BaseCommand
-from movies.models import Movie
-import csv
+import gzip
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from movies.exports import (
+    CHUNK_SIZE,
+    DATASETS,
+    FORMATS,
+    MOVIE_EXTRAS,
+    TEXT_CHUNKS,
+    get_export,
+    write_parquet,
+)
 
 
 class Command(BaseCommand):
-    help = "Export movie list to CSV file including the MovieLens link"
+    help = "Export movies, ratings or tags to CSV, NDJSON or Parquet"
 
     def add_arguments(self, parser):
         parser.add_argument(
             "-o",
             "--output",
             type=str,
-            help="Path to output CSV file",
-            default="movies_export.csv",
+            help="Path to the output file (<dataset>_export.<format> by default)",
+            default=None,
+        )
+        parser.add_argument(
+            "--dataset",
+            choices=DATASETS,
+            default="movies",
+            help="Table to export",
+        )
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            default=None,
+            help="Output format, guessed from the output file name by default",
+        )
+        parser.add_argument(
+            "--gzip",
+            action="store_true",
+            help="Compress the output with gzip (implied by a .gz file name)",
+        )
+        parser.add_argument(
+            "--include",
+            choices=MOVIE_EXTRAS,
+            action="append",
+            default=[],
+            help="Extra movie columns to export, may be repeated",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=CHUNK_SIZE,
+            help="Number of rows fetched and written at a time",
         )
 
     def handle(self, *args, **options):
-        output_file_path = options["output"]
+        start_time = timezone.now()
+        output_file_path, output_format, compress = self.get_output(options)
         self.stdout.write(
-            self.style.SUCCESS(f"Starting export of movies to {output_file_path}")
+            self.style.SUCCESS(
+                f"Starting export of {options['dataset']} to {output_file_path}"
+            )
+        )
+        export = get_export(
+            options["dataset"], options["include"], chunk_size=options["chunk_size"]
         )
-        headers = ["movieId", "title", "link"]
 
-        with open(output_file_path, mode="w", newline="", encoding="utf-8") as file:
-            writer = csv.writer(file)
-            writer.writerow(headers)
-            for movie in Movie.objects.all():
-                link = f"https://movielens.org/movies/{movie.movielens_id}"
-                writer.writerow([movie.movielens_id, movie.title, link])
+        if output_format == "parquet":
+            try:
+                write_parquet(
+                    export,
+                    output_file_path,
+                    compression="gzip" if compress else "snappy",
+                )
+            except ImportError:
+                raise CommandError("Parquet output needs pyarrow to be installed.")
+        else:
+            opener = gzip.open if compress else open
+            with opener(
+                output_file_path, mode="wt", newline="", encoding="utf-8"
+            ) as file:
+                for chunk in TEXT_CHUNKS[output_format](export):
+                    file.write(chunk)
+
+        elapsed_time = timezone.now() - start_time
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Export completed successfully: {export.rows_written} rows "
+                f"in {elapsed_time}."
+            )
+        )
 
-        self.stdout.write(self.style.SUCCESS("Movies export completed successfully."))
+    def get_output(self, options):
+        path = options["output"]
+        compress = options["gzip"] or bool(path and path.endswith(".gz"))
+        output_format = options["format"]
+        if output_format is None and path:
+            suffixes = path.removesuffix(".gz").rsplit(".", 1)
+            extension = suffixes[-1] if len(suffixes) > 1 else ""
+            output_format = {"jsonl": "ndjson"}.get(extension, extension)
+            if output_format not in FORMATS:
+                output_format = "csv"
+        output_format = output_format or "csv"
+        if path is None:
+            path = f"{options['dataset']}_export.{output_format}"
+            if compress and output_format != "parquet":
+                path += ".gz"
+        return path, output_format, compress
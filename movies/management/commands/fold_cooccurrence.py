@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from movies.cooccurrence import fold_events, rebuild
+
+
+class Command(BaseCommand):
+    help = "Fold new ratings into the co-occurrences of the also-rated endpoint"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10000,
+            help="Number of rating events folded per transaction",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=60,
+            help="Seconds to wait for new ratings once the log is empty",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the event log is empty instead of polling it",
+        )
+        parser.add_argument(
+            "--rebuild",
+            action="store_true",
+            help="Recompute the table from every rating and clear the event log",
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            start_time = timezone.now()
+            pairs = rebuild()
+            elapsed_time = timezone.now() - start_time
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Co-occurrences rebuilt: {pairs} pairs in {elapsed_time}."
+                )
+            )
+            return
+
+        while True:
+            self.fold(options["batch_size"])
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
+
+    def fold(self, batch_size):
+        start_time = timezone.now()
+        total_events = total_movies = 0
+        while True:
+            events, movies = fold_events(batch_size)
+            total_events += events
+            total_movies += movies
+            if events < batch_size:
+                break
+        if total_events:
+            elapsed_time = timezone.now() - start_time
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"Folded {total_events} ratings into the co-occurrences of "
+                    f"{total_movies} movies in {elapsed_time}."
+                )
+            )
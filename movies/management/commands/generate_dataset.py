@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from movies import catalog
+from movies.cache import invalidate_all_movies
+from movies.models import Movie
+from movies.synthetic import SyntheticDataset
+
+TABLES = (
+    "movies_movie",
+    "movies_rating",
+    "movies_tag",
+    "movies_tagterm",
+    "movies_movietagcount",
+    "movies_ratingevent",
+    "movies_moviecooccurrence",
+    "movies_importcheckpoint",
+)
+
+
+class Command(BaseCommand):
+    help = "Generate a deterministic MovieLens-shaped dataset for benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--movies", type=int, default=27278)
+        parser.add_argument("--ratings", type=int, default=20000263)
+        parser.add_argument("--tags", type=int, default=465564)
+        parser.add_argument("--users", type=int, default=138493)
+        parser.add_argument(
+            "--seed",
+            type=int,
+            default=0,
+            help="The same seed and sizes always give the same rows",
+        )
+        parser.add_argument(
+            "--output-dir",
+            help="Write movies.csv, ratings.csv and tags.csv here instead "
+            "of loading the database",
+        )
+        parser.add_argument(
+            "--flush",
+            action="store_true",
+            help="Delete the existing movies, ratings and tags first",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            dataset = SyntheticDataset(
+                movies=options["movies"],
+                ratings=options["ratings"],
+                tags=options["tags"],
+                users=options["users"],
+                seed=options["seed"],
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+        start_time = timezone.now()
+
+        if options["output_dir"]:
+            dataset.write_csv(options["output_dir"])
+            destination = options["output_dir"]
+        else:
+            if options["flush"]:
+                with connection.cursor() as cursor:
+                    cursor.execute(f"TRUNCATE {', '.join(TABLES)}")
+            elif Movie.objects.exists():
+                raise CommandError(
+                    "The database already holds movies, pass --flush to replace them."
+                )
+            dataset.load()
+            invalidate_all_movies()
+            catalog.invalidate()
+            destination = "the database"
+
+        elapsed_time = timezone.now() - start_time
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Generated {dataset.movies} movies, {dataset.ratings} ratings and "
+                f"{dataset.tags} tags into {destination} in {elapsed_time}."
+            )
+        )
@@ -1,7 +1,10 @@
 import csv
 import logging
 from django.core.management.base import BaseCommand
+from movies import catalog
+from movies.jobs import report_progress
 from movies.models import Movie, GenreChoices
+from movies.cache import invalidate_all_movies
 from django.db import transaction
 
 
@@ -31,23 +34,35 @@ class Command(BaseCommand):
         entries_created = 0
         batch_size = 1000
         movies_batch = []
+        # Movies already in the database are skipped before they reach an
+        # INSERT, which makes the count of created entries exact.
+        existing = catalog.get_catalog()
 
         with open(csv_file_path, "r") as csvfile:
             reader = csv.DictReader(csvfile)
             for row in reader:
                 rows_processed += 1
+                if int(row["movieId"]) in existing:
+                    continue
                 movie_data = self.import_movie(row)
                 movies_batch.append(movie_data)
 
-                if rows_processed % batch_size == 0:
+                # Skipped rows count as processed but not towards a batch.
+                if len(movies_batch) >= batch_size:
                     self.bulk_create_movies(movies_batch)
                     entries_created += len(movies_batch)
                     movies_batch = []
                     logger.info(f"Processed {rows_processed} rows.")
+                    report_progress(rows_processed)
 
             if movies_batch:
                 self.bulk_create_movies(movies_batch)
                 entries_created += len(movies_batch)
+            report_progress(rows_processed)
+
+        Movie.objects.filter(search_vector=None).refresh_search_vectors()
+        invalidate_all_movies()
+        catalog.invalidate()
 
         self.stdout.write(
             self.style.SUCCESS(
@@ -1,10 +1,15 @@
 # movies/management/commands/import_ratings.py
-import csv
-from datetime import datetime
 from django.utils import timezone
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from movies.models import Movie, Rating
+from movies.loaders import (
+    DEFAULT_CHUNK_SIZE,
+    ChunkedImport,
+    RatingLoader,
+    session_setting,
+)
+from movies.models import Movie, MovieRanking
+from movies.cache import invalidate_all_movies
 
 
 class Command(BaseCommand):
@@ -16,6 +21,37 @@ class Command(BaseCommand):
             type=str,
             help="Path to the CSV file containing ratings",
         )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=RatingLoader.batch_size,
+            help="Number of rows copied and merged per transaction",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes loading chunks in parallel",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help="Size in bytes of the CSV chunks handed to each worker",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Skip the chunks loaded by a previous run on the same file",
+        )
+        parser.add_argument(
+            "--set",
+            type=session_setting,
+            action="append",
+            default=[],
+            metavar="NAME=VALUE",
+            help="Postgres session setting for the load, e.g. synchronous_commit=off",
+        )
 
     def handle(self, *args, **options):
         start_time = timezone.now()
@@ -23,61 +59,47 @@ class Command(BaseCommand):
         self.stdout.write(
             self.style.SUCCESS(f"Starting import of ratings from {csv_file_path}")
         )
-        self.import_rating(csv_file_path)
+        self.import_rating(csv_file_path, options)
         end_time = timezone.now()
         self.stdout.write(self.style.SUCCESS("Import completed"))
         elapsed_time = end_time - start_time
         self.stdout.write(self.style.SUCCESS(f"Total time taken: {elapsed_time}"))
 
-    def import_rating(self, csv_file_path):
-        rows_processed = 0
-        entries_created = 0
-        batch_size = 500000
-        ratings_batch = []
-
-        with open(csv_file_path, "r") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                rows_processed += 1
-                rating_data = self.process_rating(row)
-                if rating_data:
-                    ratings_batch.append(rating_data)
-
-                if rows_processed % batch_size == 0:
-                    self.bulk_create_ratings(ratings_batch)
-                    entries_created += len(ratings_batch)
-                    ratings_batch = []
-
-            if ratings_batch:
-                self.bulk_create_ratings(ratings_batch)
-                entries_created += len(ratings_batch)
-
-        self.stdout.write(
-            self.style.SUCCESS(
-                f"Ratings loaded successfully. Rows processed: {rows_processed}, Entries created: {entries_created}."
-            )
+    def import_rating(self, csv_file_path, options):
+        # Movie IDs are resolved against an in-memory set loaded once, and
+        # rows are streamed into Postgres with COPY in bounded batches.
+        parallel = options["workers"] > 1
+        loader = ChunkedImport(
+            RatingLoader,
+            csv_file_path,
+            workers=options["workers"],
+            chunk_size=options["chunk_size"],
+            resume=options["resume"],
+            batch_size=options["batch_size"],
+            session_settings=dict(options["set"]),
+            update_aggregates=not parallel,
         )
+        loader.run()
+        if parallel:
+            with transaction.atomic():
+                Movie.objects.refresh_rating_aggregates()
+        MovieRanking.refresh()
+        invalidate_all_movies()
 
-    def process_rating(self, row):
-        movie = Movie.objects.filter(movielens_id=row["movieId"])
-        if not movie.exists():
+        if loader.chunks_skipped:
+            self.stdout.write(
+                f"Resumed: skipped {loader.chunks_skipped} of {loader.chunks_total} chunks already loaded."
+            )
+        if loader.rows_skipped:
             self.stdout.write(
                 self.style.WARNING(
-                    f"Skipping rating for movie ID {row['movieId']}. Movie does not exist."
+                    f"Skipped {loader.rows_skipped} ratings for movies that do not exist."
                 )
             )
-            return None
-        movie = movie.first()
-        rating = Rating(
-            movielens_user_id=row["userId"],
-            movie=movie,
-            rating=row["rating"],
-            timestamp=timezone.make_aware(
-                datetime.fromtimestamp(int(row["timestamp"])), timezone.utc
-            ),
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Ratings loaded successfully. Rows processed: {loader.rows_processed}, "
+                f"Entries created: {loader.entries_created} "
+                f"({loader.rows_per_second:.0f} rows/sec)."
+            )
         )
-        return rating
-
-    @transaction.atomic
-    def bulk_create_ratings(self, ratings_batch):
-        Rating.objects.bulk_create(ratings_batch, ignore_conflicts=True)
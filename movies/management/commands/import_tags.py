@@ -1,13 +1,12 @@
-import csv
-import logging
-from datetime import datetime
-from django.db import transaction
-from django.utils import timezone
 from django.core.management.base import BaseCommand
-from movies.models import Movie, Tag
-
-
-logger = logging.getLogger(__name__)
+from movies.loaders import (
+    DEFAULT_CHUNK_SIZE,
+    ChunkedImport,
+    TagLoader,
+    session_setting,
+)
+from movies.models import Movie
+from movies.cache import invalidate_all_movies
 
 
 class Command(BaseCommand):
@@ -19,65 +18,78 @@ class Command(BaseCommand):
             type=str,
             help="Path to the CSV file containing tags",
         )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=TagLoader.batch_size,
+            help="Number of rows copied and merged per transaction",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=1,
+            help="Number of processes loading chunks in parallel",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help="Size in bytes of the CSV chunks handed to each worker",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Skip the chunks loaded by a previous run on the same file",
+        )
+        parser.add_argument(
+            "--set",
+            type=session_setting,
+            action="append",
+            default=[],
+            metavar="NAME=VALUE",
+            help="Postgres session setting for the load, e.g. synchronous_commit=off",
+        )
 
     def handle(self, *args, **options):
         csv_file_path = options["csv_file"]
         self.stdout.write(
             self.style.SUCCESS(f"Starting import of tags from {csv_file_path}")
         )
-        self.import_tags(csv_file_path)
+        self.import_tags(csv_file_path, options)
         self.stdout.write(self.style.SUCCESS("Import completed"))
 
-    def import_tags(self, csv_file_path):
-        rows_processed = 0
-        entries_created = 0
-        batch_size = 500000
-        tags_batch = []
-
-        with open(csv_file_path, "r") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                rows_processed += 1
-                tag_data = self.process_tag(row)
-                if tag_data:
-                    tags_batch.append(tag_data)
-
-                if rows_processed % batch_size == 0:
-                    self.bulk_create_tags(tags_batch)
-                    entries_created += len(tags_batch)
-                    tags_batch = []
-                    logger.info(f"Processed {rows_processed} rows.")
-
-            if tags_batch:
-                self.bulk_create_tags(tags_batch)
-                entries_created += len(tags_batch)
-
-        self.stdout.write(
-            self.style.SUCCESS(
-                f"Tags loaded successfully. Rows processed: {rows_processed}, Entries created: {entries_created}."
-            )
+    def import_tags(self, csv_file_path, options):
+        parallel = options["workers"] > 1
+        loader = ChunkedImport(
+            TagLoader,
+            csv_file_path,
+            workers=options["workers"],
+            chunk_size=options["chunk_size"],
+            resume=options["resume"],
+            batch_size=options["batch_size"],
+            session_settings=dict(options["set"]),
+            update_counts=not parallel,
         )
+        loader.run()
+        if parallel:
+            Movie.objects.refresh_tag_counts()
+        if loader.entries_created:
+            Movie.objects.refresh_search_vectors()
+            invalidate_all_movies()
 
-    def process_tag(self, row):
-        movie_id = row["movieId"]
-        movie = Movie.objects.filter(movielens_id=movie_id)
-        if not movie.exists():
+        if loader.chunks_skipped:
+            self.stdout.write(
+                f"Resumed: skipped {loader.chunks_skipped} of {loader.chunks_total} chunks already loaded."
+            )
+        if loader.rows_skipped:
             self.stdout.write(
                 self.style.WARNING(
-                    f"Skipping tag for movie ID {movie_id}. Movie does not exist."
+                    f"Skipped {loader.rows_skipped} tags for movies that do not exist."
                 )
             )
-            return None
-        movie = movie.first()
-        return Tag(
-            movielens_user_id=row["userId"],
-            movie=movie,
-            text=row["tag"],
-            timestamp=timezone.make_aware(
-                datetime.fromtimestamp(int(row["timestamp"])), timezone.utc
-            ),
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Tags loaded successfully. Rows processed: {loader.rows_processed}, "
+                f"Entries created: {loader.entries_created}."
+            )
         )
-
-    @transaction.atomic
-    def bulk_create_tags(self, tags_batch):
-        Tag.objects.bulk_create(tags_batch, ignore_conflicts=True)
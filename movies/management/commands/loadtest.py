@@ -0,0 +1,124 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand
+from movies.benchmarks import percentile
+
+
+class Command(BaseCommand):
+    help = "Measure the throughput and latency of API endpoints under concurrent load"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "urls",
+            nargs="+",
+            help="URLs to load, {n} is replaced with the request number",
+        )
+        parser.add_argument(
+            "--requests",
+            type=int,
+            default=1000,
+            help="Number of requests sent to each URL",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=16,
+            help="Number of requests in flight at once",
+        )
+        parser.add_argument(
+            "--cycle",
+            type=int,
+            default=None,
+            help="Wrap {n} around after this many values, e.g. the number of movies",
+        )
+        parser.add_argument(
+            "--data",
+            default=None,
+            help="JSON body POSTed instead of a GET, {n} is replaced as in the URLs",
+        )
+        parser.add_argument(
+            "--header",
+            action="append",
+            default=[],
+            metavar="NAME:VALUE",
+            help="Header sent with every request, e.g. a session cookie",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=30,
+            help="Timeout in seconds of each request",
+        )
+        parser.add_argument(
+            "--json",
+            action="store_true",
+            help="Print the results as JSON",
+        )
+
+    def handle(self, *args, **options):
+        results = [self.load(url, options) for url in options["urls"]]
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            self.stdout.write(
+                f"{result['url']}\n"
+                f"  {result['requests']} requests, {result['errors']} errors "
+                f"in {result['elapsed']:.2f}s: {result['throughput']:.1f} req/s\n"
+                f"  latency p50 {result['p50_ms']:.1f} ms, "
+                f"p90 {result['p90_ms']:.1f} ms, p99 {result['p99_ms']:.1f} ms, "
+                f"max {result['max_ms']:.1f} ms"
+            )
+
+    def load(self, url, options):
+        cycle = options["cycle"] or options["requests"]
+        timeout = options["timeout"]
+        headers = dict(
+            (name.strip(), value.strip())
+            for name, _, value in (
+                header.partition(":") for header in options["header"]
+            )
+        )
+        if options["data"] is not None:
+            headers["Content-Type"] = "application/json"
+
+        def fetch(number):
+            data = options["data"]
+            if data is not None:
+                data = data.replace("{n}", str(number)).encode("utf-8")
+            request = Request(
+                url.replace("{n}", str(number)), data=data, headers=headers
+            )
+            start = time.perf_counter()
+            try:
+                with urlopen(request, timeout=timeout) as r:
+                    r.read()
+                ok = True
+            except (HTTPError, URLError, OSError):
+                ok = False
+            return ok, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(options["concurrency"]) as executor:
+            outcomes = list(
+                executor.map(fetch, (i % cycle + 1 for i in range(options["requests"])))
+            )
+        elapsed = time.perf_counter() - start
+
+        latencies = [duration * 1000 for ok, duration in outcomes if ok]
+        return {
+            "url": url,
+            "requests": len(outcomes),
+            "errors": len(outcomes) - len(latencies),
+            "concurrency": options["concurrency"],
+            "elapsed": elapsed,
+            "throughput": len(latencies) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 0.5) or 0.0,
+            "p90_ms": percentile(latencies, 0.9) or 0.0,
+            "p99_ms": percentile(latencies, 0.99) or 0.0,
+            "max_ms": max(latencies, default=0.0),
+        }
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from movies.models import MovieRanking
+
+
+class Command(BaseCommand):
+    help = "Refresh the materialized movie rankings behind the top-rated endpoints"
+
+    def handle(self, *args, **options):
+        start_time = timezone.now()
+        MovieRanking.refresh()
+        elapsed_time = timezone.now() - start_time
+        self.stdout.write(
+            self.style.SUCCESS(f"Movie rankings refreshed in {elapsed_time}.")
+        )
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from movies.models import Movie, MovieRanking
+from movies.cache import invalidate_all_movies
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized rating_count/rating_sum columns on Movie"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "movie_ids",
+            nargs="*",
+            type=int,
+            help="MovieLens IDs to refresh (defaults to every movie)",
+        )
+
+    def handle(self, *args, **options):
+        start_time = timezone.now()
+        movies = Movie.objects.all()
+        if options["movie_ids"]:
+            movies = movies.filter(movielens_id__in=options["movie_ids"])
+        with transaction.atomic():
+            updated = movies.refresh_rating_aggregates()
+        MovieRanking.refresh()
+        invalidate_all_movies()
+        elapsed_time = timezone.now() - start_time
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Rating aggregates refreshed for {updated} movies in {elapsed_time}."
+            )
+        )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from movies.models import Movie
+from movies.cache import invalidate_all_movies
+
+
+class Command(BaseCommand):
+    help = "Rebuild the per-movie tag counts behind the tag filter and tag clouds"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "movie_ids",
+            nargs="*",
+            type=int,
+            help="MovieLens IDs to refresh (defaults to every movie)",
+        )
+
+    def handle(self, *args, **options):
+        start_time = timezone.now()
+        movies = Movie.objects.all()
+        if options["movie_ids"]:
+            movies = movies.filter(movielens_id__in=options["movie_ids"])
+        counted = movies.refresh_tag_counts()
+        invalidate_all_movies()
+        elapsed_time = timezone.now() - start_time
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Tag counts refreshed: {counted} movie tags in {elapsed_time}."
+            )
+        )
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from movies.jobs import claim_job, fail_abandoned_jobs, get_worker_name, run_job
+from movies.models import JobStatus
+
+
+class Command(BaseCommand):
+    help = "Run the jobs queued through the API, one at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5,
+            help="Seconds to wait for new jobs once the queue is empty",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty instead of polling it",
+        )
+
+    def handle(self, *args, **options):
+        worker = get_worker_name()
+        while True:
+            # A long-running worker must not hold on to a broken connection.
+            close_old_connections()
+            abandoned = fail_abandoned_jobs()
+            if abandoned:
+                self.stdout.write(
+                    self.style.WARNING(f"Failed {abandoned} abandoned jobs.")
+                )
+            job, reporter = claim_job(worker)
+            if job is not None:
+                self.run(job, reporter)
+            elif options["once"]:
+                return
+            else:
+                time.sleep(options["interval"])
+
+    def run(self, job, reporter):
+        self.stdout.write(
+            f"Running job {job.pk}: {job.command} {' '.join(job.arguments)}"
+        )
+        job = run_job(job, reporter)
+        elapsed_time = job.finished_at - job.started_at
+        if job.status == JobStatus.SUCCEEDED:
+            self.stdout.write(
+                self.style.SUCCESS(f"Job {job.pk} succeeded in {elapsed_time}.")
+            )
+        else:
+            self.stdout.write(
+                self.style.ERROR(f"Job {job.pk} failed in {elapsed_time}.")
+            )
@@ -0,0 +1,94 @@
+import threading
+from bisect import bisect_left
+
+from . import cache
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """A labelled histogram rendered in the Prometheus text format."""
+
+    def __init__(self, name, documentation, buckets, labelnames=("view", "method")):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = labelnames
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                # one counter per bucket plus +Inf, then the sum
+                series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self.lock:
+            series = {labels: list(values) for labels, values in self.series.items()}
+        for labels, values in sorted(series.items()):
+            label_text = ",".join(
+                f'{name}="{escape(value)}"'
+                for name, value in zip(self.labelnames, labels)
+            )
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}'
+                )
+            lines.append(f"{self.name}_sum{{{label_text}}} {values[-1]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+request_duration = Histogram(
+    "movielens_request_duration_seconds",
+    "Total time spent handling a request.",
+    LATENCY_BUCKETS,
+)
+request_db_duration = Histogram(
+    "movielens_request_db_duration_seconds",
+    "Time spent in database queries per request.",
+    LATENCY_BUCKETS,
+)
+request_render_duration = Histogram(
+    "movielens_request_render_duration_seconds",
+    "Time spent rendering (serializing) the response body.",
+    LATENCY_BUCKETS,
+)
+request_queries = Histogram(
+    "movielens_request_db_queries",
+    "Number of database queries per request.",
+    QUERY_BUCKETS,
+)
+HISTOGRAMS = (
+    request_duration,
+    request_db_duration,
+    request_render_duration,
+    request_queries,
+)
+
+
+def render_metrics():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    lines.append("# HELP movielens_response_cache_total Movie response cache lookups.")
+    lines.append("# TYPE movielens_response_cache_total counter")
+    for result, value in cache.get_stats().items():
+        lines.append(f'movielens_response_cache_total{{result="{result}"}} {value}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,115 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+
+
+logger = logging.getLogger(__name__)
+
+MAX_LOGGED_QUERIES = 100
+
+
+class RequestStats:
+    """Database execute wrapper collecting the queries of one request."""
+
+    def __init__(self):
+        self.queries = []
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            self.db_time += duration
+            self.queries.append((sql, duration))
+
+
+def add_execute_wrapper(wrapper):
+    connection.execute_wrappers.append(wrapper)
+
+
+def remove_execute_wrapper(wrapper):
+    connection.execute_wrappers.remove(wrapper)
+
+
+class QueryStatsMiddleware:
+    """Record query count, DB time, render time and latency per view.
+
+    The numbers feed the histograms exposed at /metrics. Requests over the
+    REQUEST_QUERY_BUDGET or REQUEST_LATENCY_BUDGET_MS settings are logged
+    with their SQL.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = request.query_stats = RequestStats()
+        start = time.perf_counter()
+        with connection.execute_wrapper(stats):
+            response = self.get_response(request)
+        self.record(request, stats, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        stats = request.query_stats = RequestStats()
+        start = time.perf_counter()
+        # The async ORM runs queries in the request's thread sensitive
+        # executor, so the wrapper goes on that thread's connection.
+        await sync_to_async(add_execute_wrapper)(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(remove_execute_wrapper)(stats)
+        self.record(request, stats, time.perf_counter() - start)
+        return response
+
+    def record(self, request, stats, duration):
+        match = request.resolver_match
+        labels = (match.view_name if match else "unmatched", request.method)
+        metrics.request_duration.observe(labels, duration)
+        metrics.request_db_duration.observe(labels, stats.db_time)
+        metrics.request_render_duration.observe(labels, stats.render_time)
+        metrics.request_queries.observe(labels, len(stats.queries))
+
+        if (
+            len(stats.queries) > settings.REQUEST_QUERY_BUDGET
+            or duration * 1000 > settings.REQUEST_LATENCY_BUDGET_MS
+        ):
+            self.log_over_budget(request, stats, duration)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns, time it with a
+        # post render callback.
+        start = time.perf_counter()
+
+        def rendered(response):
+            request.query_stats.render_time = time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def log_over_budget(self, request, stats, duration):
+        queries = "\n".join(
+            f"  [{query_time * 1000:.1f} ms] {sql}"
+            for sql, query_time in stats.queries[:MAX_LOGGED_QUERIES]
+        )
+        logger.warning(
+            f"{request.method} {request.get_full_path()} over budget: "
+            f"{len(stats.queries)} queries, {stats.db_time * 1000:.1f} ms in the "
+            f"database, {duration * 1000:.1f} ms total.\n{queries}"
+        )
@@ -0,0 +1,36 @@
+# Generated by Django 4.1.10 on 2026-10-18 17:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movies", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="movie",
+            name="rating_count",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="movie",
+            name="rating_sum",
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE movies_movie AS m
+                SET rating_count = a.rating_count, rating_sum = a.rating_sum
+                FROM (
+                    SELECT movie_id, COUNT(*) AS rating_count, SUM(rating) AS rating_sum
+                    FROM movies_rating
+                    GROUP BY movie_id
+                ) AS a
+                WHERE m.movielens_id = a.movie_id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
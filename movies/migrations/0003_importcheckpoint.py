@@ -0,0 +1,38 @@
+# Generated by Django 4.1.10 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movies", "0002_movie_rating_aggregates"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ImportCheckpoint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("kind", models.CharField(max_length=20)),
+                ("source", models.CharField(max_length=1024)),
+                ("source_size", models.BigIntegerField()),
+                ("start_offset", models.BigIntegerField()),
+                ("end_offset", models.BigIntegerField()),
+                ("rows_processed", models.IntegerField(default=0)),
+                ("entries_created", models.IntegerField(default=0)),
+                ("completed_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "unique_together": {("kind", "source", "start_offset", "end_offset")},
+            },
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 4.1.10 on 2026-10-18 17:07
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movies", "0003_importcheckpoint"),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql=[
+                """
+                CREATE MATERIALIZED VIEW movies_movieranking AS
+                SELECT
+                    movielens_id AS movie_id,
+                    genres,
+                    rating_count,
+                    rating_sum / rating_count AS average_rating
+                FROM movies_movie
+                WHERE rating_count > 0
+                """,
+                "CREATE UNIQUE INDEX movies_movieranking_movie_id ON movies_movieranking (movie_id)",
+                "CREATE INDEX movies_movieranking_top ON movies_movieranking (average_rating DESC, rating_count DESC)",
+                "CREATE INDEX movies_movieranking_most ON movies_movieranking (rating_count DESC, average_rating DESC)",
+                "CREATE INDEX movies_movieranking_genres ON movies_movieranking USING gin (genres)",
+            ],
+            reverse_sql="DROP MATERIALIZED VIEW movies_movieranking",
+        ),
+        migrations.CreateModel(
+            name="MovieRanking",
+            fields=[
+                (
+                    "movie",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="ranking",
+                        serialize=False,
+                        to="movies.movie",
+                    ),
+                ),
+                (
+                    "genres",
+                    django.contrib.postgres.fields.ArrayField(
+                        base_field=models.CharField(
+                            choices=[
+                                ("Action", "Action"),
+                                ("Adventure", "Adventure"),
+                                ("Animation", "Animation"),
+                                ("Children's", "Childrens"),
+                                ("Comedy", "Comedy"),
+                                ("Crime", "Crime"),
+                                ("Documentary", "Documentary"),
+                                ("Drama", "Drama"),
+                                ("Fantasy", "Fantasy"),
+                                ("Film-Noir", "Film Noir"),
+                                ("Horror", "Horror"),
+                                ("Musical", "Musical"),
+                                ("Mystery", "Mystery"),
+                                ("Romance", "Romance"),
+                                ("Sci-Fi", "Sci Fi"),
+                                ("Thriller", "Thriller"),
+                                ("War", "War"),
+                                ("Western", "Western"),
+                                ("(no genres listed)", "No Genre Listed"),
+                            ],
+                            max_length=20,
+                        ),
+                        size=None,
+                    ),
+                ),
+                ("rating_count", models.IntegerField()),
+                ("average_rating", models.FloatField()),
+            ],
+            options={
+                "db_table": "movies_movieranking",
+                "managed": False,
+            },
+        ),
+    ]
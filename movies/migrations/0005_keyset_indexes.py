@@ -0,0 +1,31 @@
+# Generated by Django 4.1.10 on 2026-10-18 17:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movies", "0004_movieranking"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="movie",
+            index=models.Index(
+                fields=["title", "movielens_id"], name="movies_movi_title_60d7ae_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="rating",
+            index=models.Index(
+                fields=["timestamp", "id"], name="movies_rati_timesta_55032c_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tag",
+            index=models.Index(
+                fields=["timestamp", "id"], name="movies_tag_timesta_debe5e_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.1.10 on 2026-10-18 17:11
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movies", "0006_search_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="movie",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.RunSQL(
+            sql="""
+                UPDATE movies_movie AS m
+                SET search_vector =
+                    setweight(to_tsvector('english', m.title), 'A')
+                    || setweight(to_tsvector('english', COALESCE((
+                        SELECT string_agg(DISTINCT t.text, ' ')
+                        FROM movies_tag AS t
+                        WHERE t.movie_id = m.movielens_id
+                    ), '')), 'B')
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name="movie",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="movies_movie_search_gin"
+            ),
+        ),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 4.1.10 on 2026-10-18 17:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movies", "0007_movie_search_vector"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RatingEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("movielens_user_id", models.IntegerField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "movie",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="movies.movie",
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="MovieCooccurrence",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("count", models.IntegerField()),
+                (
+                    "movie",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="cooccurrences",
+                        to="movies.movie",
+                    ),
+                ),
+                (
+                    "other",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="movies.movie",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="ratingevent",
+            index=models.Index(
+                fields=["movielens_user_id", "movie"],
+                name="movies_rati_moviele_4588f1_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="moviecooccurrence",
+            index=models.Index(
+                fields=["movie", "-count", "other"],
+                name="movies_movi_movie_i_9a1eef_idx",
+            ),
+        ),
+        migrations.AlterUniqueTogether(
+            name="moviecooccurrence",
+            unique_together={("movie", "other")},
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.1.10 on 2026-10-18 17:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movies", "0008_cooccurrence"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="rating",
+            index=models.Index(
+                fields=["movielens_user_id", "timestamp", "id"],
+                name="movies_rati_moviele_44428e_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="tag",
+            index=models.Index(
+                fields=["movielens_user_id", "timestamp", "id"],
+                name="movies_tag_moviele_a96453_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,129 @@
+# Generated by Django 4.1.10 on 2026-10-18 18:35
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movies", "0009_user_history_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TagTerm",
+            fields=[
+                ("id", models.AutoField(primary_key=True, serialize=False)),
+                ("text", models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="tagterm",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass("text", name="gin_trgm_ops"),
+                name="movies_tagterm_text_trgm",
+            ),
+        ),
+        migrations.CreateModel(
+            name="MovieTagCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("count", models.IntegerField()),
+                (
+                    "movie",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="tag_counts",
+                        to="movies.movie",
+                    ),
+                ),
+                (
+                    "term",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.PROTECT,
+                        related_name="+",
+                        to="movies.tagterm",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("movie", "term")},
+            },
+        ),
+        migrations.AddField(
+            model_name="tag",
+            name="term",
+            field=models.ForeignKey(
+                db_index=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="movies.tagterm",
+            ),
+        ),
+        # Intern the lower-cased texts, point the tags at their term, drop
+        # the tags that only differed by case and count the rest per movie.
+        migrations.RunSQL(
+            sql=[
+                "SET CONSTRAINTS ALL IMMEDIATE",
+                """
+                INSERT INTO movies_tagterm (text)
+                SELECT DISTINCT lower(btrim(text)) FROM movies_tag ORDER BY 1
+                """,
+                """
+                UPDATE movies_tag AS tag
+                SET term_id = term.id
+                FROM movies_tagterm AS term
+                WHERE term.text = lower(btrim(tag.text))
+                """,
+                """
+                DELETE FROM movies_tag AS tag
+                USING movies_tag AS other
+                WHERE other.movielens_user_id = tag.movielens_user_id
+                    AND other.movie_id = tag.movie_id
+                    AND other.term_id = tag.term_id
+                    AND other.id < tag.id
+                """,
+                """
+                INSERT INTO movies_movietagcount (movie_id, term_id, count)
+                SELECT movie_id, term_id, COUNT(*)
+                FROM movies_tag
+                GROUP BY movie_id, term_id
+                """,
+            ],
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterUniqueTogether(
+            name="tag",
+            unique_together={("movielens_user_id", "movie", "term")},
+        ),
+        migrations.RemoveIndex(
+            model_name="tag",
+            name="movies_tag_text_trgm",
+        ),
+        migrations.RemoveField(
+            model_name="tag",
+            name="text",
+        ),
+        migrations.AlterField(
+            model_name="tag",
+            name="term",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="+",
+                to="movies.tagterm",
+            ),
+        ),
+    ]
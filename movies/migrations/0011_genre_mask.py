@@ -0,0 +1,88 @@
+# Generated by Django 4.1.10 on 2026-10-18 18:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("movies", "0010_tag_terms"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="movie",
+            name="movies_movie_genres_gin",
+        ),
+        migrations.AddField(
+            model_name="movie",
+            name="genre_mask",
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        # Bit i for the i-th genre of GenreChoices, frozen here as of this
+        # migration. Genres outside of the list set no bit.
+        migrations.RunSQL(
+            sql="""
+            UPDATE movies_movie SET genre_mask = (
+                SELECT COALESCE(BIT_OR(1 << (ARRAY_POSITION(ARRAY[
+                    'Action', 'Adventure', 'Animation', 'Children''s', 'Comedy',
+                    'Crime', 'Documentary', 'Drama', 'Fantasy', 'Film-Noir',
+                    'Horror', 'Musical', 'Mystery', 'Romance', 'Sci-Fi',
+                    'Thriller', 'War', 'Western', '(no genres listed)'
+                ]::varchar[], genre) - 1)), 0)
+                FROM UNNEST(genres) AS genre
+            )
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name="movie",
+            index=models.Index(
+                fields=["genre_mask"], name="movies_movi_genre_m_ad9088_idx"
+            ),
+        ),
+        migrations.RunSQL(
+            sql=[
+                "DROP MATERIALIZED VIEW movies_movieranking",
+                """
+                CREATE MATERIALIZED VIEW movies_movieranking AS
+                SELECT
+                    movielens_id AS movie_id,
+                    genres,
+                    genre_mask,
+                    rating_count,
+                    rating_sum / rating_count AS average_rating
+                FROM movies_movie
+                WHERE rating_count > 0
+                """,
+                "CREATE UNIQUE INDEX movies_movieranking_movie_id ON movies_movieranking (movie_id)",
+                "CREATE INDEX movies_movieranking_top ON movies_movieranking (average_rating DESC, rating_count DESC)",
+                "CREATE INDEX movies_movieranking_most ON movies_movieranking (rating_count DESC, average_rating DESC)",
+                # A partial index per genre bit in the top order, which counts
+                # and pages the rankings of a genre without reading the others.
+                *(
+                    f"CREATE INDEX movies_movieranking_genre_{bit} "
+                    "ON movies_movieranking (average_rating DESC, rating_count DESC) "
+                    f"WHERE (genre_mask & {1 << bit}) = {1 << bit}"
+                    for bit in range(19)
+                ),
+            ],
+            reverse_sql=[
+                "DROP MATERIALIZED VIEW movies_movieranking",
+                """
+                CREATE MATERIALIZED VIEW movies_movieranking AS
+                SELECT
+                    movielens_id AS movie_id,
+                    genres,
+                    rating_count,
+                    rating_sum / rating_count AS average_rating
+                FROM movies_movie
+                WHERE rating_count > 0
+                """,
+                "CREATE UNIQUE INDEX movies_movieranking_movie_id ON movies_movieranking (movie_id)",
+                "CREATE INDEX movies_movieranking_top ON movies_movieranking (average_rating DESC, rating_count DESC)",
+                "CREATE INDEX movies_movieranking_most ON movies_movieranking (rating_count DESC, average_rating DESC)",
+                "CREATE INDEX movies_movieranking_genres ON movies_movieranking USING gin (genres)",
+            ],
+        ),
+    ]
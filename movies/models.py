@@ -1,6 +1,12 @@
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.core.exceptions import FieldError
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 
 
 class GenreChoices(models.TextChoices):
@@ -25,6 +31,134 @@ class GenreChoices(models.TextChoices):
     NO_GENRE_LISTED = "(no genres listed)"
 
 
+SEARCH_CONFIG = "english"
+# Bit i of Movie.genre_mask is set for the i-th genre of GenreChoices. New
+# genres must be appended, or the stored masks have to be rebuilt.
+GENRE_BITS = {genre: 1 << index for index, genre in enumerate(GenreChoices.values)}
+
+
+def get_genre_mask(genres):
+    mask = 0
+    for genre in genres:
+        mask |= GENRE_BITS.get(genre, 0)
+    return mask
+
+
+class MovieQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for movie in objs:
+            movie.genre_mask = get_genre_mask(movie.genres)
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if "genres" in fields:
+            for movie in objs:
+                movie.genre_mask = get_genre_mask(movie.genres)
+            fields = [*fields, "genre_mask"]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def update(self, **kwargs):
+        # The mask is computed in Python, so the new genres must be a list
+        # rather than an expression evaluated by the database, unless the
+        # caller sets the mask as well, as bulk_update() does.
+        if "genres" in kwargs and "genre_mask" not in kwargs:
+            genres = kwargs["genres"]
+            if not isinstance(genres, (list, tuple)):
+                raise FieldError(
+                    "Movie genres can only be updated to a list of genres, "
+                    "which keeps genre_mask in step."
+                )
+            kwargs["genre_mask"] = get_genre_mask(genres)
+        return super().update(**kwargs)
+
+    def genre_facets(self):
+        """Count these movies and their ratings per genre.
+
+        The movies are grouped by genre mask in a single scan, a few hundred
+        combinations at most, which are then added up per genre. Genres are
+        ordered by decreasing count.
+        """
+        total = 0
+        facets = {genre: [0, 0, 0.0] for genre in GENRE_BITS}
+        rows = (
+            self.order_by()
+            .values("genre_mask")
+            .annotate(
+                movies=Count("pk"),
+                ratings=Sum("rating_count"),
+                rating_total=Sum("rating_sum"),
+            )
+            .values_list("genre_mask", "movies", "ratings", "rating_total")
+        )
+        for mask, count, rating_count, rating_sum in rows:
+            total += count
+            for genre, bit in GENRE_BITS.items():
+                if mask & bit:
+                    facet = facets[genre]
+                    facet[0] += count
+                    facet[1] += rating_count
+                    facet[2] += rating_sum
+        genres = [
+            {
+                "genre": genre,
+                "count": count,
+                "rating_count": rating_count,
+                "average_rating": (
+                    round(rating_sum / rating_count, 2) if rating_count else None
+                ),
+            }
+            for genre, (count, rating_count, rating_sum) in facets.items()
+        ]
+        genres.sort(key=lambda facet: (-facet["count"], facet["genre"]))
+        return {"count": total, "genres": genres}
+
+    def refresh_rating_aggregates(self):
+        """Recompute the denormalized rating columns from the Rating table."""
+        ratings = Rating.objects.filter(movie=OuterRef("pk")).order_by().values("movie")
+        return self.update(
+            rating_count=Coalesce(
+                Subquery(ratings.annotate(count=Count("id")).values("count")),
+                Value(0),
+            ),
+            rating_sum=Coalesce(
+                Subquery(ratings.annotate(total=Sum("rating")).values("total")),
+                Value(0.0),
+            ),
+        )
+
+    def refresh_search_vectors(self):
+        """Rebuild the stored search vector from the title and tag texts."""
+        tags = (
+            MovieTagCount.objects.filter(movie=OuterRef("pk"))
+            .order_by()
+            .values("movie")
+            .annotate(texts=StringAgg("term__text", " "))
+            .values("texts")
+        )
+        return self.update(
+            search_vector=SearchVector("title", weight="A", config=SEARCH_CONFIG)
+            + SearchVector(Subquery(tags), weight="B", config=SEARCH_CONFIG)
+        )
+
+    def refresh_tag_counts(self):
+        """Rebuild the MovieTagCount rows of these movies from the Tag table."""
+        movies, params = self.values("pk").query.sql_with_params()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM movies_movietagcount WHERE movie_id IN ({movies})",
+                params,
+            )
+            cursor.execute(
+                "INSERT INTO movies_movietagcount (movie_id, term_id, count) "
+                "SELECT movie_id, term_id, COUNT(*) FROM movies_tag "
+                f"WHERE movie_id IN ({movies}) GROUP BY movie_id, term_id",
+                params,
+            )
+            return cursor.rowcount
+
+
 class Movie(models.Model):
     # The ID of movie should be UUID
     movielens_id = models.BigAutoField(primary_key=True, db_index=True)
@@ -32,10 +166,43 @@ class Movie(models.Model):
     genres = ArrayField(
         models.CharField(max_length=20, choices=GenreChoices.choices),
     )
+    # The genres as GENRE_BITS, set on save(), bulk_create(), bulk_update()
+    # and update() so that genre filters and facets test bits instead of
+    # scanning string arrays.
+    genre_mask = models.IntegerField(default=0, editable=False)
+    # Maintained by the rate action and import_ratings so that reads never
+    # aggregate over the Rating table. Rebuild with refresh_rating_aggregates.
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.FloatField(default=0)
+    # Title (weight A) and tag texts (weight B), see refresh_search_vectors.
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = MovieQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["title", "movielens_id"]),
+            # Genre counts read the masks alone, with an index-only scan.
+            models.Index(fields=["genre_mask"]),
+            GinIndex(fields=["search_vector"], name="movies_movie_search_gin"),
+        ]
 
     def __str__(self):
         return f"{self.movielens_id}: {self.title}"
 
+    def save(self, *args, **kwargs):
+        self.genre_mask = get_genre_mask(self.genres)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "genres" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "genre_mask"}
+        super().save(*args, **kwargs)
+
+    @property
+    def average_rating(self):
+        if not self.rating_count:
+            return None
+        return self.rating_sum / self.rating_count
+
 
 class Rating(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
@@ -46,19 +213,294 @@ class Rating(models.Model):
 
     class Meta:
         unique_together = ("movielens_user_id", "movie")
+        indexes = [
+            models.Index(fields=["timestamp", "id"]),
+            # A user's history in keyset order, see UserViewSet.
+            models.Index(fields=["movielens_user_id", "timestamp", "id"]),
+        ]
 
     def __str__(self):
         return f"{self.movielens_user_id} - {self.movie.title}: {self.rating}"
 
 
+class TagTermQuerySet(models.QuerySet):
+    def intern(self, texts):
+        """Map the normalized ``texts`` to term IDs, creating missing terms."""
+        texts = sorted({TagTerm.normalize(text) for text in texts})
+        # ON CONFLICT DO NOTHING waits for concurrent inserts of the same
+        # text, which the following SELECT then sees.
+        self.bulk_create([TagTerm(text=text) for text in texts], ignore_conflicts=True)
+        return dict(self.filter(text__in=texts).values_list("text", "pk"))
+
+
+class TagTerm(models.Model):
+    """A distinct tag text, stored once and referenced by ID from Tag."""
+
+    # Terms number in the tens of thousands, a 4-byte key keeps the Tag rows
+    # and their unique index small.
+    id = models.AutoField(primary_key=True)
+    text = models.CharField(max_length=255, unique=True)
+
+    objects = TagTermQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves text__contains for the tag filter, terms are lower-cased.
+            GinIndex(
+                OpClass("text", name="gin_trgm_ops"),
+                name="movies_tagterm_text_trgm",
+            ),
+        ]
+
+    def __str__(self):
+        return self.text
+
+    @staticmethod
+    def normalize(text):
+        return text.strip().lower()
+
+
+class TagQuerySet(models.QuerySet):
+    def create(self, text=None, **kwargs):
+        """Create a tag from its ``text``, interning the term and counting it."""
+        if text is not None:
+            text = TagTerm.normalize(text)
+            kwargs["term"] = TagTerm(pk=TagTerm.objects.intern([text])[text], text=text)
+        with transaction.atomic():
+            tag = super().create(**kwargs)
+            MovieTagCount.objects.add({(tag.movie_id, tag.term_id): 1})
+        return tag
+
+    def delete(self):
+        with transaction.atomic():
+            counts = {
+                (row["movie_id"], row["term_id"]): -row["count"]
+                for row in self.order_by()
+                .values("movie_id", "term_id")
+                .annotate(count=Count("id"))
+            }
+            deleted = super().delete()
+            MovieTagCount.objects.add(counts)
+        return deleted
+
+
 class Tag(models.Model):
     movielens_user_id = models.IntegerField()
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="tags")
-    text = models.CharField(max_length=255)
+    # Tags are looked up by term through MovieTagCount, not through this
+    # column, so it goes without an index of its own.
+    term = models.ForeignKey(
+        TagTerm, on_delete=models.PROTECT, related_name="+", db_index=False
+    )
     timestamp = models.DateTimeField(auto_now_add=True, editable=True)
 
+    objects = TagQuerySet.as_manager()
+
     class Meta:
-        unique_together = ("movielens_user_id", "movie", "text")
+        unique_together = ("movielens_user_id", "movie", "term")
+        indexes = [
+            models.Index(fields=["timestamp", "id"]),
+            models.Index(fields=["movielens_user_id", "timestamp", "id"]),
+        ]
 
     def __str__(self):
         return f"{self.movielens_user_id} - {self.movie.title}: {self.text}"
+
+    @property
+    def text(self):
+        return self.term.text
+
+    def delete(self, using=None, keep_parents=False):
+        # Through the queryset, which keeps MovieTagCount in step.
+        return Tag.objects.filter(pk=self.pk).delete()
+
+
+class MovieTagCountQuerySet(models.QuerySet):
+    def add(self, counts):
+        """Move the count of each ``(movie_id, term_id)`` key by its value.
+
+        Rows are created as needed and deleted once their count drops to 0.
+        """
+        if not counts:
+            return
+        keys = sorted(counts)
+        movies = [movie for movie, _ in keys]
+        terms = [term for _, term in keys]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO movies_movietagcount (movie_id, term_id, count)
+                SELECT * FROM unnest(%s::bigint[], %s::integer[], %s::integer[])
+                ON CONFLICT (movie_id, term_id)
+                DO UPDATE SET count = movies_movietagcount.count + EXCLUDED.count
+                """,
+                [movies, terms, [counts[key] for key in keys]],
+            )
+            cursor.execute(
+                """
+                DELETE FROM movies_movietagcount
+                WHERE count <= 0 AND (movie_id, term_id) IN (
+                    SELECT * FROM unnest(%s::bigint[], %s::integer[])
+                )
+                """,
+                [movies, terms],
+            )
+
+
+class MovieTagCount(models.Model):
+    """How many users tagged ``movie`` with ``term``.
+
+    Kept in step by the Tag queryset and import_tags, rebuild it with
+    ``Movie.objects.refresh_tag_counts()``.
+    """
+
+    # The unique index on (movie, term) serves the lookups by movie.
+    movie = models.ForeignKey(
+        Movie, on_delete=models.CASCADE, related_name="tag_counts", db_index=False
+    )
+    term = models.ForeignKey(TagTerm, on_delete=models.PROTECT, related_name="+")
+    count = models.IntegerField()
+
+    objects = MovieTagCountQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ("movie", "term")
+
+    def __str__(self):
+        return f"{self.movie_id} & {self.term_id}: {self.count}"
+
+
+class MovieRanking(models.Model):
+    """Rated movies ranked by average and count, read from a materialized view.
+
+    The view is built from the denormalized aggregates on Movie and is
+    refreshed after imports with ``MovieRanking.refresh()``.
+    """
+
+    movie = models.OneToOneField(
+        Movie,
+        primary_key=True,
+        on_delete=models.DO_NOTHING,
+        related_name="ranking",
+    )
+    genres = ArrayField(
+        models.CharField(max_length=20, choices=GenreChoices.choices),
+    )
+    genre_mask = models.IntegerField()
+    rating_count = models.IntegerField()
+    average_rating = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "movies_movieranking"
+
+    def __str__(self):
+        return f"{self.movie_id}: {self.average_rating} ({self.rating_count})"
+
+    @classmethod
+    def refresh(cls):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"REFRESH MATERIALIZED VIEW CONCURRENTLY {cls._meta.db_table}"
+            )
+
+
+class RatingEvent(models.Model):
+    """A rating that has not been folded into MovieCooccurrence yet.
+
+    Rows are appended in the transaction that creates the rating and are
+    deleted once ``fold_cooccurrence`` has counted them.
+    """
+
+    movielens_user_id = models.IntegerField()
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="+")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["movielens_user_id", "movie"])]
+
+    def __str__(self):
+        return f"{self.movielens_user_id} rated {self.movie_id}"
+
+
+class MovieCooccurrence(models.Model):
+    """How many users rated both ``movie`` and ``other``.
+
+    Only the most co-rated movies of each movie are kept, see
+    movies/cooccurrence.py.
+    """
+
+    movie = models.ForeignKey(
+        Movie, on_delete=models.CASCADE, related_name="cooccurrences"
+    )
+    other = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="+")
+    count = models.IntegerField()
+
+    class Meta:
+        unique_together = ("movie", "other")
+        indexes = [models.Index(fields=["movie", "-count", "other"])]
+
+    def __str__(self):
+        return f"{self.movie_id} & {self.other_id}: {self.count}"
+
+
+class ImportCheckpoint(models.Model):
+    """A byte range of a CSV file that has been fully loaded."""
+
+    kind = models.CharField(max_length=20)
+    source = models.CharField(max_length=1024)
+    source_size = models.BigIntegerField()
+    start_offset = models.BigIntegerField()
+    end_offset = models.BigIntegerField()
+    rows_processed = models.IntegerField(default=0)
+    entries_created = models.IntegerField(default=0)
+    completed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ("kind", "source", "start_offset", "end_offset")
+
+    def __str__(self):
+        return f"{self.kind} {self.source} [{self.start_offset}, {self.end_offset})"
+
+
+class JobStatus(models.TextChoices):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class Job(models.Model):
+    """A management command queued from the API and run by ``run_jobs``.
+
+    ``rows_processed`` and ``progress``, the fraction done when the command
+    knows it, are written by the worker while the command runs, see
+    movies/jobs.py.
+    """
+
+    command = models.CharField(max_length=50)
+    arguments = models.JSONField(default=list, blank=True)
+    status = models.CharField(
+        max_length=10, choices=JobStatus.choices, default=JobStatus.QUEUED
+    )
+    worker = models.CharField(max_length=255, blank=True)
+    rows_processed = models.BigIntegerField(default=0)
+    progress = models.FloatField(null=True)
+    output = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            # The queue itself: workers take the oldest queued job.
+            models.Index(
+                fields=["created_at", "id"],
+                condition=models.Q(status=JobStatus.QUEUED),
+                name="movies_job_queued",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.pk}: {self.command} ({self.status})"
@@ -0,0 +1,209 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Keyset (seek) pagination over the queryset ordering.
+
+    The cursor stores the ordering key of the last row of a page and the
+    next page is fetched with a row comparison such as
+    ``(timestamp, id) > (%s, %s)``, so every page costs the same index range
+    scan however deep it is. The primary key is appended to the ordering to
+    make the key unique. Orderings on annotations, such as a search rank,
+    fall back to an equivalent chain of comparisons. The total count is
+    included unless the client passes ``count=false``.
+    """
+
+    cursor_query_param = "cursor"
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = "limit"
+    max_page_size = 1000
+    count_query_param = "count"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page_queryset = self.get_page_queryset(queryset, request)
+        self.count = queryset.count() if self.include_count(request) else None
+        return self.set_page(list(page_queryset))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset()`` for async views, with the async ORM."""
+        page_queryset = self.get_page_queryset(queryset, request)
+        self.count = await queryset.acount() if self.include_count(request) else None
+        return self.set_page([row async for row in page_queryset])
+
+    def get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.keys, self.descending = self.get_keyset(queryset)
+        self.cursor = self.decode_cursor(request, queryset)
+
+        reverse = False
+        if self.cursor is not None:
+            values, reverse = self.cursor
+            queryset = queryset.filter(
+                self.seek(queryset, values, after=reverse == self.descending)
+            )
+        ordering = [
+            f"-{name}" if self.descending != reverse else name for name, _ in self.keys
+        ]
+        return queryset.order_by(*ordering)[: self.page_size + 1]
+
+    def set_page(self, results):
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+        if self.cursor is not None and self.cursor[1]:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        self.page = results
+        if not results:
+            self.has_next = self.has_previous = False
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        payload = {}
+        if self.count is not None:
+            payload["count"] = self.count
+        payload["next"] = self.get_next_link()
+        payload["previous"] = self.get_previous_link()
+        payload["results"] = data
+        return payload
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "count": {"type": "integer", "example": 123},
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def include_count(self, request):
+        value = request.query_params.get(self.count_query_param, "true")
+        return value.lower() not in ("false", "0", "no")
+
+    def get_keyset(self, queryset):
+        ordering = list(queryset.query.order_by) or [queryset.model._meta.pk.name]
+        descending = ordering[0].startswith("-")
+        opts = queryset.model._meta
+        keys = []
+        for name in ordering:
+            if name.startswith("-") != descending:
+                raise ValidationError(
+                    {
+                        "ordering": [
+                            "Keyset pagination needs a single ordering direction."
+                        ]
+                    }
+                )
+            name = name.lstrip("-")
+            if name in queryset.query.annotations:
+                keys.append((name, None))
+                continue
+            field = opts.pk if name == "pk" else opts.get_field(name)
+            keys.append((field.attname, field.column))
+        if opts.pk.attname not in [attname for attname, _ in keys]:
+            keys.append((opts.pk.attname, opts.pk.column))
+        return keys, descending
+
+    def seek(self, queryset, values, after):
+        if any(column is None for _, column in self.keys):
+            return self.seek_chain(values, after)
+        table = queryset.model._meta.db_table
+        columns = ", ".join(f'"{table}"."{column}"' for _, column in self.keys)
+        placeholders = ", ".join(["%s"] * len(self.keys))
+        operator = ">" if after else "<"
+        return RawSQL(
+            f"({columns}) {operator} ({placeholders})",
+            values,
+            output_field=BooleanField(),
+        )
+
+    def seek_chain(self, values, after):
+        # (a > x) OR (a = x AND b > y) OR ...
+        lookup = "gt" if after else "lt"
+        condition = equal = Q()
+        for (name, _), value in zip(self.keys, values):
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            values, reverse = cursor["k"], bool(cursor.get("r"))
+        except (AttributeError, TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.keys):
+            raise NotFound(self.invalid_cursor_message)
+        # The values end up in SQL, a tampered cursor must not reach the
+        # database as a value of the wrong type.
+        try:
+            values = [
+                self.get_key_field(queryset, name).to_python(value)
+                for (name, _), value in zip(self.keys, values)
+            ]
+        except (TypeError, ValueError, DjangoValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    def get_key_field(self, queryset, name):
+        if name in queryset.query.annotations:
+            return queryset.query.annotations[name].output_field
+        return queryset.model._meta.get_field(name)
+
+    def encode_cursor(self, instance, reverse):
+        # Pages hold model instances, or dicts when paginating .values().
+        if isinstance(instance, dict):
+            values = [instance[attname] for attname, _ in self.keys]
+        else:
+            values = [getattr(instance, attname) for attname, _ in self.keys]
+        cursor = {"k": values}
+        if reverse:
+            cursor["r"] = 1
+        # Datetimes keep their microseconds, a truncated key would skip rows.
+        encoded = json.dumps(
+            cursor, default=lambda value: value.isoformat(), separators=(",", ":")
+        )
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            urlsafe_b64encode(encoded.encode("utf-8")).decode("ascii"),
+        )
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
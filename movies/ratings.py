@@ -0,0 +1,141 @@
+from django.db import IntegrityError, connection, transaction
+
+from . import cache, catalog
+from .models import Movie
+
+
+ON_CONFLICT_CHOICES = ("ignore", "update")
+
+# Writes a whole batch of ratings in one statement: the rows are passed as
+# arrays and unnested, the new ratings are logged for fold_cooccurrence and
+# the denormalized aggregates on Movie move by the difference each write
+# made. xmax is 0 only on rows the INSERT created, not on updated ones.
+#
+# The previous ratings come from the statement snapshot, which is only right
+# if no other transaction changes them until this one commits. Updates
+# therefore lock the existing ratings with LOCK_SQL first, and only update
+# the rows they locked: a rating inserted concurrently in between is skipped
+# and written again once it is locked. This assumes every write to a rating
+# that should move the aggregates goes through write_ratings().
+WRITE_SQL = """
+    WITH input AS (
+        SELECT *
+        FROM unnest(
+            %(users)s::integer[],
+            %(movies)s::bigint[],
+            %(ratings)s::double precision[],
+            %(timestamps)s::timestamptz[]
+        ) AS input (movielens_user_id, movie_id, rating, timestamp)
+    ), previous AS (
+        SELECT rating.movielens_user_id, rating.movie_id, rating.rating
+        FROM movies_rating AS rating
+        JOIN input USING (movielens_user_id, movie_id)
+    ), written AS (
+        INSERT INTO movies_rating (movielens_user_id, movie_id, rating, timestamp)
+        SELECT movielens_user_id, movie_id, rating, timestamp
+        FROM input
+        ORDER BY movie_id, movielens_user_id
+        ON CONFLICT (movielens_user_id, movie_id) {on_conflict}
+        RETURNING id, movielens_user_id, movie_id, rating, xmax = 0 AS created
+    ), totals AS (
+        SELECT
+            written.movie_id,
+            COUNT(*) FILTER (WHERE written.created) AS rating_count,
+            SUM(written.rating - COALESCE(previous.rating, 0)) AS rating_sum
+        FROM written
+        LEFT JOIN previous USING (movielens_user_id, movie_id)
+        GROUP BY written.movie_id
+    ), updated AS (
+        UPDATE movies_movie AS m
+        SET rating_count = m.rating_count + totals.rating_count,
+            rating_sum = m.rating_sum + totals.rating_sum
+        FROM totals
+        WHERE m.movielens_id = totals.movie_id
+    ), logged AS (
+        INSERT INTO movies_ratingevent (movielens_user_id, movie_id, created_at)
+        SELECT movielens_user_id, movie_id, now() FROM written WHERE created
+    )
+    SELECT movielens_user_id, movie_id, id, created FROM written
+"""
+ON_CONFLICT_SQL = {
+    "ignore": "DO NOTHING",
+    "update": (
+        "DO UPDATE SET rating = EXCLUDED.rating, timestamp = EXCLUDED.timestamp "
+        "WHERE movies_rating.id = ANY(%(locked)s::bigint[])"
+    ),
+}
+# In ID order, so that concurrent writers lock shared ratings in the same
+# order.
+LOCK_SQL = """
+    SELECT rating.id
+    FROM movies_rating AS rating
+    JOIN unnest(%(users)s::integer[], %(movies)s::bigint[])
+        AS input (movielens_user_id, movie_id)
+        USING (movielens_user_id, movie_id)
+    ORDER BY rating.id
+    FOR UPDATE OF rating
+"""
+
+
+class MovieNotFound(Exception):
+    """Some rows rate movies that do not exist, listed in ``movie_ids``."""
+
+    def __init__(self, movie_ids):
+        super().__init__(f"Movies not found: {sorted(movie_ids)}")
+        self.movie_ids = movie_ids
+
+
+def write_ratings(rows, on_conflict="ignore"):
+    """Insert ``(user_id, movie_id, rating, timestamp)`` rows in one statement.
+
+    A row may not repeat a (user, movie) pair of another row. With
+    ``on_conflict="update"`` existing ratings are locked and overwritten,
+    otherwise they are left alone. Returns
+    ``{(user_id, movie_id): (rating_id, created)}`` for the rows that were
+    written.
+
+    The movies are checked against the catalog beforehand. If some of them
+    turn out to be gone, nothing is written and MovieNotFound is raised.
+    """
+    if not rows:
+        return {}
+    sql = WRITE_SQL.format(on_conflict=ON_CONFLICT_SQL[on_conflict])
+    movie_ids = {row[1] for row in rows}
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            written = write_rows(cursor, sql, rows, on_conflict)
+            # Foreign keys are deferred to the commit, which may be the
+            # caller's. Checked here, a missing movie is reported as such.
+            connection.check_constraints()
+    except IntegrityError as exc:
+        if not catalog.is_missing_movie(exc):
+            raise
+        catalog.invalidate()
+        existing = Movie.objects.filter(pk__in=movie_ids).values_list("pk", flat=True)
+        raise MovieNotFound(movie_ids - set(existing))
+    if written:
+        cache.invalidate_movies(*{movie for _, movie in written})
+    return written
+
+
+def write_rows(cursor, sql, rows, on_conflict):
+    written = {}
+    while rows:
+        users, movies, ratings, timestamps = (list(column) for column in zip(*rows))
+        params = {
+            "users": users,
+            "movies": movies,
+            "ratings": ratings,
+            "timestamps": timestamps,
+            "locked": [],
+        }
+        if on_conflict == "update":
+            cursor.execute(LOCK_SQL, params)
+            params["locked"] = [row[0] for row in cursor.fetchall()]
+        cursor.execute(sql, params)
+        batch = {(user, movie): (pk, created) for user, movie, pk, created in cursor}
+        written.update(batch)
+        if on_conflict != "update":
+            break
+        rows = [row for row in rows if (row[0], row[1]) not in batch]
+    return written
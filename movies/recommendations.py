@@ -0,0 +1,214 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from scipy import sparse
+
+
+MANIFEST_FILE = "manifest.json"
+ARRAY_FILES = ("movie_ids", "neighbors", "scores")
+FETCH_SIZE = 100000
+
+
+def fetch_ratings():
+    """Load every rating as three NumPy arrays with a server-side cursor."""
+    users, movies, ratings = [], [], []
+    with connection.chunked_cursor() as cursor:
+        cursor.execute("SELECT movielens_user_id, movie_id, rating FROM movies_rating")
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            block = np.array(rows, dtype=np.float64)
+            users.append(block[:, 0].astype(np.int64))
+            movies.append(block[:, 1].astype(np.int64))
+            ratings.append(block[:, 2].astype(np.float32))
+    if not users:
+        return (np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32))
+    return np.concatenate(users), np.concatenate(movies), np.concatenate(ratings)
+
+
+def build_similarity_model(users, movies, ratings, top_k=50, block_size=1024):
+    """Compute the top-K item-item adjusted cosine similarities.
+
+    Ratings are centred on each user's mean before the cosine, so users who
+    rate everything high do not make every pair of movies look similar.
+    Returns the sorted movie IDs, the neighbour indexes into those IDs (-1
+    when a movie has fewer than K positively similar movies) and the scores.
+    """
+    movie_ids, item_index = np.unique(movies, return_inverse=True)
+    _, user_index = np.unique(users, return_inverse=True)
+    n_items, n_users = len(movie_ids), user_index.max(initial=-1) + 1
+
+    user_totals = np.bincount(user_index, weights=ratings, minlength=n_users)
+    user_counts = np.bincount(user_index, minlength=n_users)
+    centred = ratings - (user_totals / np.maximum(user_counts, 1))[user_index]
+
+    matrix = sparse.csr_matrix(
+        (centred.astype(np.float32), (item_index, user_index)),
+        shape=(n_items, n_users),
+    )
+    norms = np.sqrt(matrix.multiply(matrix).sum(axis=1)).A1
+    norms[norms == 0] = 1
+    matrix = sparse.diags(1 / norms).dot(matrix).tocsr().astype(np.float32)
+    transposed = matrix.T.tocsc()
+
+    k = min(top_k, max(n_items - 1, 0))
+    neighbors = np.full((n_items, k), -1, dtype=np.int32)
+    scores = np.zeros((n_items, k), dtype=np.float32)
+    for start in range(0, n_items, block_size):
+        stop = min(start + block_size, n_items)
+        block = (matrix[start:stop] @ transposed).toarray()
+        block[np.arange(stop - start), np.arange(start, stop)] = 0
+        if k == 0:
+            continue
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+        positive = top_scores > 0
+        neighbors[start:stop] = np.where(positive, top, -1)
+        scores[start:stop] = np.where(positive, top_scores, 0)
+    return movie_ids, neighbors, scores
+
+
+def save_similarity_model(path, movie_ids, neighbors, scores):
+    """Write a model into a directory of its own and make it the current one.
+
+    The manifest names the directory of the current model. Replacing it is
+    the only step a reader can observe, so workers load either every array
+    of the previous model or every array of the new one.
+    """
+    os.makedirs(path, exist_ok=True)
+    directory = tempfile.mkdtemp(prefix="model-", dir=path)
+    os.chmod(directory, 0o755)
+    for name, array in zip(ARRAY_FILES, (movie_ids, neighbors, scores)):
+        np.save(os.path.join(directory, f"{name}.npy"), array)
+    previous = read_manifest(path)
+    manifest = {
+        "directory": os.path.basename(directory),
+        "movies": int(len(movie_ids)),
+        "top_k": int(neighbors.shape[1]),
+    }
+    temporary = os.path.join(path, f"{MANIFEST_FILE}.tmp")
+    with open(temporary, "w") as manifest_file:
+        json.dump(manifest, manifest_file)
+    os.replace(temporary, os.path.join(path, MANIFEST_FILE))
+
+    # A worker that read the previous manifest may still be opening its
+    # arrays, the models before it are no longer referenced. Mapped files
+    # stay readable after their directory is removed.
+    keep = {manifest["directory"], previous and previous.get("directory")}
+    for entry in os.scandir(path):
+        if entry.is_dir() and entry.name.startswith("model-"):
+            if entry.name not in keep:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+
+
+class SimilarityModel:
+    """Memory-mapped top-K similarity model.
+
+    Workers share the arrays through the page cache instead of each holding
+    its own copy.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.movie_ids, self.neighbors, self.scores = (
+            np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in ARRAY_FILES
+        )
+
+    def index_of(self, movie_ids):
+        movie_ids = np.asarray(movie_ids, dtype=np.int64)
+        if not len(self.movie_ids):
+            return np.zeros(len(movie_ids), np.int64), np.zeros(len(movie_ids), bool)
+        indexes = np.searchsorted(self.movie_ids, movie_ids)
+        indexes = np.minimum(indexes, len(self.movie_ids) - 1)
+        return indexes, self.movie_ids[indexes] == movie_ids
+
+    def similar(self, movie_id, limit=10):
+        indexes, known = self.index_of([movie_id])
+        if not known[0]:
+            return []
+        neighbors, scores = self.neighbors[indexes[0]], self.scores[indexes[0]]
+        valid = neighbors >= 0
+        return [
+            (int(self.movie_ids[neighbor]), float(score))
+            for neighbor, score in zip(neighbors[valid][:limit], scores[valid][:limit])
+        ]
+
+    def recommend(self, rated, limit=10):
+        """Predict ratings for unseen movies from ``(movie_id, rating)`` pairs.
+
+        Each candidate's prediction is the user's mean plus the similarity
+        weighted average of the user's centred ratings over the rated movies
+        that list it as a neighbour.
+        """
+        if not rated:
+            return []
+        movie_ids, ratings = map(np.asarray, zip(*rated))
+        mean = float(ratings.mean())
+        indexes, known = self.index_of(movie_ids)
+        indexes, centred = indexes[known], (ratings[known] - mean).astype(np.float32)
+        if not len(indexes):
+            return []
+
+        neighbors = np.asarray(self.neighbors[indexes])
+        scores = np.asarray(self.scores[indexes])
+        valid = neighbors >= 0
+        candidates = neighbors[valid]
+        weights = np.broadcast_to(centred[:, None], neighbors.shape)[valid]
+        similarities = scores[valid]
+        size = len(self.movie_ids)
+        numerator = np.bincount(
+            candidates, weights=similarities * weights, minlength=size
+        )
+        denominator = np.bincount(candidates, weights=similarities, minlength=size)
+        denominator[indexes] = 0
+
+        candidates = np.flatnonzero(denominator > 0)
+        predictions = mean + numerator[candidates] / denominator[candidates]
+        predictions = np.clip(predictions, 0, 5)
+        best = np.argsort(-predictions, kind="stable")[:limit]
+        return [
+            (int(self.movie_ids[candidates[i]]), float(predictions[i])) for i in best
+        ]
+
+
+_model = None
+_model_lock = threading.Lock()
+
+
+def get_model():
+    """Return the model in SIMILARITY_MODEL_DIR, or None before it is built.
+
+    The model is loaded once per process and reloaded when a rebuild points
+    the manifest at another directory.
+    """
+    global _model
+    path = settings.SIMILARITY_MODEL_DIR
+    manifest = read_manifest(path)
+    if manifest is None:
+        return None
+    # Models written before the versioned directories keep their arrays
+    # next to the manifest.
+    directory = os.path.join(path, manifest.get("directory", ""))
+    with _model_lock:
+        if _model is None or _model.path != directory:
+            _model = SimilarityModel(directory)
+        return _model
@@ -0,0 +1,14 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import catalog
+from .models import Movie
+
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def invalidate_catalog(sender, **kwargs):
+    # Every single-movie write, from the API, the admin or a shell, reloads
+    # the catalog. Bulk writes that add or rename movies call
+    # catalog.invalidate() themselves.
+    catalog.invalidate()
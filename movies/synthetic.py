@@ -0,0 +1,270 @@
+import csv
+import os
+
+import numpy as np
+from django.db import connection, transaction
+
+from .loaders import CopyStream, TagLoader
+from .models import GenreChoices, Movie, MovieRanking, get_genre_mask
+
+
+# Synthetic data shaped like MovieLens ml-20m: a few popular movies get most
+# of the ratings, users rate between a handful and a few thousand movies and
+# tags follow a long tail. Every table has its own random stream derived
+# from the seed, so a table comes out the same whatever else is generated.
+
+GENRES = [genre for genre in GenreChoices.values if genre != "(no genres listed)"]
+# MovieLens ratings are skewed towards 3 and 4 stars.
+RATING_VALUES = np.arange(1, 11) / 2
+RATING_WEIGHTS = [0.01, 0.03, 0.02, 0.07, 0.05, 0.2, 0.12, 0.27, 0.08, 0.15]
+# 1995-01-09 to 2015-03-31, the span of ml-20m.
+FIRST_TIMESTAMP = 789652009
+LAST_TIMESTAMP = 1427784002
+TITLE_WORDS = (
+    "night day city love war star dark last lost secret king queen house road "
+    "dream river man woman girl boy time world heart fire story ghost island "
+    "summer winter blood game money family killer shadow return rise"
+).split()
+TAG_WORDS = (
+    "funny classic dark atmospheric quirky violent surreal romantic slow "
+    "visually-appealing twist-ending based-on-a-book sci-fi comedy drama "
+    "thriller cult nudity boring overrated great-soundtrack dystopia "
+    "time-travel space aliens zombies mafia heist friendship revenge "
+    "satire documentary animation superhero remake sequel"
+).split()
+
+
+def power_law(rng, size, n):
+    """Indices in ``[0, n)``, low ones far more often than high ones."""
+    return np.minimum((n * rng.random(size) ** 3).astype(np.int64), n - 1)
+
+
+class SyntheticDataset:
+    """Deterministic MovieLens-shaped movies, ratings and tags.
+
+    Movies are numbered 1 to ``movies`` and users from ``user_offset + 1``
+    on. The rows are generated in blocks of about ``block_size``, so memory
+    stays flat whatever the scale.
+    """
+
+    def __init__(
+        self,
+        movies=27278,
+        ratings=20000263,
+        tags=465564,
+        users=138493,
+        seed=0,
+        user_offset=0,
+        block_size=1000000,
+    ):
+        if not users <= ratings <= users * (movies // 2):
+            raise ValueError(
+                "Every user rates at least one movie and at most half of them."
+            )
+        self.movies = movies
+        self.ratings = ratings
+        self.tags = tags
+        self.users = users
+        self.seed = seed
+        self.user_offset = user_offset
+        self.block_size = block_size
+
+    def random(self, stream):
+        return np.random.default_rng([self.seed, stream])
+
+    def movie_rows(self):
+        """Yield ``(movie_id, title, genres)``."""
+        rng = self.random(1)
+        words = rng.integers(len(TITLE_WORDS), size=(self.movies, 2))
+        years = rng.integers(1920, 2015, size=self.movies)
+        genre_counts = rng.integers(1, 4, size=self.movies)
+        for index in range(self.movies):
+            first, second = words[index]
+            title = f"{TITLE_WORDS[first]} {TITLE_WORDS[second]}".title()
+            genres = rng.choice(len(GENRES), genre_counts[index], replace=False)
+            yield (
+                index + 1,
+                f"{title} {index + 1} ({years[index]})",
+                [GENRES[genre] for genre in sorted(genres)],
+            )
+
+    def ratings_per_user(self):
+        # Pareto activity, rounded so the counts add up to exactly ratings.
+        rng = self.random(2)
+        weights = rng.pareto(1.2, self.users) + 1
+        shares = weights / weights.sum() * self.ratings
+        counts = np.clip(shares.astype(np.int64), 1, self.movies // 2)
+        remainder = self.ratings - counts.sum()
+        order = np.argsort(shares - counts)[::-1]
+        while remainder > 0:
+            changed = order[counts[order] < self.movies // 2][:remainder]
+            counts[changed] += 1
+            remainder -= len(changed)
+        while remainder < 0:
+            changed = order[counts[order] > 1][::-1][:-remainder]
+            counts[changed] -= 1
+            remainder += len(changed)
+        return counts
+
+    def rating_blocks(self):
+        """Yield ratings as ``(users, movies, ratings, timestamps)`` arrays.
+
+        Each block covers whole users and is sorted by user and movie.
+        """
+        rng = self.random(3)
+        counts = self.ratings_per_user()
+        ends = np.cumsum(counts)
+        first_user = 0
+        while first_user < self.users:
+            last_user = int(np.searchsorted(ends, ends[first_user] + self.block_size))
+            last_user = min(max(last_user, first_user + 1), self.users)
+            users = np.repeat(
+                np.arange(first_user, last_user), counts[first_user:last_user]
+            )
+            movies = self.distinct_movies(rng, users)
+            order = np.lexsort((movies, users))
+            users = users[order] + self.user_offset + 1
+            movies = movies[order] + 1
+            ratings = rng.choice(RATING_VALUES, len(users), p=RATING_WEIGHTS)
+            timestamps = rng.integers(FIRST_TIMESTAMP, LAST_TIMESTAMP, len(users))
+            yield users, movies, ratings, timestamps
+            first_user = last_user
+
+    def distinct_movies(self, rng, users):
+        # Popular movies are drawn most, and the draws that repeat a movie
+        # of the same user are drawn again until every pair is unique.
+        movies = power_law(rng, len(users), self.movies)
+        for attempt in range(100):
+            keys = users * self.movies + movies
+            _, first = np.unique(keys, return_index=True)
+            repeated = np.ones(len(keys), dtype=bool)
+            repeated[first] = False
+            if not repeated.any():
+                return movies
+            if attempt < 20:
+                movies[repeated] = power_law(rng, repeated.sum(), self.movies)
+            else:
+                movies[repeated] = rng.integers(self.movies, size=repeated.sum())
+        raise RuntimeError("Could not draw distinct movies for every user.")
+
+    def rating_rows(self):
+        """Yield ``(user_id, movie_id, rating, timestamp)``."""
+        for users, movies, ratings, timestamps in self.rating_blocks():
+            yield from zip(
+                users.tolist(), movies.tolist(), ratings.tolist(), timestamps.tolist()
+            )
+
+    def tag_rows(self):
+        """Yield ``(user_id, movie_id, text, timestamp)``, sorted by user."""
+        rng = self.random(4)
+        vocabulary = TAG_WORDS + [
+            f"{first} {second}" for first in TAG_WORDS for second in TAG_WORDS
+        ]
+        size = self.tags
+        keys = np.empty(0, dtype=np.int64)
+        while len(keys) < self.tags:
+            users = power_law(rng, size, self.users)
+            movies = power_law(rng, size, self.movies)
+            texts = power_law(rng, size, len(vocabulary))
+            keys = np.unique(
+                np.concatenate(
+                    [keys, (users * self.movies + movies) * len(vocabulary) + texts]
+                )
+            )
+            size = max(self.tags - len(keys), 1) * 2
+        keys = np.sort(rng.choice(keys, self.tags, replace=False))
+        texts = keys % len(vocabulary)
+        pairs = keys // len(vocabulary)
+        timestamps = rng.integers(FIRST_TIMESTAMP, LAST_TIMESTAMP, self.tags)
+        for pair, text, timestamp in zip(
+            pairs.tolist(), texts.tolist(), timestamps.tolist()
+        ):
+            user, movie = divmod(pair, self.movies)
+            yield user + self.user_offset + 1, movie + 1, vocabulary[text], timestamp
+
+    def write_csv(self, directory):
+        """Write movies.csv, ratings.csv and tags.csv in the MovieLens layout."""
+        os.makedirs(directory, exist_ok=True)
+        files = {
+            "movies.csv": (
+                ["movieId", "title", "genres"],
+                (
+                    (movie, title, "|".join(genres))
+                    for movie, title, genres in self.movie_rows()
+                ),
+            ),
+            "ratings.csv": (
+                ["userId", "movieId", "rating", "timestamp"],
+                self.rating_rows(),
+            ),
+            "tags.csv": (["userId", "movieId", "tag", "timestamp"], self.tag_rows()),
+        }
+        for name, (header, rows) in files.items():
+            with open(os.path.join(directory, name), "w", newline="") as csvfile:
+                writer = csv.writer(csvfile, lineterminator="\n")
+                writer.writerow(header)
+                writer.writerows(rows)
+
+    def load(self):
+        """COPY the dataset into the database, which must hold no movies.
+
+        Rating aggregates, tag counts, search vectors and rankings are computed
+        once the rows are in. Ratings are not logged as rating events, rebuild the
+        co-occurrences with ``fold_cooccurrence --rebuild``.
+        """
+        with connection.cursor() as cursor:
+            copy(
+                cursor,
+                "movies_movie "
+                "(movielens_id, title, genres, genre_mask, rating_count, rating_sum)",
+                (
+                    (
+                        movie,
+                        title,
+                        "{%s}" % ",".join(f'"{g}"' for g in genres),
+                        get_genre_mask(genres),
+                        0,
+                        0,
+                    )
+                    for movie, title, genres in self.movie_rows()
+                ),
+            )
+            cursor.execute(
+                "SELECT setval(pg_get_serial_sequence('movies_movie', "
+                "'movielens_id'), %s)",
+                [self.movies],
+            )
+            # Epochs go through a staging table, Postgres converts them to
+            # timestamps far faster than Python formats them.
+            cursor.execute(
+                "CREATE TEMP TABLE synthetic_rating (movielens_user_id integer, "
+                "movie_id bigint, rating double precision, epoch bigint)"
+            )
+            for block in self.rating_blocks():
+                copy(
+                    cursor,
+                    "synthetic_rating",
+                    zip(*(column.tolist() for column in block)),
+                )
+                cursor.execute(
+                    "INSERT INTO movies_rating "
+                    "(movielens_user_id, movie_id, rating, timestamp) "
+                    "SELECT movielens_user_id, movie_id, rating, to_timestamp(epoch) "
+                    "FROM synthetic_rating"
+                )
+                cursor.execute("TRUNCATE synthetic_rating")
+            cursor.execute("DROP TABLE synthetic_rating")
+        # Tags go through the import path, which interns their terms.
+        tags = TagLoader(movie_ids=range(1, self.movies + 1), update_counts=False)
+        tags.load(self.tag_rows())
+        with transaction.atomic():
+            Movie.objects.refresh_rating_aggregates()
+        Movie.objects.refresh_tag_counts()
+        Movie.objects.refresh_search_vectors()
+        MovieRanking.refresh()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE movies_movie, movies_rating, movies_tag")
+
+
+def copy(cursor, table, rows):
+    cursor.copy_expert(f"COPY {table} FROM STDIN WITH (FORMAT csv)", CopyStream(rows))
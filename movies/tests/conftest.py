@@ -1,8 +1,15 @@
 import pytest
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from movies.models import Movie, Tag
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # Cached responses outlive the rolled back test transactions.
+    cache.clear()
+
+
 @pytest.fixture
 def user(db):
     return User.objects.create_user(username="testuser", password="12345")
@@ -0,0 +1,80 @@
+import pytest
+from io import StringIO
+from django.core.management import call_command
+from movies.models import Movie, MovieRanking, Rating
+
+
+@pytest.mark.django_db
+def test_async_movie_list_matches_sync(client, movies, tag):
+    sync = client.get("/api/movies/?genre=Action&limit=2").json()
+    response = client.get("/api/async/movies/?genre=Action&limit=2")
+    assert response.status_code == 200
+    data = response.json()
+    assert data["results"] == sync["results"]
+    assert data["count"] == 3
+    assert data["next"].startswith("http://testserver/api/async/movies/?")
+
+    next_page = client.get(data["next"]).json()
+    assert [movie["movieId"] for movie in next_page["results"]] == [3]
+    assert next_page["results"][0]["tags"] == "test tag"
+
+
+@pytest.mark.django_db
+def test_async_movie_list_ordering_matches_sync(client, movies, tag):
+    sync = client.get("/api/movies/?ordering=-title&limit=2").json()
+    data = client.get("/api/async/movies/?ordering=-title&limit=2").json()
+    assert data["results"] == sync["results"]
+    assert [movie["movieId"] for movie in data["results"]] == [2, 3]
+    assert data["next"].split("?")[1] == sync["next"].split("?")[1]
+
+    response = client.get("/api/async/movies/?ordering=title,-title")
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_async_movie_detail_matches_sync(client, movies):
+    movie1, _ = movies
+    sync = client.get(f"/api/movies/{movie1.movielens_id}/").json()
+    response = client.get(f"/api/async/movies/{movie1.movielens_id}/")
+    assert response.status_code == 200
+    assert response.json() == sync
+
+    response = client.get("/api/async/movies/99999/")
+    assert response.status_code == 404
+    assert response.json() == {"detail": "Not found."}
+    assert client.delete(f"/api/async/movies/{movie1.movielens_id}/").status_code == 405
+
+
+@pytest.mark.django_db
+def test_async_top_rated_matches_sync(client, movies):
+    movie1, movie2 = movies
+    for user_id in range(3):
+        Rating.objects.create(movie=movie1, movielens_user_id=user_id, rating=4.0)
+        Rating.objects.create(movie=movie2, movielens_user_id=user_id, rating=3.0)
+    Movie.objects.refresh_rating_aggregates()
+    MovieRanking.refresh()
+
+    sync = client.get("/api/movies/top/?min_votes=1").json()
+    response = client.get("/api/async/movies/top/?min_votes=1")
+    assert response.status_code == 200
+    assert response.json()["results"] == sync["results"]
+    assert client.get("/api/async/movies/top/?min_votes=x").status_code == 400
+
+
+@pytest.mark.django_db
+def test_async_similar_movies_matches_sync(client, settings, tmp_path, movies):
+    settings.SIMILARITY_MODEL_DIR = str(tmp_path / "similarity")
+    movie1, movie2 = movies
+    assert client.get(f"/api/async/movies/{movie1.pk}/similar/").status_code == 503
+
+    movie3 = Movie.objects.create(movielens_id=3, title="Test Movie 3", genres=[])
+    for user_id, ratings in enumerate([(5.0, 5.0, 1.0), (1.0, 2.0, 5.0)]):
+        for movie, rating in zip((movie1, movie2, movie3), ratings):
+            Rating.objects.create(movie=movie, movielens_user_id=user_id, rating=rating)
+    call_command("build_similarity_model", stdout=StringIO())
+
+    sync = client.get(f"/api/movies/{movie1.pk}/similar/").json()
+    response = client.get(f"/api/async/movies/{movie1.pk}/similar/")
+    assert response.status_code == 200
+    assert response.json() == sync
+    assert [movie["movieId"] for movie in sync] == [movie2.pk]
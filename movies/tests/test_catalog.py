@@ -0,0 +1,131 @@
+import pytest
+from django.db import connection
+from django.urls import reverse
+from movies import catalog
+from movies.models import Movie, Rating, Tag
+
+
+def test_catalog_is_loaded_once(movies, django_assert_num_queries):
+    with django_assert_num_queries(1):
+        first = catalog.get_catalog()
+    with django_assert_num_queries(0):
+        assert catalog.get_catalog() is first
+        assert 1 in first and 2 in first and 3 not in first
+        assert len(first) == 2
+        assert first.get_title(2) == "Test Movie 2 (1996)"
+        assert first.get_title(3) is None
+        assert catalog.movie_exists(1)
+
+
+def test_catalog_reloads_when_invalidated(movies):
+    first = catalog.get_catalog()
+    Movie.objects.bulk_create(
+        [Movie(movielens_id=4, title="New Movie (2001)", genres=[])]
+    )
+    assert 4 not in catalog.get_catalog()
+
+    catalog.invalidate()
+    assert catalog.get_catalog() is not first
+    assert catalog.get_catalog().get_title(4) == "New Movie (2001)"
+
+
+def test_existing_movie_ids_reads_through(movies, django_assert_num_queries):
+    catalog.get_catalog()
+    # A movie written without a version bump is found in the database.
+    Movie.objects.bulk_create(
+        [Movie(movielens_id=4, title="New Movie (2001)", genres=[])]
+    )
+
+    with django_assert_num_queries(2):
+        assert catalog.existing_movie_ids([1, 4, 5]) == {1, 4}
+    assert 4 in catalog.get_catalog()
+    with django_assert_num_queries(1):
+        assert not catalog.movie_exists(5)
+
+
+@pytest.mark.django_db
+def test_movie_writes_invalidate_catalog(client, user):
+    client.force_login(user)
+    assert len(catalog.get_catalog()) == 0
+
+    response = client.post(
+        "/api/movies/",
+        {"movieId": 7, "title": "Posted (2020)", "genres_list": "Drama"},
+        content_type="application/json",
+    )
+    assert response.status_code == 201
+    assert 7 in catalog.get_catalog()
+
+    response = client.delete("/api/movies/7/")
+    assert response.status_code == 204
+    assert 7 not in catalog.get_catalog()
+
+
+def test_catalog_expires(movies, settings):
+    first = catalog.get_catalog()
+    Movie.objects.bulk_create(
+        [Movie(movielens_id=4, title="New Movie (2001)", genres=[])]
+    )
+    settings.CATALOG_MAX_AGE = 0
+    assert catalog.get_catalog() is not first
+    assert 4 in catalog.get_catalog()
+
+
+def test_movie_signals_invalidate_catalog(movies):
+    movie, _ = movies
+    assert 1 in catalog.get_catalog()
+    # As the admin writes them, without going through the API.
+    movie.title = "Renamed (1995)"
+    movie.save()
+    assert catalog.get_catalog().get_title(1) == "Renamed (1995)"
+    movie.delete()
+    assert 1 not in catalog.get_catalog()
+
+
+@pytest.fixture
+def deleted_elsewhere(movies):
+    # Movie 2 is deleted by another process, whose version bump this one did
+    # not see.
+    assert 2 in catalog.get_catalog()
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM movies_movie WHERE movielens_id = 2")
+    yield
+    assert 2 not in catalog.get_catalog()
+
+
+def test_rate_movie_deleted_elsewhere(client, user, deleted_elsewhere):
+    client.force_login(user=user)
+    url = reverse("movie-rate-movie", kwargs={"movielens_id": 2})
+    response = client.post(url, {"userId": 1, "rating": 4.0}, format="json")
+    assert response.status_code == 404
+
+
+def test_bulk_ratings_for_movie_deleted_elsewhere(client, user, deleted_elsewhere):
+    client.force_login(user=user)
+    response = client.post(
+        "/api/ratings/bulk/",
+        [
+            {"userId": 1, "movieId": 1, "rating": 3.0},
+            {"userId": 1, "movieId": 2, "rating": 3.0},
+        ],
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+    assert [item["status"] for item in response.data["results"]] == [
+        "created",
+        "invalid",
+    ]
+    assert response.data["results"][1]["errors"] == {"movieId": ["Movie not found."]}
+    assert list(Rating.objects.values_list("movie_id", flat=True)) == [1]
+
+
+def test_tag_movie_deleted_elsewhere(client, user, deleted_elsewhere):
+    client.force_login(user=user)
+    response = client.post(
+        reverse("tag-list"),
+        {"userId": 1, "movieId": 2, "text": "heist"},
+        content_type="application/json",
+    )
+    assert response.status_code == 400
+    assert response.data == {"movieId": ["Movie not found."]}
+    assert not Tag.objects.exists()
@@ -0,0 +1,537 @@
+import gzip
+import json
+import pytest
+from io import StringIO
+from django.core.management import CommandError, call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.utils import timezone
+from movies import catalog, cooccurrence, ratings
+from movies.jobs import JobReporter, fail_abandoned_jobs
+from movies.loaders import chunk_offsets
+from movies.management.commands.import_movies import Command as ImportMovies
+from movies.models import (
+    ImportCheckpoint,
+    Job,
+    JobStatus,
+    Movie,
+    MovieCooccurrence,
+    MovieTagCount,
+    Rating,
+    RatingEvent,
+    Tag,
+    TagTerm,
+)
+
+
+@pytest.mark.django_db
+def test_refresh_rating_aggregates(movies):
+    movie1, movie2 = movies
+    Rating.objects.create(movie=movie1, movielens_user_id=1, rating=4.0)
+    Rating.objects.create(movie=movie1, movielens_user_id=2, rating=2.0)
+    Movie.objects.filter(pk=movie2.pk).update(rating_count=5, rating_sum=10)
+
+    call_command("refresh_rating_aggregates")
+
+    movie1.refresh_from_db()
+    movie2.refresh_from_db()
+    assert (movie1.rating_count, movie1.rating_sum) == (2, 6.0)
+    assert movie1.average_rating == 3.0
+    assert (movie2.rating_count, movie2.rating_sum) == (0, 0)
+    assert movie2.average_rating is None
+
+
+@pytest.mark.django_db
+def test_refresh_tag_counts(movies):
+    movie1, movie2 = movies
+    Tag.objects.create(movie=movie1, movielens_user_id=1, text="Funny")
+    Tag.objects.create(movie=movie1, movielens_user_id=2, text="funny ")
+    Tag.objects.create(movie=movie2, movielens_user_id=1, text="dark")
+    assert list(
+        MovieTagCount.objects.order_by("movie").values_list(
+            "movie_id", "term__text", "count"
+        )
+    ) == [(1, "funny", 2), (2, "dark", 1)]
+    MovieTagCount.objects.update(count=7)
+
+    call_command("refresh_tag_counts", str(movie1.pk), stdout=StringIO())
+
+    assert list(
+        MovieTagCount.objects.order_by("movie").values_list("movie_id", "count")
+    ) == [(1, 2), (2, 7)]
+    call_command("refresh_tag_counts", stdout=StringIO())
+    assert MovieTagCount.objects.get(movie=movie2).count == 1
+    Tag.objects.filter(movie=movie1, movielens_user_id=1).delete()
+    Tag.objects.get(movie=movie2).delete()
+    assert list(MovieTagCount.objects.values_list("movie_id", "count")) == [(1, 1)]
+
+
+@pytest.mark.django_db
+def test_import_movies_skips_existing(tmp_path, movies, monkeypatch):
+    batches = []
+    bulk_create_movies = ImportMovies.bulk_create_movies
+    monkeypatch.setattr(
+        ImportMovies,
+        "bulk_create_movies",
+        lambda self, batch: batches.append(len(batch))
+        or bulk_create_movies(self, batch),
+    )
+    csv_file = tmp_path / "movies.csv"
+    csv_file.write_text(
+        "movieId,title,genres\n"
+        + "".join(f"{i},Movie {i} (2000),Drama|Nope\n" for i in range(1, 2002))
+    )
+    out = StringIO()
+    call_command("import_movies", str(csv_file), stdout=out)
+
+    # Movies 1 and 2 exist, the batches are still full.
+    assert batches == [1000, 999]
+    assert "Rows processed: 2001, Entries created: 1999." in out.getvalue()
+    assert Movie.objects.count() == 2001
+    assert Movie.objects.get(pk=2001).genres == ["Drama"]
+    assert 2001 in catalog.get_catalog()
+
+
+@pytest.mark.django_db
+def test_import_ratings(tmp_path, movies):
+    movie1, movie2 = movies
+    csv_file = tmp_path / "ratings.csv"
+    csv_file.write_text(
+        "userId,movieId,rating,timestamp\n"
+        "1,1,3.5,1112486027\n"
+        "1,2,4.0,1112484676\n"
+        "2,1,5.0,1112484819\n"
+        "2,1,1.0,1112484819\n"
+        "3,999,4.0,1112484727\n"
+    )
+    out = StringIO()
+
+    call_command("import_ratings", str(csv_file), "--batch-size", "2", stdout=out)
+
+    assert Rating.objects.count() == 3
+    assert Rating.objects.get(movielens_user_id=2, movie=movie1).rating == 5.0
+    assert "Entries created: 3" in out.getvalue()
+    assert "Skipped 1 ratings" in out.getvalue()
+    movie1.refresh_from_db()
+    movie2.refresh_from_db()
+    assert (movie1.rating_count, movie1.rating_sum) == (2, 8.5)
+    assert (movie2.rating_count, movie2.rating_sum) == (1, 4.0)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_import_tags_parallel(tmp_path, movies):
+    csv_file = tmp_path / "tags.csv"
+    lines = ["userId,movieId,tag,timestamp"]
+    for user in range(1, 101):
+        for movie, text in [
+            (1, "Funny"),
+            (1, "funny "),
+            (2, "DARK"),
+            (user % 2 + 1, "cult"),
+        ]:
+            lines.append(f"{user},{movie},{text},1368150078")
+    csv_file.write_text("\n".join(lines) + "\n")
+    call_command(
+        "import_tags",
+        str(csv_file),
+        "--workers",
+        "3",
+        "--chunk-size",
+        "1000",
+        stdout=StringIO(),
+    )
+
+    assert Tag.objects.count() == 300
+    assert TagTerm.objects.count() == 3
+    assert list(
+        MovieTagCount.objects.order_by("movie", "term__text").values_list(
+            "movie_id", "term__text", "count"
+        )
+    ) == [(1, "cult", 50), (1, "funny", 100), (2, "cult", 50), (2, "dark", 100)]
+
+
+@pytest.mark.django_db
+def test_import_ratings_session_settings(tmp_path, movies):
+    csv_file = tmp_path / "ratings.csv"
+    csv_file.write_text("userId,movieId,rating,timestamp\n1,1,3.5,1112486027\n")
+
+    call_command(
+        "import_ratings",
+        str(csv_file),
+        "--set",
+        "synchronous_commit=off",
+        "--set",
+        "work_mem=64MB",
+        stdout=StringIO(),
+    )
+
+    assert Rating.objects.count() == 1
+    with connection.cursor() as cursor:
+        cursor.execute("SHOW synchronous_commit")
+        assert cursor.fetchone()[0] == "on"
+    with pytest.raises(CommandError):
+        call_command("import_ratings", str(csv_file), "--set", "work_mem;drop=1")
+
+
+def write_ratings_csv(path, users):
+    lines = ["userId,movieId,rating,timestamp"]
+    for user_id in range(1, users + 1):
+        lines.append(f"{user_id},1,4.0,1112486027")
+        lines.append(f"{user_id},2,2.0,1112486027")
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def test_chunk_offsets(tmp_path):
+    csv_file = write_ratings_csv(tmp_path / "ratings.csv", users=50)
+    offsets = chunk_offsets(str(csv_file), chunk_size=100)
+
+    assert len(offsets) > 1
+    assert offsets[-1][1] == csv_file.stat().st_size
+    content = csv_file.read_bytes()
+    assert content[: offsets[0][0]] == b"userId,movieId,rating,timestamp\n"
+    for (_, end), (start, _) in zip(offsets, offsets[1:]):
+        assert end == start
+        assert content[end - 1 : end] == b"\n"
+
+
+@pytest.mark.django_db
+def test_import_ratings_resume(tmp_path, movies):
+    csv_file = write_ratings_csv(tmp_path / "ratings.csv", users=50)
+    call_command(
+        "import_ratings", str(csv_file), "--chunk-size", "300", stdout=StringIO()
+    )
+    checkpoints = ImportCheckpoint.objects.filter(kind="ratings")
+    chunks = checkpoints.count()
+    assert chunks > 1
+
+    # Simulate a crash after the first chunk.
+    first = checkpoints.order_by("start_offset").first()
+    checkpoints.exclude(pk=first.pk).delete()
+    Rating.objects.filter(movielens_user_id__gt=10).delete()
+    out = StringIO()
+    call_command(
+        "import_ratings", str(csv_file), "--chunk-size", "300", "--resume", stdout=out
+    )
+
+    assert f"skipped 1 of {chunks} chunks" in out.getvalue()
+    assert Rating.objects.count() == 100
+    assert checkpoints.count() == chunks
+
+
+@pytest.mark.django_db(transaction=True)
+def test_import_ratings_parallel(tmp_path, movies):
+    csv_file = write_ratings_csv(tmp_path / "ratings.csv", users=200)
+    call_command(
+        "import_ratings",
+        str(csv_file),
+        "--workers",
+        "3",
+        "--chunk-size",
+        "1000",
+        stdout=StringIO(),
+    )
+
+    assert Rating.objects.count() == 400
+    movie1 = Movie.objects.get(movielens_id=1)
+    assert (movie1.rating_count, movie1.rating_sum) == (200, 800.0)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_run_jobs(tmp_path, movies, monkeypatch):
+    monkeypatch.setattr("movies.jobs.PROGRESS_INTERVAL", 0)
+    csv_file = write_ratings_csv(tmp_path / "ratings.csv", users=100)
+    imported = Job.objects.create(
+        command="import_ratings", arguments=[str(csv_file), "--chunk-size", "1000"]
+    )
+    missing = Job.objects.create(
+        command="import_ratings", arguments=[str(tmp_path / "missing.csv")]
+    )
+    output = StringIO()
+    call_command("run_jobs", "--once", stdout=output)
+
+    imported.refresh_from_db()
+    assert imported.status == JobStatus.SUCCEEDED
+    assert (imported.rows_processed, imported.progress) == (200, 1.0)
+    assert "Ratings loaded successfully" in imported.output
+    assert imported.started_at <= imported.finished_at
+    assert Rating.objects.count() == 200
+    missing.refresh_from_db()
+    assert missing.status == JobStatus.FAILED
+    assert "FileNotFoundError" in missing.error
+    assert f"Job {missing.pk} failed" in output.getvalue()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_job_progress_and_abandoned_jobs():
+    job = Job.objects.create(command="refresh_rankings", status=JobStatus.RUNNING)
+    reporter = JobReporter(job)
+    # Written on the reporter's own connection, visible right away.
+    reporter.report(50, 0.25)
+    job.refresh_from_db()
+    assert (job.rows_processed, job.progress) == (50, 0.25)
+    assert fail_abandoned_jobs() == 0
+
+    # The advisory lock goes with the reporter's connection.
+    reporter.close()
+    assert fail_abandoned_jobs() == 1
+    job.refresh_from_db()
+    assert job.status == JobStatus.FAILED
+    assert job.finished_at is not None
+
+
+@pytest.mark.django_db
+def test_import_tags(tmp_path, movies):
+    csv_file = tmp_path / "tags.csv"
+    csv_file.write_text(
+        "userId,movieId,tag,timestamp\n"
+        '18,1,"Mark Waters, director",1240597180\n'
+        '18,1," MARK WATERS, director",1240597181\n'
+        "65,2,dark hero,1368150078\n"
+        "65,2,dark hero,1368150078\n"
+        "66,2,Dark Hero,1368150080\n"
+        "65,999,noir,1368150079\n"
+    )
+    out = StringIO()
+
+    call_command("import_tags", str(csv_file), stdout=out)
+
+    assert Tag.objects.count() == 3
+    assert Tag.objects.get(movielens_user_id=18).text == "mark waters, director"
+    assert TagTerm.objects.count() == 2
+    assert list(
+        MovieTagCount.objects.order_by("movie").values_list(
+            "movie_id", "term__text", "count"
+        )
+    ) == [(1, "mark waters, director", 1), (2, "dark hero", 2)]
+    assert "Entries created: 3" in out.getvalue()
+    assert list(
+        Movie.objects.filter(search_vector="hero").values_list("pk", flat=True)
+    ) == [2]
+
+
+def cooccurrences():
+    return set(MovieCooccurrence.objects.values_list("movie_id", "other_id", "count"))
+
+
+@pytest.mark.django_db
+def test_fold_cooccurrence(tmp_path, movies):
+    movie3 = Movie.objects.create(movielens_id=3, title="Test Movie 3", genres=[])
+    csv_file = tmp_path / "ratings.csv"
+    csv_file.write_text(
+        "userId,movieId,rating,timestamp\n"
+        "1,1,3.5,1112486027\n"
+        "1,2,4.0,1112484676\n"
+        "2,1,5.0,1112484819\n"
+        "2,2,1.0,1112484819\n"
+        "2,3,1.0,1112484819\n"
+    )
+    call_command("import_ratings", str(csv_file), stdout=StringIO())
+    assert RatingEvent.objects.count() == 5
+
+    # Fold in batches smaller than a user's ratings: pairs across batches
+    # must still be counted exactly once.
+    call_command("fold_cooccurrence", "--once", "--batch-size", "2", stdout=StringIO())
+    assert not RatingEvent.objects.exists()
+    expected = {(1, 2, 2), (2, 1, 2), (1, 3, 1), (3, 1, 1), (2, 3, 1), (3, 2, 1)}
+    assert cooccurrences() == expected
+
+    Rating.objects.create(movie=movie3, movielens_user_id=1, rating=2.0)
+    RatingEvent.objects.create(movie=movie3, movielens_user_id=1)
+    call_command("fold_cooccurrence", "--once", stdout=StringIO())
+    incremental = cooccurrences()
+    assert (1, 3, 2) in incremental and (3, 2, 2) in incremental
+
+    call_command("fold_cooccurrence", "--rebuild", stdout=StringIO())
+    assert cooccurrences() == incremental
+
+
+@pytest.mark.django_db(transaction=True)
+def test_fold_cooccurrence_with_late_commit(movies):
+    # User 1 rates movie 1 in a transaction that commits only once the fold
+    # has started, after the rating of movie 2 that got a later event ID.
+    other = connections.create_connection(DEFAULT_DB_ALIAS)
+    other.set_autocommit(False)
+    with other.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO movies_rating (movielens_user_id, movie_id, rating, "
+            "timestamp) VALUES (1, 1, 4.0, now())"
+        )
+        cursor.execute(
+            "INSERT INTO movies_ratingevent (movielens_user_id, movie_id, "
+            "created_at) VALUES (1, 1, now())"
+        )
+    ratings.write_ratings([(1, 2, 3.0, timezone.now())])
+
+    def commit_other(execute, sql, params, many, context):
+        if sql == cooccurrence.FOLD_SQL:
+            other.commit()
+        return execute(sql, params, many, context)
+
+    try:
+        with connection.execute_wrapper(commit_other):
+            cooccurrence.fold_events()
+    finally:
+        other.close()
+    cooccurrence.fold_events()
+    assert not RatingEvent.objects.exists()
+    assert cooccurrences() == {(1, 2, 1), (2, 1, 1)}
+
+
+@pytest.mark.django_db
+def test_export_movies(tmp_path, movies, tag):
+    output = tmp_path / "movies.csv"
+    call_command("export_movies", "-o", str(output), stdout=StringIO())
+    assert output.read_text().splitlines() == [
+        "movieId,title,link",
+        "1,Test Movie (1995),https://movielens.org/movies/1",
+        "2,Test Movie 2 (1996),https://movielens.org/movies/2",
+        "3,Test Movie (2005),https://movielens.org/movies/3",
+    ]
+
+
+@pytest.mark.django_db
+def test_export_movies_ndjson_gzip(tmp_path, movies, tag):
+    movie1, _ = movies
+    Rating.objects.create(movie=movie1, movielens_user_id=1, rating=4.0)
+    Rating.objects.create(movie=movie1, movielens_user_id=2, rating=3.0)
+    Movie.objects.refresh_rating_aggregates()
+    output = tmp_path / "movies.ndjson.gz"
+    call_command(
+        "export_movies",
+        "-o",
+        str(output),
+        "--include",
+        "genres",
+        "--include",
+        "tags",
+        "--include",
+        "aggregates",
+        "--chunk-size",
+        "2",
+        stdout=StringIO(),
+    )
+
+    with gzip.open(output, "rt") as file:
+        records = [json.loads(line) for line in file]
+    assert [record["movieId"] for record in records] == [1, 2, 3]
+    assert records[0]["genres"] == ["Action", "Comedy"]
+    assert (records[0]["rating_count"], records[0]["average_rating"]) == (2, 3.5)
+    assert records[1]["average_rating"] is None
+    assert (records[1]["tags"], records[2]["tags"]) == ([], ["test tag"])
+
+
+@pytest.mark.django_db
+def test_export_ratings_round_trip(tmp_path, movies):
+    movie1, movie2 = movies
+    Rating.objects.create(movie=movie1, movielens_user_id=1, rating=4.0)
+    Rating.objects.create(movie=movie2, movielens_user_id=1, rating=2.5)
+    output = tmp_path / "ratings.csv"
+    call_command(
+        "export_movies", "--dataset", "ratings", "-o", str(output), stdout=StringIO()
+    )
+    expected = set(Rating.objects.values_list("movielens_user_id", "movie", "rating"))
+
+    Rating.objects.all().delete()
+    call_command("import_ratings", str(output), stdout=StringIO())
+    assert (
+        set(Rating.objects.values_list("movielens_user_id", "movie", "rating"))
+        == expected
+    )
+
+
+@pytest.mark.django_db
+def test_export_tags_parquet(tmp_path, tag):
+    pq = pytest.importorskip("pyarrow.parquet")
+    tag, movie, _ = tag
+    output = tmp_path / "tags.parquet"
+    call_command(
+        "export_movies", "--dataset", "tags", "-o", str(output), stdout=StringIO()
+    )
+    table = pq.read_table(output)
+    assert table.column_names == ["userId", "movieId", "tag", "timestamp"]
+    assert table.to_pylist()[0]["tag"] == tag.text
+
+
+@pytest.mark.django_db
+def test_benchmark_serializers(tag):
+    out = StringIO()
+    call_command(
+        "benchmark_serializers",
+        "--page-size",
+        "10",
+        "--repeat",
+        "1",
+        "--json",
+        stdout=out,
+    )
+    results = json.loads(out.getvalue())
+    assert [(r["serializer"], r["rows"]) for r in results] == [
+        ("MovieSerializer", 1),
+        ("TagSerializer", 1),
+    ]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_generate_dataset():
+    options = ["--movies", "50", "--ratings", "2000", "--tags", "100", "--users", "100"]
+    call_command("generate_dataset", *options, stdout=StringIO())
+
+    assert Movie.objects.count() == 50
+    assert Rating.objects.count() == 2000
+    assert Tag.objects.count() == 100
+    assert sum(MovieTagCount.objects.values_list("count", flat=True)) == 100
+    movie = Movie.objects.order_by("-rating_count").first()
+    assert movie.rating_count == Rating.objects.filter(movie=movie).count()
+    ratings = list(
+        Rating.objects.order_by("movielens_user_id", "movie").values_list(
+            "movielens_user_id", "movie", "rating", "timestamp"
+        )[:20]
+    )
+
+    with pytest.raises(CommandError):
+        call_command("generate_dataset", *options, stdout=StringIO())
+    call_command("generate_dataset", *options, "--flush", stdout=StringIO())
+    assert (
+        list(
+            Rating.objects.order_by("movielens_user_id", "movie").values_list(
+                "movielens_user_id", "movie", "rating", "timestamp"
+            )[:20]
+        )
+        == ratings
+    )
+
+
+@pytest.mark.django_db
+def test_generate_dataset_csv(tmp_path, movies):
+    call_command(
+        "generate_dataset",
+        *["--movies", "2", "--ratings", "30", "--tags", "5", "--users", "30"],
+        "--output-dir",
+        str(tmp_path),
+        stdout=StringIO(),
+    )
+    call_command("import_ratings", str(tmp_path / "ratings.csv"), stdout=StringIO())
+    call_command("import_tags", str(tmp_path / "tags.csv"), stdout=StringIO())
+
+    assert Rating.objects.count() == 30
+    assert Tag.objects.count() == 5
+
+
+@pytest.mark.django_db
+def test_benchmark(movies):
+    Rating.objects.create(movie=movies[0], movielens_user_id=1, rating=4.0)
+    out = StringIO()
+    call_command(
+        "benchmark",
+        *["--scenario", "movie_detail", "--scenario", "import_ratings"],
+        *["--requests", "3", "--import-rows", "200"],
+        stdout=out,
+    )
+
+    report = json.loads(out.getvalue())
+    detail = report["scenarios"]["movie_detail"]
+    assert (detail["requests"], detail["errors"]) == (3, 0)
+    assert detail["queries_per_request"] >= 1
+    assert report["scenarios"]["import_ratings"]["rows"] == 200
+    # The import is rolled back.
+    assert Rating.objects.count() == 1
@@ -0,0 +1,28 @@
+import logging
+import pytest
+
+
+@pytest.mark.django_db
+def test_metrics_endpoint(client, movies):
+    client.get("/api/movies/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    body = response.content.decode()
+    assert (
+        'movielens_request_db_queries_bucket{view="movie-list",method="GET",le="3"}'
+        in body
+    )
+    assert (
+        'movielens_request_duration_seconds_count{view="movie-list",method="GET"}'
+        in body
+    )
+    assert 'movielens_response_cache_total{result="misses"} 1' in body
+
+
+@pytest.mark.django_db
+def test_request_over_query_budget_is_logged(client, movies, settings, caplog):
+    settings.REQUEST_QUERY_BUDGET = 1
+    with caplog.at_level(logging.WARNING, logger="movies.middleware"):
+        client.get("/api/movies/")
+    assert "GET /api/movies/ over budget: 3 queries" in caplog.text
+    assert 'FROM "movies_movietagcount"' in caplog.text
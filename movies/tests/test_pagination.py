@@ -0,0 +1,108 @@
+import json
+from base64 import urlsafe_b64encode
+
+import pytest
+from datetime import datetime, timezone
+from movies.models import Movie, Rating, Tag
+
+
+def walk(client, url):
+    pages = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        pages.append(response.data)
+        url = response.data["next"]
+    return pages
+
+
+@pytest.mark.django_db
+def test_movie_keyset_pagination(client):
+    for movie_id in range(1, 6):
+        Movie.objects.create(
+            movielens_id=movie_id, title=f"Movie {movie_id % 2}", genres=[]
+        )
+
+    pages = walk(client, "/api/movies/?limit=2")
+    assert [[m["movieId"] for m in page["results"]] for page in pages] == [
+        [1, 2],
+        [3, 4],
+        [5],
+    ]
+    assert pages[0]["count"] == 5
+    assert pages[0]["previous"] is None
+
+    response = client.get(pages[2]["previous"])
+    assert [m["movieId"] for m in response.data["results"]] == [3, 4]
+
+    # Titles are not unique, the primary key breaks the ties.
+    pages = walk(client, "/api/movies/?limit=2&ordering=-title")
+    assert [m["movieId"] for page in pages for m in page["results"]] == [
+        5,
+        3,
+        1,
+        4,
+        2,
+    ]
+
+
+@pytest.mark.django_db
+def test_keyset_pagination_without_count(client, movies):
+    response = client.get("/api/movies/?limit=1&count=false")
+    assert "count" not in response.data
+    response = client.get(response.data["next"])
+    assert "count" not in response.data
+    assert response.data["results"][0]["movieId"] == 2
+
+
+@pytest.mark.django_db
+def test_rating_keyset_pagination_on_timestamp(client, movies):
+    movie1, movie2 = movies
+    timestamp = datetime(2006, 5, 17, 12, 27, 8, 123456, tzinfo=timezone.utc)
+    for user_id in range(1, 4):
+        Rating.objects.create(movie=movie1, movielens_user_id=user_id, rating=3.0)
+        Rating.objects.create(movie=movie2, movielens_user_id=user_id, rating=4.0)
+    Rating.objects.update(timestamp=timestamp)
+    Rating.objects.filter(movielens_user_id=1).update(
+        timestamp=timestamp.replace(microsecond=0)
+    )
+
+    pages = walk(client, "/api/ratings/?limit=4")
+    ratings = [(r["userId"], r["movieId"]) for page in pages for r in page["results"]]
+    assert len(pages) == 2
+    assert ratings[:2] == [(1, 1), (1, 2)]
+    assert sorted(ratings) == sorted(
+        Rating.objects.values_list("movielens_user_id", "movie_id")
+    )
+
+
+@pytest.mark.django_db
+def test_keyset_pagination_invalid_cursor(client, tag):
+    response = client.get("/api/tags/?cursor=garbage")
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "cursor", [{"k": ["abc"]}, {"k": [[1]]}, {"k": ["Movie", "x"]}]
+)
+def test_keyset_pagination_tampered_cursor(client, movies, cursor):
+    encoded = urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+    ordering = "&ordering=title" if len(cursor["k"]) == 2 else ""
+    response = client.get(f"/api/movies/?cursor={encoded}{ordering}")
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_keyset_pagination_cursor_on_timestamp(client, movies):
+    cursor = {"k": ["not a timestamp", 1]}
+    encoded = urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+    response = client.get(f"/api/ratings/?cursor={encoded}")
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_keyset_pagination_mixed_ordering(client, movies):
+    response = client.get("/api/movies/?ordering=title,-title")
+    assert response.status_code == 400
+    assert "ordering" in response.data
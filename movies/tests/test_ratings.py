@@ -0,0 +1,49 @@
+import threading
+import time
+
+import pytest
+from django.db import connection, transaction
+from django.utils import timezone
+from movies import ratings
+from movies.models import Movie
+
+
+def write_in_thread(rows, on_conflict, written=None, release=None):
+    def write():
+        try:
+            with transaction.atomic():
+                ratings.write_ratings(rows, on_conflict=on_conflict)
+                if written is not None:
+                    written.set()
+                if release is not None:
+                    release.wait(5)
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    return thread
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.parametrize("existing", [True, False])
+def test_concurrent_updates_keep_aggregates(movies, existing):
+    movie, _ = movies
+    if existing:
+        ratings.write_ratings([(1, movie.pk, 3.0, timezone.now())])
+
+    # The first write holds its transaction open while the second one waits
+    # on the same rating, then has to take the committed value into account.
+    written, release = threading.Event(), threading.Event()
+    first = write_in_thread(
+        [(1, movie.pk, 5.0, timezone.now())], "update", written, release
+    )
+    assert written.wait(5)
+    second = write_in_thread([(1, movie.pk, 4.0, timezone.now())], "update")
+    time.sleep(0.2)
+    release.set()
+    first.join()
+    second.join()
+
+    movie = Movie.objects.get(pk=movie.pk)
+    assert (movie.rating_count, movie.rating_sum) == (1, 4.0)
@@ -0,0 +1,83 @@
+import os
+import pytest
+from io import StringIO
+from django.core.management import call_command
+from movies.models import Movie, Rating
+from movies.recommendations import get_model
+
+
+@pytest.fixture
+def similarity_model(settings, tmp_path, movies):
+    settings.SIMILARITY_MODEL_DIR = str(tmp_path / "similarity")
+    movie1, movie2 = movies
+    movie3 = Movie.objects.create(
+        movielens_id=3, title="Test Movie 3 (1997)", genres=["Horror"]
+    )
+    ratings = {
+        1: {movie1: 5.0, movie2: 5.0, movie3: 1.0},
+        2: {movie1: 4.0, movie2: 5.0, movie3: 2.0},
+        3: {movie1: 1.0, movie2: 2.0, movie3: 5.0},
+        4: {movie1: 5.0, movie3: 1.0},
+    }
+    for user_id, user_ratings in ratings.items():
+        for movie, rating in user_ratings.items():
+            Rating.objects.create(movie=movie, movielens_user_id=user_id, rating=rating)
+    call_command("build_similarity_model", top_k=2, stdout=StringIO())
+    return movie1, movie2, movie3
+
+
+@pytest.mark.django_db
+def test_similar_movies_view(client, similarity_model):
+    movie1, movie2, _ = similarity_model
+    response = client.get(f"/api/movies/{movie1.movielens_id}/similar/")
+    assert response.status_code == 200
+    assert [movie["movieId"] for movie in response.data] == [movie2.movielens_id]
+    assert 0 < response.data[0]["similarity"] <= 1
+    assert response.data[0]["title"] == movie2.title
+
+
+@pytest.mark.django_db
+def test_user_recommendations_view(client, similarity_model):
+    _, movie2, _ = similarity_model
+    response = client.get("/api/users/4/recommendations/")
+    assert response.status_code == 200
+    assert [movie["movieId"] for movie in response.data] == [movie2.movielens_id]
+    assert response.data[0]["predicted_rating"] == 5.0
+
+    response = client.get("/api/users/99/recommendations/")
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_recommendations_without_model(client, settings, tmp_path, movies):
+    settings.SIMILARITY_MODEL_DIR = str(tmp_path / "missing")
+    movie1, _ = movies
+    response = client.get(f"/api/movies/{movie1.movielens_id}/similar/")
+    assert response.status_code == 503
+
+    response = client.get("/api/movies/99999/similar/")
+    assert response.status_code == 404
+
+
+@pytest.mark.django_db
+def test_rebuild_switches_model(settings, similarity_model):
+    movie1, movie2, _ = similarity_model
+    first = get_model()
+
+    for _ in range(2):
+        call_command("build_similarity_model", top_k=1, stdout=StringIO())
+    model = get_model()
+    assert model is not first
+    assert model.neighbors.shape[1] == 1
+    assert [movie for movie, _ in model.similar(movie1.movielens_id)] == [
+        movie2.movielens_id
+    ]
+    # The current model and the one before it are kept.
+    directories = [
+        name
+        for name in os.listdir(settings.SIMILARITY_MODEL_DIR)
+        if name.startswith("model-")
+    ]
+    assert len(directories) == 2
+    assert os.path.basename(model.path) in directories
+    assert os.path.basename(first.path) not in directories
@@ -1,5 +1,8 @@
 import pytest
-from movies.serializers import MovieSerializer, RatingSerializer
+from rest_framework.renderers import JSONRenderer
+from movies.models import Movie, Tag, TagTerm
+from movies.renderers import FastJSONRenderer
+from movies.serializers import MovieSerializer, RatingSerializer, TagSerializer
 
 
 @pytest.mark.django_db
@@ -36,3 +39,31 @@ def test_rating_serializer(movies):
     rating_data = RatingSerializer(rating).data
     assert rating_data["userId"] == 1
     assert rating_data["rating"] == 5.0
+
+
+@pytest.mark.django_db
+def test_represent_values_matches_serializers(movies, django_assert_num_queries):
+    movie1, movie2 = movies
+    Movie.objects.filter(pk=movie1.pk).update(rating_count=3, rating_sum=10.0)
+    Movie.objects.create(movielens_id=3, title="Amélie\u2028(2001)", genres=[])
+    Tag.objects.create(movie=movie1, movielens_user_id=1, text="zany")
+    Tag.objects.create(movie=movie1, movielens_user_id=2, text="Zany")
+    Tag.objects.create(movie=movie1, movielens_user_id=3, text="zany")
+    Tag.objects.create(movie=movie2, movielens_user_id=1, text="été")
+
+    # The prefetch of MovieViewSet, which get_tags() reads from.
+    movies = Movie.objects.prefetch_related("tag_counts__term").order_by("movielens_id")
+    tags = {}
+    for tag in Tag.objects.all():
+        tags.setdefault(tag.movie_id, set()).add(tag.text)
+    rows = movies.prefetch_related(None).values(*MovieSerializer.values_fields)
+    with django_assert_num_queries(3):
+        expected = MovieSerializer(movies, many=True).data
+    assert MovieSerializer.represent_values(rows, tags) == expected
+    assert FastJSONRenderer().render(expected) == JSONRenderer().render(expected)
+
+    tag_rows = Tag.objects.order_by("id").values(*TagSerializer.values_fields)
+    expected = TagSerializer(Tag.objects.order_by("id"), many=True).data
+    terms = dict(TagTerm.objects.values_list("pk", "text"))
+    assert TagSerializer.represent_values(tag_rows, terms) == expected
+    assert FastJSONRenderer().render(expected) == JSONRenderer().render(expected)
@@ -1,9 +1,28 @@
+import json
+from datetime import timedelta
+from io import StringIO
 import pytest
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import FieldError
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
-from movies.models import Movie, Rating, Tag
+from movies.models import (
+    Job,
+    JobStatus,
+    Movie,
+    MovieTagCount,
+    Rating,
+    RatingEvent,
+    Tag,
+    get_genre_mask,
+)
 
 
 @pytest.mark.django_db
@@ -22,6 +41,47 @@ def test_movie_genre_filter_view(client, movies):
     assert len(response.data["results"]) == 1
 
 
+@pytest.mark.django_db
+def test_movie_genres_filter_view(client, movies):
+    movie1, movie2 = movies
+
+    def get_ids(query):
+        response = client.get(f"/api/movies/?{query}")
+        assert response.status_code == 200
+        return [m["movieId"] for m in response.data["results"]]
+
+    assert get_ids("genre=Action,Comedy") == [1]
+    assert get_ids("genre=Comedy,Drama") == []
+    assert get_ids("genre=Comedy,Drama&match=any") == [1, 2]
+
+    # The mask follows the genres on save, which does not bump the cached
+    # lists by itself.
+    movie2.genres = ["Comedy", "Drama"]
+    movie2.save(update_fields=["genres"])
+    cache.clear()
+    assert get_ids("genre=Comedy,Drama") == [2]
+
+    response = client.get("/api/movies/?genre=Comedy,Jazz")
+    assert response.status_code == 400
+    assert "genre" in response.data
+    response = client.get("/api/movies/?genre=Comedy&match=some")
+    assert response.status_code == 400
+    assert "match" in response.data
+
+
+@pytest.mark.django_db
+def test_genre_mask_follows_queryset_updates(movies):
+    movie1, movie2 = movies
+    Movie.objects.filter(pk=movie1.pk).update(genres=["Drama"])
+    movie2.genres = ["Comedy"]
+    Movie.objects.bulk_update([movie2], ["genres"])
+    masks = dict(Movie.objects.values_list("pk", "genre_mask"))
+    assert masks == {1: get_genre_mask(["Drama"]), 2: get_genre_mask(["Comedy"])}
+
+    with pytest.raises(FieldError):
+        Movie.objects.update(genres=F("genres"))
+
+
 @pytest.mark.django_db
 def test_movie_tag_filter_view_null(client, movies, tag):
     response = client.get(f"/api/movies/?tag=empty")
@@ -172,3 +232,514 @@ def test_create_tag(client, user, movies):
 
     response = client.post(url, data, format="json")
     assert response.status_code == status.HTTP_201_CREATED
+    assert response.data["text"] == "test tag"
+
+    response = client.post(url, {**data, "text": " TEST tag"}, format="json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert "non_field_errors" in response.data
+
+
+def tag_counts():
+    return set(MovieTagCount.objects.values_list("movie_id", "term__text", "count"))
+
+
+@pytest.mark.django_db
+def test_update_tag_text(client, user, movies):
+    movie, _ = movies
+    tag = Tag.objects.create(movie=movie, movielens_user_id=1, text="heist")
+    Tag.objects.create(movie=movie, movielens_user_id=2, text="heist")
+    Tag.objects.create(movie=movie, movielens_user_id=1, text="caper")
+    client.force_login(user=user)
+
+    response = client.patch(
+        f"/api/tags/{tag.pk}/", {"text": " Caper Film"}, content_type="application/json"
+    )
+    assert response.status_code == 200
+    assert response.data["text"] == "caper film"
+    assert Tag.objects.get(pk=tag.pk).text == "caper film"
+    assert tag_counts() == {(1, "heist", 1), (1, "caper", 1), (1, "caper film", 1)}
+
+    response = client.patch(
+        f"/api/tags/{tag.pk}/", {"text": "CAPER"}, content_type="application/json"
+    )
+    assert response.status_code == 400
+    assert "non_field_errors" in response.data
+    assert tag_counts() == {(1, "heist", 1), (1, "caper", 1), (1, "caper film", 1)}
+
+
+@pytest.mark.django_db
+def test_update_tag_movie(client, user, movies):
+    movie1, movie2 = movies
+    tag = Tag.objects.create(movie=movie1, movielens_user_id=1, text="heist")
+    client.force_login(user=user)
+
+    response = client.patch(
+        f"/api/tags/{tag.pk}/",
+        {"movieId": movie2.movielens_id},
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+    assert tag_counts() == {(2, "heist", 1)}
+    assert client.get(f"/api/movies/{movie2.pk}/").data["tags"] == "heist"
+    response = client.get("/api/movies/?search=heist")
+    assert [m["movieId"] for m in response.data["results"]] == [2]
+
+    response = client.patch(
+        f"/api/tags/{tag.pk}/", {"movieId": 99}, content_type="application/json"
+    )
+    assert response.status_code == 400
+    assert client.delete(f"/api/tags/{tag.pk}/").status_code == 204
+    assert tag_counts() == set()
+
+
+@pytest.mark.django_db
+def test_movie_tag_cloud(client, movies):
+    movie, other = movies
+    for user_id, text in [(1, "Pixar"), (2, "pixar"), (3, "funny"), (1, "funny")]:
+        Tag.objects.create(movie=movie, movielens_user_id=user_id, text=text)
+    Tag.objects.create(movie=movie, movielens_user_id=4, text="toys")
+    Tag.objects.create(movie=other, movielens_user_id=1, text="pixar")
+
+    response = client.get(f"/api/movies/{movie.movielens_id}/tag-cloud/")
+    assert response.status_code == 200
+    assert response.json() == [
+        {"text": "funny", "count": 2, "weight": 1.0},
+        {"text": "pixar", "count": 2, "weight": 1.0},
+        {"text": "toys", "count": 1, "weight": 0.5},
+    ]
+    response = client.get(f"/api/movies/{movie.movielens_id}/tag-cloud/?limit=1")
+    assert [tag["text"] for tag in response.json()] == ["funny"]
+
+    Tag.objects.filter(movie=movie, movielens_user_id=4).delete()
+    response = client.get(f"/api/movies/{movie.movielens_id}/tag-cloud/")
+    assert [tag["text"] for tag in response.json()] == ["funny", "pixar"]
+    assert client.get("/api/movies/999/tag-cloud/").status_code == 404
+
+
+@pytest.mark.django_db
+def test_create_rating_updates_average(client, user, movies):
+    movie, _ = movies
+    client.force_login(user=user)
+    url = reverse("movie-rate-movie", kwargs={"movielens_id": movie.movielens_id})
+
+    client.post(url, {"userId": 1, "rating": 3.0}, format="json")
+    client.post(url, {"userId": 2, "rating": 4.5}, format="json")
+
+    movie.refresh_from_db()
+    assert movie.rating_count == 2
+    assert movie.rating_sum == 7.5
+
+    response = client.get(f"/api/movies/{movie.movielens_id}/")
+    assert response.data["average_rating"] == 3.75
+
+
+@pytest.mark.django_db
+def test_top_rated_view(client, movies):
+    movie1, movie2 = movies
+    for user_id, (rating1, rating2) in enumerate([(5.0, 4.0), (4.0, 4.0), (4.5, 3.0)]):
+        Rating.objects.create(movie=movie1, movielens_user_id=user_id, rating=rating1)
+        Rating.objects.create(movie=movie2, movielens_user_id=user_id, rating=rating2)
+    Rating.objects.create(movie=movie2, movielens_user_id=9, rating=2.0)
+    call_command("refresh_rating_aggregates")
+
+    response = client.get("/api/movies/top/?min_votes=1")
+    assert response.status_code == 200
+    assert [m["movieId"] for m in response.data["results"]] == [1, 2]
+    assert response.data["results"][0]["average_rating"] == 4.5
+    assert response.data["results"][0]["rating_count"] == 3
+
+    response = client.get("/api/movies/top/?min_votes=4")
+    assert [m["movieId"] for m in response.data["results"]] == [2]
+
+    response = client.get("/api/movies/top/?min_votes=1&genre=Drama")
+    assert [m["movieId"] for m in response.data["results"]] == [2]
+
+    response = client.get("/api/movies/most-rated/")
+    assert [m["movieId"] for m in response.data["results"]] == [2, 1]
+
+
+@pytest.mark.django_db
+def test_movie_facets_view(client, movies):
+    movie1, movie2 = movies
+    Rating.objects.create(movie=movie1, movielens_user_id=1, rating=4.0)
+    Rating.objects.create(movie=movie2, movielens_user_id=1, rating=3.0)
+    Rating.objects.create(movie=movie2, movielens_user_id=2, rating=2.0)
+    call_command("refresh_rating_aggregates")
+
+    response = client.get("/api/movies/facets/")
+    assert response.status_code == 200
+    assert response.data["count"] == 2
+    facets = response.data["genres"]
+    assert facets[:3] == [
+        {"genre": "Action", "count": 2, "rating_count": 3, "average_rating": 3.0},
+        {"genre": "Comedy", "count": 1, "rating_count": 1, "average_rating": 4.0},
+        {"genre": "Drama", "count": 1, "rating_count": 2, "average_rating": 2.5},
+    ]
+    assert len(facets) == 19
+    assert facets[-1]["count"] == 0 and facets[-1]["average_rating"] is None
+
+    response = client.get("/api/movies/facets/?genre=Drama")
+    assert response.data["count"] == 1
+    assert [f["genre"] for f in response.data["genres"] if f["count"]] == [
+        "Action",
+        "Drama",
+    ]
+
+
+@pytest.mark.django_db
+def test_movie_tag_filter_view_distinct(client, movies):
+    movie, _ = movies
+    Tag.objects.create(movie=movie, movielens_user_id=1, text="Dark comedy")
+    Tag.objects.create(movie=movie, movielens_user_id=2, text="dark hero")
+    response = client.get("/api/movies/?tag=DARK")
+    assert response.status_code == 200
+    assert response.data["count"] == 1
+    assert [m["movieId"] for m in response.data["results"]] == [movie.movielens_id]
+
+
+@pytest.mark.django_db
+def test_movie_search_view(client, user, movies):
+    movie1, movie2 = movies
+    client.force_login(user=user)
+    client.post(
+        reverse("tag-list"),
+        {"userId": 1, "movieId": movie2.movielens_id, "text": "heist"},
+        format="json",
+    )
+    client.patch(
+        f"/api/movies/{movie1.movielens_id}/",
+        {"title": "Heist (2001)"},
+        content_type="application/json",
+    )
+
+    response = client.get("/api/movies/?search=heists")
+    assert response.status_code == 200
+    # A title match ranks above a tag match.
+    assert [m["movieId"] for m in response.data["results"]] == [1, 2]
+
+    response = client.get("/api/movies/?search=heist&limit=1")
+    assert [m["movieId"] for m in response.data["results"]] == [1]
+    response = client.get(response.data["next"])
+    assert [m["movieId"] for m in response.data["results"]] == [2]
+    assert response.data["next"] is None
+
+    response = client.get("/api/movies/?search=casino")
+    assert response.data["results"] == []
+
+
+@pytest.mark.django_db
+def test_movie_detail_view_cache(client, user, movies):
+    movie, _ = movies
+    url = f"/api/movies/{movie.movielens_id}/"
+
+    response = client.get(url)
+    etag = response["ETag"]
+    assert client.get(url).data == response.data
+    assert client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+    assert client.get("/api/movies/cache-stats/").data == {
+        "hits": 1,
+        "misses": 1,
+        "not_modified": 1,
+    }
+
+    # Rating the movie invalidates its detail and every list page.
+    list_etag = client.get("/api/movies/")["ETag"]
+    client.force_login(user=user)
+    client.post(
+        reverse("movie-rate-movie", kwargs={"movielens_id": movie.movielens_id}),
+        {"userId": 1, "rating": 4.0},
+        format="json",
+    )
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response.data["average_rating"] == 4.0
+    assert client.get("/api/movies/", HTTP_IF_NONE_MATCH=list_etag).status_code == 200
+
+
+@pytest.mark.django_db
+def test_movie_detail_view_cache_is_per_movie(client, user, movies):
+    movie1, movie2 = movies
+    etag = client.get(f"/api/movies/{movie2.movielens_id}/")["ETag"]
+    client.force_login(user=user)
+    client.patch(
+        f"/api/movies/{movie1.movielens_id}/",
+        {"title": "New Title"},
+        content_type="application/json",
+    )
+    response = client.get(
+        f"/api/movies/{movie2.movielens_id}/", HTTP_IF_NONE_MATCH=etag
+    )
+    assert response.status_code == 304
+
+
+@pytest.mark.django_db
+def test_tag_update_invalidates_movies(client, user, movies):
+    movie1, movie2 = movies
+    client.force_login(user=user)
+    client.post(
+        reverse("tag-list"),
+        {"userId": 1, "movieId": movie1.movielens_id, "text": "heist"},
+        format="json",
+    )
+    tag = Tag.objects.get()
+    etags = [client.get(f"/api/movies/{movie.pk}/")["ETag"] for movie in movies]
+
+    response = client.patch(
+        f"/api/tags/{tag.pk}/",
+        {"movieId": movie2.movielens_id},
+        content_type="application/json",
+    )
+    assert response.status_code == 200
+    # Both movies changed, neither is served from the cache.
+    for movie, etag in zip(movies, etags):
+        response = client.get(f"/api/movies/{movie.pk}/", HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("page_size", [1, 10])
+def test_movie_list_view_query_count(client, django_assert_num_queries, page_size):
+    for movie_id in range(1, 11):
+        movie = Movie.objects.create(movielens_id=movie_id, title="Movie", genres=[])
+        for user_id in range(3):
+            Tag.objects.create(
+                movie=movie, movielens_user_id=user_id, text=f"tag {user_id}"
+            )
+
+    # count, page and tag prefetch, whatever the page size
+    with django_assert_num_queries(3):
+        response = client.get(f"/api/movies/?limit={page_size}")
+    assert len(response.data["results"]) == page_size
+    assert response.data["results"][0]["tags"] == "tag 0, tag 1, tag 2"
+
+
+@pytest.mark.django_db
+def test_also_rated_view(client, user, movies):
+    movie1, movie2 = movies
+    client.force_login(user=user)
+    for movie in movies:
+        url = reverse("movie-rate-movie", kwargs={"movielens_id": movie.movielens_id})
+        client.post(url, {"userId": 1, "rating": 4.0}, format="json")
+    call_command("fold_cooccurrence", "--once", stdout=StringIO())
+
+    response = client.get(f"/api/movies/{movie1.movielens_id}/also-rated/")
+    assert response.status_code == 200
+    assert response.data == [
+        {
+            "movieId": movie2.movielens_id,
+            "title": movie2.title,
+            "genres": "Action|Drama",
+            "count": 1,
+            "link": f"https://movielens.org/movies/{movie2.movielens_id}",
+        }
+    ]
+    assert client.get("/api/movies/99999/also-rated/").status_code == 404
+
+
+@pytest.mark.django_db
+def test_bulk_ratings_view(client, user, movies):
+    movie1, movie2 = movies
+    client.force_login(user=user)
+    Rating.objects.create(movie=movie1, movielens_user_id=1, rating=1.0)
+    Movie.objects.refresh_rating_aggregates()
+    payload = [
+        {"userId": 1, "movieId": 1, "rating": 3.0},
+        {"userId": 1, "movieId": 2, "rating": 4.0},
+        {"userId": 2, "movieId": 1, "rating": 5.0, "timestamp": "2006-05-17T12:27:08Z"},
+        {"userId": 2, "movieId": 1, "rating": 2.0},
+        {"userId": 3, "movieId": 999, "rating": 2.0},
+        {"userId": 3, "movieId": 2, "rating": 7.0},
+    ]
+
+    response = client.post(
+        "/api/ratings/bulk/", payload, content_type="application/json"
+    )
+    assert response.status_code == 200
+    assert [result["status"] for result in response.data["results"]] == [
+        "duplicate",
+        "created",
+        "created",
+        "invalid",
+        "invalid",
+        "invalid",
+    ]
+    assert response.data["created"] == 2 and response.data["invalid"] == 3
+    assert "rating" in response.data["results"][5]["errors"]
+    movie1.refresh_from_db()
+    assert (movie1.rating_count, movie1.rating_sum) == (2, 6.0)
+
+    response = client.post(
+        "/api/ratings/bulk/?on_conflict=update",
+        payload[:1],
+        content_type="application/json",
+    )
+    assert response.data["results"][0]["status"] == "updated"
+    assert Rating.objects.get(movielens_user_id=1, movie=movie1).rating == 3.0
+    movie1.refresh_from_db()
+    assert (movie1.rating_count, movie1.rating_sum) == (2, 8.0)
+
+    response = client.post("/api/ratings/bulk/", {}, content_type="application/json")
+    assert response.status_code == 400
+
+
+@pytest.mark.django_db
+def test_user_ratings_view(client, movies):
+    movie1, movie2 = movies
+    Rating.objects.create(movie=movie2, movielens_user_id=7, rating=2.0)
+    Rating.objects.create(movie=movie1, movielens_user_id=7, rating=4.0)
+    Rating.objects.create(movie=movie1, movielens_user_id=8, rating=1.0)
+
+    response = client.get("/api/users/7/ratings/?limit=1")
+    assert response.status_code == 200
+    assert response.data["count"] == 2
+    assert [rating["movieId"] for rating in response.data["results"]] == [2]
+    response = client.get(response.data["next"])
+    assert [rating["movieId"] for rating in response.data["results"]] == [1]
+    assert response.data["next"] is None
+
+
+@pytest.mark.django_db
+def test_user_tags_view(client, tag):
+    tag, movie, _ = tag
+    response = client.get(f"/api/users/{tag.movielens_user_id}/tags/")
+    assert response.status_code == 200
+    assert [item["movieId"] for item in response.data["results"]] == [movie.pk]
+    assert response.data["results"][0]["text"] == tag.text
+
+
+@pytest.mark.django_db
+def test_user_ratings_export_view(client, movies):
+    movie1, movie2 = movies
+    Rating.objects.create(movie=movie1, movielens_user_id=7, rating=4.0)
+    Rating.objects.create(movie=movie2, movielens_user_id=7, rating=2.5)
+
+    response = client.get("/api/users/7/ratings/export/")
+    assert response.status_code == 200
+    assert response.streaming
+    assert response["Content-Type"] == "application/x-ndjson"
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [(r["movieId"], r["rating"]) for r in records] == [(1, 4.0), (2, 2.5)]
+    assert set(records[0]) == {"userId", "movieId", "rating", "timestamp"}
+
+
+@pytest.mark.django_db
+def test_movie_export_view(client, movies, tag):
+    movie1, _ = movies
+    _, _, user = tag
+    Rating.objects.create(movie=movie1, movielens_user_id=1, rating=4.0)
+    Movie.objects.refresh_rating_aggregates()
+
+    response = client.get("/api/movies/export/")
+    assert response.status_code == 200
+    assert response.streaming
+    records = [
+        json.loads(line)
+        for line in b"".join(response.streaming_content).decode().splitlines()
+    ]
+    assert [record["movieId"] for record in records] == [1, 2, 3]
+    assert records[0]["rating_count"] == 1 and records[2]["tags"] == ["test tag"]
+
+    etag = response["ETag"]
+    response = client.get("/api/movies/export/", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    client.force_login(user)
+    client.patch(
+        f"/api/movies/{movie1.movielens_id}/",
+        {"title": "Renamed"},
+        content_type="application/json",
+    )
+    response = client.get("/api/movies/export/?output=csv", HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response["Content-Type"].startswith("text/csv")
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    assert lines[0] == "movieId,title,genres,tags,rating_count,average_rating,link"
+    assert lines[1].startswith("1,Renamed,Action|Comedy,,1,4.0,")
+
+    assert client.get("/api/movies/export/?output=xml").status_code == 400
+
+
+@pytest.mark.django_db
+def test_rate_movie_on_conflict(client, user, movies):
+    movie, _ = movies
+    Tag.objects.create(movie=movie, movielens_user_id=1, text="funny")
+    client.force_login(user=user)
+    url = reverse("movie-rate-movie", kwargs={"movielens_id": movie.movielens_id})
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post(url, {"userId": 1, "rating": 3.0}, format="json")
+    assert response.status_code == status.HTTP_201_CREATED
+    # No tag prefetch, and the rating is written in a single statement.
+    assert not any("movies_tag" in query["sql"] for query in queries)
+    assert sum("movies_rating" in query["sql"] for query in queries) == 1
+
+    response = client.post(url, {"userId": 1, "rating": 5.0}, format="json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.data == {"non_field_errors": ["You have already rated this movie."]}
+
+    response = client.post(
+        f"{url}?on_conflict=update", {"userId": 1, "rating": 5.0}, format="json"
+    )
+    assert response.status_code == status.HTTP_200_OK
+    assert response.data["rating"] == 5.0
+    movie.refresh_from_db()
+    assert (movie.rating_count, movie.rating_sum) == (1, 5.0)
+    assert RatingEvent.objects.count() == 1
+
+    assert client.post(f"{url}?on_conflict=merge", {}).status_code == 400
+    missing = reverse("movie-rate-movie", kwargs={"movielens_id": 999})
+    assert client.post(missing, {"userId": 1, "rating": 3.0}).status_code == 404
+
+
+@pytest.mark.django_db
+def test_job_views(client, user):
+    client.force_login(user)
+    response = client.post("/api/jobs/", {"command": "refresh_rankings"})
+    assert response.status_code == 403
+
+    admin = User.objects.create_superuser(username="admin", password="12345")
+    client.force_login(admin)
+    response = client.post(
+        "/api/jobs/",
+        {"command": "import_ratings", "arguments": ["ratings.csv", "--workers", "4"]},
+        content_type="application/json",
+    )
+    assert response.status_code == 201
+    assert response.data["status"] == "queued"
+    assert response.data["eta_seconds"] is None
+    job_id = response.data["id"]
+
+    response = client.post(
+        "/api/jobs/",
+        {"command": "import_ratings", "arguments": ["--workers", "four"]},
+        content_type="application/json",
+    )
+    assert response.status_code == 400
+    assert "arguments" in response.data
+    response = client.post(
+        "/api/jobs/", {"command": "flush"}, content_type="application/json"
+    )
+    assert response.status_code == 400
+
+    Job.objects.create(
+        command="refresh_rankings",
+        status=JobStatus.RUNNING,
+        started_at=timezone.now() - timedelta(seconds=10),
+        rows_processed=1000,
+        progress=0.25,
+    )
+    response = client.get("/api/jobs/")
+    assert [job["command"] for job in response.data["results"]] == [
+        "refresh_rankings",
+        "import_ratings",
+    ]
+    running = response.data["results"][0]
+    assert running["rows_per_second"] == pytest.approx(100, rel=0.1)
+    assert running["eta_seconds"] == pytest.approx(30, rel=0.1)
+
+    response = client.delete(f"/api/jobs/{running['id']}/")
+    assert response.status_code == 409
+    response = client.delete(f"/api/jobs/{job_id}/")
+    assert response.status_code == 204
+    assert not Job.objects.filter(pk=job_id).exists()
@@ -1,9 +1,27 @@
+from django.urls import path
 from rest_framework.routers import DefaultRouter
 
-from .views import MovieViewSet, TagViewSet
+from . import async_views
+from .views import JobViewSet, MovieViewSet, RatingViewSet, TagViewSet, UserViewSet
 
 router = DefaultRouter()
 router.register(r"movies", MovieViewSet)
 router.register(r"tags", TagViewSet)
+router.register(r"ratings", RatingViewSet)
+router.register(r"users", UserViewSet, basename="user")
+router.register(r"jobs", JobViewSet)
 
-urlpatterns = router.urls
+urlpatterns = router.urls + [
+    path("async/movies/", async_views.movie_list, name="async-movie-list"),
+    path("async/movies/top/", async_views.top_rated, name="async-movie-top-rated"),
+    path(
+        "async/movies/<int:movielens_id>/",
+        async_views.movie_detail,
+        name="async-movie-detail",
+    ),
+    path(
+        "async/movies/<int:movielens_id>/similar/",
+        async_views.similar_movies,
+        name="async-movie-similar",
+    ),
+]
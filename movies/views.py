@@ -1,28 +1,252 @@
+import json
+from functools import partial
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.db.models import Exists, F, FloatField, OuterRef, Prefetch
+from django.db.models.functions import Cast
+from django.db.models.lookups import Exact, GreaterThan
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, NotFound, ValidationError
 from rest_framework.response import Response
 
-from rest_framework import viewsets, status
+from rest_framework import mixins, serializers, viewsets, status
 from rest_framework.filters import OrderingFilter
-from .models import Movie, Tag
-from .serializers import MovieSerializer, RatingSerializer, TagSerializer
+from rest_framework.permissions import IsAdminUser
+from . import cache, catalog, exports, ratings
+from .metrics import render_metrics
+from .models import (
+    GENRE_BITS,
+    SEARCH_CONFIG,
+    Job,
+    JobStatus,
+    Movie,
+    MovieCooccurrence,
+    MovieRanking,
+    MovieTagCount,
+    Rating,
+    Tag,
+    TagTerm,
+)
+from .recommendations import get_model
+from .serializers import (
+    AlsoRatedSerializer,
+    BulkRatingSerializer,
+    JobSerializer,
+    MovieRankingSerializer,
+    MovieSerializer,
+    RatingSerializer,
+    RecommendedMovieSerializer,
+    SimilarMovieSerializer,
+    TagCloudSerializer,
+    TagSerializer,
+)
+
+
+TOP_RATED_ORDERING = ("-average_rating", "-rating_count", "-movie_id")
+MOST_RATED_ORDERING = ("-rating_count", "-average_rating", "-movie_id")
+GENRE_MATCH_CHOICES = ("all", "any")
+EXPORT_CONTENT_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+class ModelNotBuilt(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The similarity model has not been built yet."
+    default_code = "model_not_built"
+
+
+class JobNotQueued(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Only queued jobs can be cancelled."
+    default_code = "job_not_queued"
+
+
+def get_similarity_model():
+    model = get_model()
+    if model is None:
+        raise ModelNotBuilt()
+    return model
+
+
+def get_limit(request, default=10, maximum=100):
+    try:
+        limit = int(request.query_params.get("limit", default))
+    except ValueError:
+        raise ValidationError({"limit": "A valid integer is required."})
+    return min(max(limit, 1), maximum)
+
+
+def filter_genres(queryset, query_params):
+    """Filter on ``?genre=A,B``, movies with all of them or ``?match=any``."""
+    genre_query = query_params.get("genre", None)
+    if not genre_query:
+        return queryset
+    match = query_params.get("match", "all")
+    if match not in GENRE_MATCH_CHOICES:
+        choices = ", ".join(GENRE_MATCH_CHOICES)
+        raise ValidationError({"match": f"Must be one of {choices}."})
+    mask = 0
+    for genre in genre_query.split(","):
+        if genre not in GENRE_BITS:
+            raise ValidationError({"genre": f'"{genre}" is not a valid genre.'})
+        mask |= GENRE_BITS[genre]
+    # A bit test on an integer column, much cheaper per row than a
+    # containment test on the genres array.
+    bits = F("genre_mask").bitand(mask)
+    if match == "all":
+        return queryset.filter(Exact(bits, mask))
+    return queryset.filter(GreaterThan(bits, 0))
+
+
+def filter_movies(queryset, query_params):
+    tag_query = query_params.get("tag", None)
+    search_query = query_params.get("search", None)
+    queryset = filter_genres(queryset, query_params)
+    if tag_query:
+        # The trigram index on the lower-cased terms finds the matching
+        # terms, then a semi-join on the per-movie counts returns each movie
+        # once, by integer term IDs.
+        terms = TagTerm.objects.filter(text__contains=TagTerm.normalize(tag_query))
+        queryset = queryset.filter(
+            Exists(MovieTagCount.objects.filter(movie=OuterRef("pk"), term__in=terms))
+        )
+    if search_query:
+        query = SearchQuery(search_query, config=SEARCH_CONFIG, search_type="websearch")
+        queryset = (
+            queryset.filter(search_vector=query)
+            # ts_rank returns a real; as a double its value survives the
+            # round trip through a pagination cursor exactly.
+            .annotate(
+                search_rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+            ).order_by("-search_rank", "-movielens_id")
+        )
+    return queryset
+
+
+def get_ranking_queryset(query_params, ordering, default_min_votes):
+    # Rankings come from a materialized view refreshed after imports, so
+    # these endpoints never aggregate over the Rating table.
+    try:
+        min_votes = int(query_params.get("min_votes", default_min_votes))
+    except ValueError:
+        raise ValidationError({"min_votes": "A valid integer is required."})
+    queryset = MovieRanking.objects.select_related("movie").filter(
+        rating_count__gte=min_votes
+    )
+    return filter_genres(queryset, query_params).order_by(*ordering)
+
+
+def get_on_conflict(request):
+    on_conflict = request.query_params.get("on_conflict", "ignore")
+    if on_conflict not in ratings.ON_CONFLICT_CHOICES:
+        choices = ", ".join(ratings.ON_CONFLICT_CHOICES)
+        raise ValidationError({"on_conflict": f"Must be one of {choices}."})
+    return on_conflict
+
+
+def get_existing_movie_id(movielens_id):
+    # Cheaper than get_object(), which would prefetch the tags too, and
+    # answered from the in-process catalog for the movies it knows.
+    try:
+        movie_id = int(movielens_id)
+    except ValueError:
+        raise NotFound()
+    if not catalog.movie_exists(movie_id):
+        raise NotFound()
+    return movie_id
+
+
+def get_scored_movies(scored, attribute):
+    # One query for the titles, the scores come from the in-memory model.
+    movies = Movie.objects.defer("search_vector").in_bulk(
+        [movie_id for movie_id, _ in scored]
+    )
+    return attach_scores(movies, scored, attribute)
+
+
+def get_tag_texts(movie_ids):
+    """Map each movie ID to the set of its tag texts, in one query."""
+    tags = {}
+    # A row per distinct tag of a movie, however many users gave it.
+    for movie_id, text in MovieTagCount.objects.filter(
+        movie_id__in=movie_ids
+    ).values_list("movie_id", "term__text"):
+        tags.setdefault(movie_id, set()).add(text)
+    return tags
+
+
+def get_term_texts(rows):
+    """Map the term IDs of tag rows to their text, in one query."""
+    return dict(
+        TagTerm.objects.filter(pk__in={row["term_id"] for row in rows}).values_list(
+            "pk", "text"
+        )
+    )
+
+
+def attach_scores(movies, scored, attribute):
+    results = []
+    for movie_id, score in scored:
+        movie = movies.get(movie_id)
+        if movie is not None:
+            setattr(movie, attribute, round(score, 4))
+            results.append(movie)
+    return results
 
 
 class MovieViewSet(viewsets.ModelViewSet):
-    queryset = Movie.objects.all().prefetch_related("tags").order_by("movielens_id")
+    queryset = (
+        Movie.objects.defer("search_vector")
+        .prefetch_related(
+            Prefetch(
+                "tag_counts",
+                queryset=MovieTagCount.objects.select_related("term").only(
+                    "movie", "term__text"
+                ),
+            )
+        )
+        .order_by("movielens_id")
+    )
     serializer_class = MovieSerializer
     filter_backends = [OrderingFilter]
     ordering_fields = ["title"]
     lookup_field = "movielens_id"
 
+    def list(self, request, *args, **kwargs):
+        return cache.cached_response(
+            request,
+            cache.list_cache_key(request),
+            partial(self.list_values, request),
+        )
+
+    def list_values(self, request):
+        # Pages are read as .values() rows and represented without the
+        # serializer fields, the payload is the same as MovieSerializer's.
+        queryset = self.filter_queryset(self.get_queryset())
+        fields = [*MovieSerializer.values_fields, *queryset.query.annotations]
+        page = self.paginate_queryset(queryset.prefetch_related(None).values(*fields))
+        tags = get_tag_texts([row["movielens_id"] for row in page])
+        return self.get_paginated_response(MovieSerializer.represent_values(page, tags))
+
+    def retrieve(self, request, *args, **kwargs):
+        return cache.cached_response(
+            request,
+            cache.movie_cache_key(request, kwargs[self.lookup_field]),
+            partial(super().retrieve, request, *args, **kwargs),
+        )
+
+    def perform_destroy(self, instance):
+        movie_id = instance.pk
+        instance.delete()
+        cache.invalidate_movies(movie_id)
+
     def get_queryset(self):
-        queryset = super().get_queryset()
-        genre_query = self.request.query_params.get("genre", None)
-        tag_query = self.request.query_params.get("tag", None)
-        if genre_query:
-            queryset = queryset.filter(genres__contains=[genre_query])
-        if tag_query:
-            queryset = queryset.filter(tags__text__icontains=tag_query)
-        return queryset
+        return filter_movies(super().get_queryset(), self.request.query_params)
 
     @action(
         detail=True,
@@ -31,7 +255,14 @@ class MovieViewSet(viewsets.ModelViewSet):
         serializer_class=RatingSerializer,
     )
     def rate_movie(self, request, movielens_id=None):
-        movie = self.get_object()
+        """Rate a movie, once per user unless ``?on_conflict=update``.
+
+        Skips get_object(), which would prefetch every tag of the movie:
+        the rating is written with a single INSERT ... ON CONFLICT, after
+        locking the existing rating when updating.
+        """
+        on_conflict = get_on_conflict(request)
+        movie_id = get_existing_movie_id(movielens_id)
         user_id = request.data.get("userId")
         rating_value = request.data.get("rating")
         timestamp = request.data.get("timestamp")
@@ -40,13 +271,360 @@ class MovieViewSet(viewsets.ModelViewSet):
             "rating": rating_value,
             "timestamp": timestamp,
         }
-        serializer = self.get_serializer(data=data, context={"movie": movie})
+        serializer = self.get_serializer(
+            data=data, context={"movie_id": movie_id, "on_conflict": on_conflict}
+        )
         if serializer.is_valid(raise_exception=True):
             serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            if serializer.created:
+                return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(
+        detail=True,
+        url_path="similar",
+        serializer_class=SimilarMovieSerializer,
+    )
+    def similar(self, request, movielens_id=None):
+        # Served from the precomputed top-K neighbours, without touching the
+        # Rating table.
+        movie_id = get_existing_movie_id(movielens_id)
+        model = get_similarity_model()
+        scored = model.similar(movie_id, limit=get_limit(request))
+        movies = get_scored_movies(scored, "similarity")
+        return Response(self.get_serializer(movies, many=True).data)
+
+    @action(
+        detail=True,
+        url_path="also-rated",
+        serializer_class=AlsoRatedSerializer,
+    )
+    def also_rated(self, request, movielens_id=None):
+        # Read from the co-occurrence table kept up to date by
+        # fold_cooccurrence instead of self-joining the Rating table.
+        movie_id = get_existing_movie_id(movielens_id)
+        limit = get_limit(request, maximum=settings.COOCCURRENCE_TOP_K)
+        queryset = (
+            MovieCooccurrence.objects.filter(movie_id=movie_id)
+            .select_related("other")
+            .only("count", "other__title", "other__genres")
+            .order_by("-count", "other_id")[:limit]
+        )
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    @action(
+        detail=True,
+        url_path="tag-cloud",
+        serializer_class=TagCloudSerializer,
+    )
+    def tag_cloud(self, request, movielens_id=None):
+        """The movie's most used tags, weighted relative to the first one.
+
+        Read from the per-movie tag counts, without touching the Tag table.
+        """
+        movie_id = get_existing_movie_id(movielens_id)
+        limit = get_limit(request, default=50, maximum=500)
+        counts = list(
+            MovieTagCount.objects.filter(movie_id=movie_id)
+            .select_related("term")
+            .order_by("-count", "term__text")[:limit]
+        )
+        max_count = counts[0].count if counts else 1
+        serializer = self.get_serializer(
+            counts, many=True, context={"max_count": max_count}
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, url_path="export", pagination_class=None)
+    def export(self, request):
+        """Stream the whole catalog with genres, tags and rating aggregates.
+
+        ``?output=csv`` or ``ndjson`` (the default) picks the format, since
+        ``?format`` selects the API renderer. The ETag follows the catalog
+        version, so an unchanged catalog is answered with a 304.
+        """
+        output = request.query_params.get("output", "ndjson")
+        if output not in exports.TEXT_CHUNKS:
+            choices = ", ".join(exports.TEXT_CHUNKS)
+            raise ValidationError({"output": f"Must be one of {choices}."})
+        etag = cache.get_etag(cache.export_cache_key(request))
+        if cache.is_not_modified(request, etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        export = exports.movie_export(include=exports.MOVIE_EXTRAS)
+        response = StreamingHttpResponse(
+            exports.TEXT_CHUNKS[output](export),
+            content_type=EXPORT_CONTENT_TYPES[output],
+        )
+        response["ETag"] = etag
+        response["Content-Disposition"] = f'attachment; filename="movies.{output}"'
+        return response
+
+    @action(detail=False, url_path="facets", pagination_class=None)
+    def facets(self, request):
+        """Movie counts and rating stats per genre of the filtered movies."""
+        return cache.cached_response(
+            request,
+            cache.list_cache_key(request),
+            partial(self.list_facets, request),
+        )
+
+    def list_facets(self, request):
+        queryset = filter_movies(Movie.objects.all(), request.query_params)
+        return Response(queryset.genre_facets())
+
+    @action(detail=False, url_path="cache-stats")
+    def cache_stats(self, request):
+        return Response(cache.get_stats())
+
+    @action(
+        detail=False,
+        url_path="top",
+        serializer_class=MovieRankingSerializer,
+    )
+    def top_rated(self, request):
+        return self.list_ranking(request, TOP_RATED_ORDERING, default_min_votes=50)
+
+    @action(
+        detail=False,
+        url_path="most-rated",
+        serializer_class=MovieRankingSerializer,
+    )
+    def most_rated(self, request):
+        return self.list_ranking(request, MOST_RATED_ORDERING, default_min_votes=1)
+
+    def list_ranking(self, request, ordering, default_min_votes):
+        queryset = get_ranking_queryset(
+            request.query_params, ordering, default_min_votes
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
+
 
 class TagViewSet(viewsets.ModelViewSet):
-    queryset = Tag.objects.all()
+    queryset = Tag.objects.select_related("term").order_by("timestamp", "id")
     serializer_class = TagSerializer
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset.values(*TagSerializer.values_fields))
+        return self.get_paginated_response(
+            TagSerializer.represent_values(page, get_term_texts(page))
+        )
+
+    def perform_update(self, serializer):
+        # A tag moved to another movie changes both of them.
+        movie_id = serializer.instance.movie_id
+        tag = serializer.save()
+        Movie.objects.filter(pk__in={movie_id, tag.movie_id}).refresh_search_vectors()
+        cache.invalidate_movies(movie_id, tag.movie_id)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        Movie.objects.filter(pk=instance.movie_id).refresh_search_vectors()
+        cache.invalidate_movies(instance.movie_id)
+
+
+class RatingViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Rating.objects.order_by("timestamp", "id")
+    serializer_class = RatingSerializer
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="bulk",
+        serializer_class=BulkRatingSerializer,
+    )
+    def bulk(self, request):
+        """Create up to RATINGS_BULK_MAX_ITEMS ratings in one request.
+
+        Every item gets a result in request order. Ratings the user already
+        gave are reported as duplicates, or overwritten with
+        ``?on_conflict=update``.
+        """
+        on_conflict = get_on_conflict(request)
+        items = request.data
+        if not isinstance(items, list):
+            raise ValidationError({"non_field_errors": ["Expected a list of ratings."]})
+        max_items = settings.RATINGS_BULK_MAX_ITEMS
+        if len(items) > max_items:
+            message = f"At most {max_items} ratings per request."
+            raise ValidationError({"non_field_errors": [message]})
+
+        results, rows, positions = [], [], {}
+        now = timezone.now()
+        # A single serializer validates every item, which is several times
+        # faster than binding a new one per item.
+        serializer = self.get_serializer()
+        for index, item in enumerate(items):
+            try:
+                data = serializer.run_validation(item)
+            except ValidationError as exc:
+                results.append(
+                    {"index": index, "status": "invalid", "errors": exc.detail}
+                )
+                continue
+            key = (data["userId"], data["movieId"])
+            if key in positions:
+                message = f"Same user and movie as item {positions[key]}."
+                errors = {"non_field_errors": [message]}
+                results.append({"index": index, "status": "invalid", "errors": errors})
+                continue
+            positions[key] = index
+            results.append({"index": index})
+            rows.append((*key, data["rating"], data.get("timestamp", now)))
+
+        # The catalog checks every movie, one statement writes every rating.
+        # Movies it still holds after their deletion are dropped on retry.
+        movie_ids = catalog.existing_movie_ids(movie for _, movie, _, _ in rows)
+        while True:
+            try:
+                written = ratings.write_ratings(
+                    [row for row in rows if row[1] in movie_ids],
+                    on_conflict=on_conflict,
+                )
+            except ratings.MovieNotFound as exc:
+                movie_ids -= exc.movie_ids
+            else:
+                break
+        for key, index in positions.items():
+            if key[1] not in movie_ids:
+                results[index].update(
+                    status="invalid", errors={"movieId": ["Movie not found."]}
+                )
+        for key, index in positions.items():
+            if key not in written:
+                results[index].setdefault("status", "duplicate")
+                continue
+            pk, created = written[key]
+            results[index].update(id=pk, status="created" if created else "updated")
+
+        summary = dict.fromkeys(("created", "updated", "duplicate", "invalid"), 0)
+        for result in results:
+            summary[result["status"]] += 1
+        return Response({**summary, "results": results})
+
+
+class UserViewSet(viewsets.GenericViewSet):
+    """Per-user views. Users only exist as IDs on their ratings and tags."""
+
+    lookup_field = "user_id"
+    lookup_value_regex = "[0-9]+"
+    export_chunk_size = 2000
+
+    @action(detail=True, url_path="ratings", serializer_class=RatingSerializer)
+    def ratings(self, request, user_id=None):
+        # Served by the (movielens_user_id, timestamp, id) index, which is also
+        # the keyset of the pagination.
+        queryset = Rating.objects.filter(movielens_user_id=user_id).order_by(
+            "timestamp"
+        )
+        return self.list_history(queryset)
+
+    @action(detail=True, url_path="tags", serializer_class=TagSerializer)
+    def tags(self, request, user_id=None):
+        queryset = (
+            Tag.objects.filter(movielens_user_id=user_id)
+            .order_by("timestamp")
+            .values(*TagSerializer.values_fields)
+        )
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(
+            TagSerializer.represent_values(page, get_term_texts(page))
+        )
+
+    def list_history(self, queryset):
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=True,
+        url_path="ratings/export",
+        serializer_class=RatingSerializer,
+        pagination_class=None,
+    )
+    def export_ratings(self, request, user_id=None):
+        """Stream every rating of the user as newline-delimited JSON.
+
+        Rows are read through a server-side cursor and written as they
+        arrive, so the response is never held in memory.
+        """
+        queryset = (
+            Rating.objects.filter(movielens_user_id=user_id)
+            .order_by("timestamp", "id")
+            .values_list("movielens_user_id", "movie_id", "rating", "timestamp")
+        )
+        timestamp_field = serializers.DateTimeField()
+
+        def lines():
+            for user, movie, rating, timestamp in queryset.iterator(
+                chunk_size=self.export_chunk_size
+            ):
+                record = {
+                    "userId": user,
+                    "movieId": movie,
+                    "rating": rating,
+                    "timestamp": timestamp_field.to_representation(timestamp),
+                }
+                yield json.dumps(record) + "\n"
+
+        response = StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+        response["Content-Disposition"] = (
+            f'attachment; filename="user-{user_id}-ratings.ndjson"'
+        )
+        return response
+
+    @action(
+        detail=True,
+        url_path="recommendations",
+        serializer_class=RecommendedMovieSerializer,
+    )
+    def recommendations(self, request, user_id=None):
+        model = get_similarity_model()
+        rated = list(
+            Rating.objects.filter(movielens_user_id=user_id).values_list(
+                "movie_id", "rating"
+            )
+        )
+        if not rated:
+            raise NotFound("No ratings found for this user.")
+        scored = model.recommend(rated, limit=get_limit(request))
+        movies = get_scored_movies(scored, "predicted_rating")
+        return Response(self.get_serializer(movies, many=True).data)
+
+
+def metrics(request):
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4")
+
+
+class JobViewSet(
+    mixins.CreateModelMixin,
+    mixins.ListModelMixin,
+    mixins.RetrieveModelMixin,
+    mixins.DestroyModelMixin,
+    viewsets.GenericViewSet,
+):
+    """Imports, exports and refreshes queued for the ``run_jobs`` workers.
+
+    The commands read and write files on the workers, only staff users can
+    queue them. Deleting a job cancels it while it is still queued.
+    """
+
+    queryset = Job.objects.order_by("-id")
+    serializer_class = JobSerializer
+    permission_classes = [IsAdminUser]
+
+    def perform_destroy(self, instance):
+        # A worker may be claiming the job, the status is checked by the
+        # DELETE itself.
+        deleted, _ = Job.objects.filter(
+            pk=instance.pk, status=JobStatus.QUEUED
+        ).delete()
+        if not deleted:
+            raise JobNotQueued()
@@ -19,6 +19,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "rest_framework",
     "django_extensions",
     "drf_yasg",
@@ -26,6 +27,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "movies.middleware.QueryStatsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -63,12 +65,64 @@ DATABASES = {
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD"),
         "HOST": os.environ.get("POSTGRES_HOST", "localhost"),
         "PORT": 5432,
+        # Persistent connections: each worker thread reuses its connection
+        # for up to CONN_MAX_AGE seconds instead of connecting per request,
+        # and checks it is still usable before reusing it. Set the age to 0
+        # under ASGI, where every request runs its queries on a new thread.
+        "CONN_MAX_AGE": env.int("POSTGRES_CONN_MAX_AGE", default=60),
+        "CONN_HEALTH_CHECKS": env.bool("POSTGRES_CONN_HEALTH_CHECKS", default=True),
+        "OPTIONS": {
+            "connect_timeout": env.int("POSTGRES_CONNECT_TIMEOUT", default=10),
+        },
         "TEST": {
             "NAME": os.environ.get("POSTGRES_TEST_NAME"),
         },
     }
 }
 
+CACHES = {
+    "default": {
+        "BACKEND": env(
+            "DJANGO_CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": env("DJANGO_CACHE_LOCATION", default="movielens"),
+        "TIMEOUT": env.int("DJANGO_CACHE_TIMEOUT", default=300),
+        "OPTIONS": {
+            "MAX_ENTRIES": env.int("DJANGO_CACHE_MAX_ENTRIES", default=10000),
+        },
+    }
+}
+
+# Cached GET responses of MovieViewSet, see movies/cache.py. Invalidation
+# only reaches the processes sharing the backend, LocMemCache is per process.
+MOVIES_CACHE_ALIAS = env("MOVIES_CACHE_ALIAS", default="default")
+MOVIES_CACHE_TIMEOUT = env.int("MOVIES_CACHE_TIMEOUT", default=300)
+
+# Seconds a process keeps its copy of the movie catalog, see
+# movies/catalog.py. Writes reload it at once only in the processes that
+# share the cache backend.
+CATALOG_MAX_AGE = env.int("CATALOG_MAX_AGE", default=60)
+
+# Requests above either budget are logged with their SQL, see
+# movies/middleware.py.
+REQUEST_QUERY_BUDGET = env.int("REQUEST_QUERY_BUDGET", default=20)
+REQUEST_LATENCY_BUDGET_MS = env.int("REQUEST_LATENCY_BUDGET_MS", default=500)
+
+# Largest number of ratings accepted by POST /api/ratings/bulk/.
+RATINGS_BULK_MAX_ITEMS = env.int("RATINGS_BULK_MAX_ITEMS", default=5000)
+
+# Co-rated movies kept per movie by fold_cooccurrence, see
+# movies/cooccurrence.py.
+COOCCURRENCE_TOP_K = env.int("COOCCURRENCE_TOP_K", default=50)
+COOCCURRENCE_SLACK = env.int("COOCCURRENCE_SLACK", default=50)
+
+# Item-item similarity model written by build_similarity_model, see
+# movies/recommendations.py.
+SIMILARITY_MODEL_DIR = env(
+    "SIMILARITY_MODEL_DIR", default=str(BASE_DIR / "models" / "similarity")
+)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -98,8 +152,12 @@ STATIC_URL = "static/"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
+    "DEFAULT_PAGINATION_CLASS": "movies.pagination.KeysetPagination",
     "PAGE_SIZE": 10,
+    "DEFAULT_RENDERER_CLASSES": [
+        "movies.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticatedOrReadOnly",
     ],
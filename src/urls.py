@@ -4,6 +4,8 @@ from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from rest_framework import permissions
 
+from movies.views import metrics
+
 schema_view = get_schema_view(
     openapi.Info(
         title="MovieLens API",
@@ -19,6 +21,7 @@ schema_view = get_schema_view(
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/", include("movies.urls")),
+    path("metrics", metrics, name="metrics"),
     path(
         "docs/",
         schema_view.with_ui("swagger", cache_timeout=0),